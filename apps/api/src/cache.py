@@ -0,0 +1,388 @@
+"""两级读缓存：进程内 LRU（带 TTL）在前，Redis 共享缓存在后。
+
+- 读：本地命中直接返回；否则查 Redis，再否则回源加载，并回填两级缓存；
+- 防击穿：同一进程内同一个 key 同时只有一个回源请求（single-flight），其余请求等待同一个结果；
+  领头请求被取消（如客户端断开）时由一个等待者接手回源，其余等待者不受影响；
+- 失效：写路径调用 ``invalidate``。单个 key 直接删除；整个命名空间（如列表分页）通过递增版本号失效，
+  旧版本的 Redis key 不再被读到，随 TTL 自然过期。失效消息经 Redis pub/sub 广播给其它 API 进程，
+  各进程清掉本地副本；
+- 配置了 Redis 时本地副本的 TTL 另有上限（``cache_local_ttl_s``），即使漏收失效消息，陈旧时间也有界；
+- Redis 不可用时只记录错误并退化为本地缓存 + 回源，不影响请求。
+
+缓存值需可 JSON 序列化；``None`` 也会被缓存（例如尚未评估过的智星没有星等）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Awaitable, Callable, Hashable, Sequence
+from functools import lru_cache
+from typing import Any
+from uuid import uuid4
+
+from config import get_settings
+from redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# 命名空间：写路径按命名空间失效
+STAR = "star"
+STARS = "stars"
+MAGNITUDE = "magnitude"
+TRIALS = "trials"
+SKILLS = "skills"
+SKILL = "skill"
+SKILL_RESULTS = "skill_results"  # 幂等星技的调用结果
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+_MISSING: Any = object()
+
+
+def make_key(*parts: Hashable) -> str:
+    """把查询参数拼成缓存 key（如过滤条件 + 分页参数）。"""
+
+    return json.dumps(parts, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+class LocalLRU:
+    """进程内 LRU，条目各自带过期时间；只在事件循环线程中使用，无需加锁。"""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, namespace: str, key: str) -> Any:
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[(namespace, key)]
+            return _MISSING
+        self._data.move_to_end((namespace, key))
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> int:
+        """写入条目，返回因容量淘汰的条目数。"""
+
+        self._data[(namespace, key)] = (time.monotonic() + ttl, value)
+        self._data.move_to_end((namespace, key))
+        evicted = 0
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._data.pop((namespace, key), None)
+
+    def clear(self, namespace: str | None = None) -> None:
+        if namespace is None:
+            self._data.clear()
+            return
+        for entry in [entry for entry in self._data if entry[0] == namespace]:
+            del self._data[entry]
+
+
+class TwoTierCache:
+    def __init__(self, redis: Any | None, *, max_entries: int, local_ttl: float) -> None:
+        self.redis = redis
+        self.local = LocalLRU(max_entries)
+        self.local_ttl = local_ttl
+        self._instance = uuid4().hex
+        self._versions: dict[str, int] = {}
+        # 每次失效递增；回源期间若发生失效，加载结果不再回填，避免把旧值写回缓存。
+        self._generations: defaultdict[str, int] = defaultdict(int)
+        self._inflight: dict[tuple[str, str], asyncio.Future[Any]] = {}
+        self._stats: defaultdict[str, Counter[str]] = defaultdict(Counter)
+        self._listener: asyncio.Task[None] | None = None
+
+    # ---- 读 ----
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        ttl: float,
+    ) -> Any:
+        while True:
+            value = self.local.get(namespace, key)
+            if value is not _MISSING:
+                self._stats[namespace]["local_hits"] += 1
+                return value
+
+            flight = self._inflight.get((namespace, key))
+            if flight is None:
+                break
+            self._stats[namespace]["coalesced"] += 1
+            value = await self._join(flight)
+            if value is not _MISSING:
+                return value
+            # 领头请求被取消：重新检查缓存，必要时由本请求接手回源
+
+        self._begin_flight(namespace, key)
+        try:
+            generation = self._generations[namespace]
+            found = await self._redis_get_many(namespace, [key])
+            if key in found:
+                value = found[key]
+                self._stats[namespace]["redis_hits"] += 1
+                self._fill_local(namespace, key, value, ttl)
+            else:
+                self._stats[namespace]["misses"] += 1
+                value = await load()
+                if self._generations[namespace] == generation:
+                    self._fill_local(namespace, key, value, ttl)
+                    await self._redis_set_many(namespace, {key: value}, ttl)
+        except BaseException as exc:
+            self._end_flight(namespace, [key], exc=exc)
+            raise
+        self._end_flight(namespace, [key], values={key: value})
+        return value
+
+    async def get_many_or_load(
+        self,
+        namespace: str,
+        keys: Sequence[str],
+        load_many: Callable[[list[str]], Awaitable[dict[str, Any]]],
+        ttl: float,
+    ) -> list[Any]:
+        """批量读取（供 DataLoader 使用）：只为两级缓存都未命中的 key 调用一次 ``load_many``。
+
+        ``load_many`` 返回 ``{key: value}``，缺失的 key 视为 ``None``。
+        """
+
+        results: dict[str, Any] = {}
+        waiting: dict[str, asyncio.Future[Any]] = {}
+        own: list[str] = []
+        for key in dict.fromkeys(keys):
+            value = self.local.get(namespace, key)
+            if value is not _MISSING:
+                self._stats[namespace]["local_hits"] += 1
+                results[key] = value
+            elif (flight := self._inflight.get((namespace, key))) is not None:
+                self._stats[namespace]["coalesced"] += 1
+                waiting[key] = flight
+            else:
+                own.append(key)
+
+        if own:
+            for key in own:
+                self._begin_flight(namespace, key)
+            try:
+                generation = self._generations[namespace]
+                found = await self._redis_get_many(namespace, own)
+                self._stats[namespace]["redis_hits"] += len(found)
+                for key, value in found.items():
+                    self._fill_local(namespace, key, value, ttl)
+                missing = [key for key in own if key not in found]
+                loaded: dict[str, Any] = {}
+                if missing:
+                    self._stats[namespace]["misses"] += len(missing)
+                    loaded = await load_many(missing)
+                    loaded = {key: loaded.get(key) for key in missing}
+                    if self._generations[namespace] == generation:
+                        for key, value in loaded.items():
+                            self._fill_local(namespace, key, value, ttl)
+                        await self._redis_set_many(namespace, loaded, ttl)
+            except BaseException as exc:
+                self._end_flight(namespace, own, exc=exc)
+                raise
+            values = {**found, **loaded}
+            self._end_flight(namespace, own, values=values)
+            results.update(values)
+
+        orphaned = []
+        for key, flight in waiting.items():
+            value = await self._join(flight)
+            if value is _MISSING:
+                orphaned.append(key)
+            else:
+                results[key] = value
+        if orphaned:
+            # 领头请求被取消的 key 由本请求重新走一遍读取流程
+            results.update(zip(orphaned, await self.get_many_or_load(namespace, orphaned, load_many, ttl)))
+        return [results[key] for key in keys]
+
+    async def _join(self, flight: asyncio.Future[Any]) -> Any:
+        """等待其它请求的回源结果。领头请求被取消时返回 ``_MISSING``，而不是把取消传给所有等待者。"""
+
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            task = asyncio.current_task()
+            if flight.cancelled() and task is not None and not task.cancelling():
+                return _MISSING
+            raise
+
+    def _begin_flight(self, namespace: str, key: str) -> asyncio.Future[Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[(namespace, key)] = future
+        return future
+
+    def _end_flight(
+        self,
+        namespace: str,
+        keys: Sequence[str],
+        *,
+        values: dict[str, Any] | None = None,
+        exc: BaseException | None = None,
+    ) -> None:
+        for key in keys:
+            future = self._inflight.pop((namespace, key), None)
+            if future is None or future.done():
+                continue
+            if exc is None:
+                future.set_result(values[key] if values else None)
+            elif isinstance(exc, Exception):
+                future.set_exception(exc)
+                future.exception()  # 没有等待者时也不要报 "exception was never retrieved"
+            else:
+                future.cancel()
+
+    def _fill_local(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        # 有 Redis 时本地副本只保留很短时间：即使漏收失效广播，陈旧时间也不超过 local_ttl。
+        local_ttl = ttl if self.redis is None else min(ttl, self.local_ttl)
+        if evicted := self.local.set(namespace, key, value, local_ttl):
+            self._stats[namespace]["evictions"] += evicted
+
+    # ---- Redis 层 ----
+
+    async def _version(self, namespace: str) -> int:
+        if namespace not in self._versions:
+            self._versions[namespace] = int(await self.redis.get(f"cache:ver:{namespace}") or 0)
+        return self._versions[namespace]
+
+    async def _redis_keys(self, namespace: str, keys: Sequence[str]) -> list[str]:
+        version = await self._version(namespace)
+        return [f"cache:{namespace}:v{version}:{key}" for key in keys]
+
+    async def _redis_get_many(self, namespace: str, keys: Sequence[str]) -> dict[str, Any]:
+        if self.redis is None:
+            return {}
+        try:
+            raw = await self.redis.mget(await self._redis_keys(namespace, keys))
+        except Exception:  # Redis 故障时按未命中处理
+            self._redis_error(namespace)
+            return {}
+        return {key: json.loads(item) for key, item in zip(keys, raw) if item is not None}
+
+    async def _redis_set_many(self, namespace: str, values: dict[str, Any], ttl: float) -> None:
+        if self.redis is None or not values:
+            return
+        try:
+            redis_keys = await self._redis_keys(namespace, list(values))
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for redis_key, value in zip(redis_keys, values.values()):
+                    pipe.set(redis_key, json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+                await pipe.execute()
+        except Exception:
+            self._redis_error(namespace)
+
+    def _redis_error(self, namespace: str) -> None:
+        self._stats[namespace]["redis_errors"] += 1
+        logger.warning("redis cache unavailable for namespace %s", namespace, exc_info=True)
+
+    # ---- 失效 ----
+
+    async def invalidate(self, namespace: str, key: str | None = None) -> None:
+        """在写路径提交之后调用：``key`` 为空时使整个命名空间失效。"""
+
+        self._apply_invalidation(namespace, key)
+        if self.redis is None:
+            return
+        try:
+            version = None
+            if key is None:
+                version = await self.redis.incr(f"cache:ver:{namespace}")
+                self._versions[namespace] = version
+            else:
+                await self.redis.delete(*(await self._redis_keys(namespace, [key])))
+            message = {"origin": self._instance, "namespace": namespace, "key": key, "version": version}
+            await self.redis.publish(INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception:
+            self._redis_error(namespace)
+
+    def _apply_invalidation(self, namespace: str, key: str | None) -> None:
+        if key is None:
+            self.local.clear(namespace)
+        else:
+            self.local.delete(namespace, key)
+        self._generations[namespace] += 1
+        self._stats[namespace]["invalidations"] += 1
+
+    async def start(self) -> None:
+        """启动失效广播的订阅（应用启动时调用）。"""
+
+        if self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # （重新）订阅之前可能漏收了消息：丢弃本地副本与版本号，重新从 Redis 读取。
+                self._versions.clear()
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload["origin"] == self._instance:
+                        continue
+                    namespace = payload["namespace"]
+                    if payload["version"] is not None:
+                        self._versions[namespace] = max(self._versions.get(namespace, 0), payload["version"])
+                    self._apply_invalidation(namespace, payload["key"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("cache invalidation subscriber disconnected, retrying", exc_info=True)
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
+    # ---- 统计 ----
+
+    def stats(self) -> dict[str, Any]:
+        namespaces = {}
+        for namespace, counter in sorted(self._stats.items()):
+            hits = counter["local_hits"] + counter["redis_hits"] + counter["coalesced"]
+            lookups = hits + counter["misses"]
+            namespaces[namespace] = {
+                **dict(counter),
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            }
+        return {
+            "backend": "redis" if self.redis is not None else "local",
+            "local_entries": len(self.local),
+            "local_max_entries": self.local.max_entries,
+            "namespaces": namespaces,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_cache() -> TwoTierCache:
+    settings = get_settings()
+    return TwoTierCache(
+        get_redis(),
+        max_entries=settings.cache_local_max_entries,
+        local_ttl=settings.cache_local_ttl_s,
+    )
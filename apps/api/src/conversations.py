@@ -0,0 +1,200 @@
+"""会话：服务端追加式保存消息，按 token 预算维护上下文窗口，并把较早的轮次滚动折叠进摘要。
+
+每一轮对话的工作量与会话长度无关：
+- 客户端只提交新消息；消息序号（seq）通过一次原子 UPDATE 分配；
+- 提示词上下文 = 摘要 + 尚未折叠的尾部消息。尾部 token 数超过 ``conversation_context_tokens`` 时，
+  把最早的消息折叠进摘要，直到尾部降到预算的一半（留出余量，避免每轮都触发压缩）；
+- 摘要本身不超过 ``conversation_summary_tokens``，超出时丢弃最早的摘要行。
+
+当前摘要为抽取式（每条消息保留开头一段），接入真实模型后可替换 ``summarize``。
+同一会话的多轮对话应串行发送；中途取消的回复不落库，对应 seq 留空。
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import get_settings
+from db import SessionFactory
+from llm import ChatMessage, estimate_tokens
+from models import Conversation, ConversationMessage
+
+
+ROLE_LABELS = {"user": "星主", "assistant": "智星"}
+SUMMARY_CLIP_CHARS = 80
+MIN_TAIL_MESSAGES = 2  # 压缩时至少保留最近的一问一答
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class ConversationClosed(Exception):
+    """会话已关闭，不再接受新消息。"""
+
+
+@dataclass
+class Turn:
+    conversation: Conversation
+    user_seq: int
+    messages: list[ChatMessage]  # 摘要 + 窗口内消息（含本轮用户消息），直接交给 generate_reply
+
+
+def _clip(text: str) -> str:
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text if len(text) <= SUMMARY_CLIP_CHARS else text[:SUMMARY_CLIP_CHARS] + "…"
+
+
+def summarize(previous: str | None, messages: list[ConversationMessage], token_budget: int) -> str:
+    """把一段旧消息并入已有摘要；超出预算时从最早的摘要行开始丢弃。"""
+
+    lines = previous.splitlines() if previous else []
+    lines += [f"{ROLE_LABELS.get(m.role, m.role)}：{_clip(m.content)}" for m in messages]
+    costs = [estimate_tokens(line) for line in lines]
+    total = sum(costs)
+    start = 0
+    while total > token_budget and start < len(lines) - 1:
+        total -= costs[start]
+        start += 1
+    return "\n".join(lines[start:])
+
+
+async def start_turn(session: AsyncSession, conversation_id: UUID, content: str) -> Turn:
+    """写入本轮用户消息并组装上下文。会话不存在时抛出 LookupError，已关闭时抛出 ConversationClosed。"""
+
+    settings = get_settings()
+    conversation = await session.get(Conversation, conversation_id)
+    if conversation is None:
+        raise LookupError(f"conversation {conversation_id} not found")
+    if conversation.status != "active":
+        raise ConversationClosed(f"conversation {conversation_id} is closed")
+
+    tokens = estimate_tokens(content)
+    # 一次分配两个 seq：本轮用户消息与随后的回复
+    allocated = (
+        await session.exec(  # type: ignore[call-overload]
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(message_count=Conversation.message_count + 2, tail_tokens=Conversation.tail_tokens + tokens)
+            .returning(Conversation.message_count, Conversation.summary, Conversation.summary_until_seq),
+        )
+    ).one()
+    message_count, summary, summary_until_seq = allocated
+    user_seq = message_count - 1
+    session.add(
+        ConversationMessage(conversation_id=conversation_id, seq=user_seq, role="user", content=content, tokens=tokens),
+    )
+    await session.commit()
+
+    window = (
+        await session.exec(
+            select(ConversationMessage)
+            .where(
+                ConversationMessage.conversation_id == conversation_id,
+                ConversationMessage.seq > summary_until_seq,
+                ConversationMessage.seq <= user_seq,
+            )
+            .order_by(ConversationMessage.seq.desc())  # type: ignore[attr-defined]
+            .limit(settings.conversation_window_messages),
+        )
+    ).all()
+
+    messages: list[ChatMessage] = []
+    if summary:
+        messages.append(ChatMessage(role="system", content=f"此前对话摘要：\n{summary}"))
+    messages.extend(ChatMessage(role=m.role, content=m.content) for m in reversed(window))
+    return Turn(conversation=conversation, user_seq=user_seq, messages=messages)
+
+
+async def finish_turn(conversation_id: UUID, user_seq: int, reply: str) -> bool:
+    """保存回复；尾部超出预算时顺带压缩。返回本轮是否发生了压缩。
+
+    流式回复结束时请求级会话可能已经释放，因此这里使用独立会话。
+    """
+
+    tokens = estimate_tokens(reply)
+    async with SessionFactory() as session:
+        session.add(
+            ConversationMessage(
+                conversation_id=conversation_id,
+                seq=user_seq + 1,
+                role="assistant",
+                content=reply,
+                tokens=tokens,
+            ),
+        )
+        tail_tokens = (
+            await session.exec(  # type: ignore[call-overload]
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(tail_tokens=Conversation.tail_tokens + tokens)
+                .returning(Conversation.tail_tokens),
+            )
+        ).scalar_one()
+        compacted = False
+        if tail_tokens > get_settings().conversation_context_tokens:
+            compacted = await _compact(session, conversation_id)
+        await session.commit()
+    return compacted
+
+
+async def _compact(session: AsyncSession, conversation_id: UUID) -> bool:
+    settings = get_settings()
+    # PostgreSQL 下行锁保证同一会话的压缩串行执行（SQLite 忽略 FOR UPDATE，写事务本身串行）
+    conversation = (
+        await session.exec(select(Conversation).where(Conversation.id == conversation_id).with_for_update())
+    ).one()
+    if conversation.tail_tokens <= settings.conversation_context_tokens:
+        return False
+
+    tail = (
+        await session.exec(
+            select(ConversationMessage)
+            .where(
+                ConversationMessage.conversation_id == conversation_id,
+                ConversationMessage.seq > conversation.summary_until_seq,
+            )
+            .order_by(ConversationMessage.seq),  # type: ignore[arg-type]
+        )
+    ).all()
+
+    target = settings.conversation_context_tokens // 2
+    remaining = conversation.tail_tokens
+    folded: list[ConversationMessage] = []
+    for message in tail[:-MIN_TAIL_MESSAGES]:
+        if remaining <= target:
+            break
+        folded.append(message)
+        remaining -= message.tokens
+    if not folded:
+        return False
+
+    conversation.summary = summarize(conversation.summary, folded, settings.conversation_summary_tokens)
+    conversation.summary_until_seq = folded[-1].seq
+    conversation.tail_tokens = remaining
+    session.add(conversation)
+    return True
+
+
+async def history(
+    session: AsyncSession,
+    conversation_id: UUID,
+    before: int | None = None,
+    limit: int = 50,
+) -> tuple[Conversation, list[ConversationMessage]]:
+    """按 seq 倒序翻页读取完整消息记录（含已折叠进摘要的消息）。"""
+
+    conversation = await session.get(Conversation, conversation_id)
+    if conversation is None:
+        raise LookupError(f"conversation {conversation_id} not found")
+    statement = select(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id)
+    if before is not None:
+        statement = statement.where(ConversationMessage.seq < before)
+    messages = (
+        await session.exec(statement.order_by(ConversationMessage.seq.desc()).limit(limit))  # type: ignore[attr-defined]
+    ).all()
+    return conversation, list(messages)
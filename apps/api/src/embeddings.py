@@ -0,0 +1,78 @@
+"""向量化（Embedding）抽象层。
+
+- ``Embedder`` 协议：输入一批文本，输出 L2 归一化后的 float32 矩阵；
+- ``HashingEmbedder``：基于字符 n-gram 特征哈希的 CPU 实现，无需下载模型、输出确定，适合本地与 PoC；
+- 通过 ``register_embedder`` 可接入 sentence-transformers、ONNX 等真实模型，由 ``embedder_backend`` 配置选择。
+"""
+
+from __future__ import annotations
+
+import unicodedata
+import zlib
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+
+from config import Settings, get_settings
+
+
+class Embedder(Protocol):
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """返回形状为 ``(len(texts), dim)`` 的 float32 矩阵，每行已 L2 归一化。"""
+        ...
+
+
+class HashingEmbedder:
+    """字符 n-gram 特征哈希：中文按字/词组、英文按子串自然落入同一哈希空间。"""
+
+    def __init__(self, dim: int = 256, ngram_range: tuple[int, int] = (1, 3)) -> None:
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        text = unicodedata.normalize("NFKC", text).casefold()
+        hashes = [
+            zlib.crc32(text[i : i + n].encode("utf-8"))
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1)
+            for i in range(len(text) - n + 1)
+        ]
+        values = np.asarray(hashes, dtype=np.uint32)
+        # 低位决定桶，最高位决定符号，降低哈希碰撞带来的系统性偏差。
+        signs = np.where(values >> 31, -1.0, 1.0).astype(np.float32)
+        return (values % self.dim).astype(np.intp), signs
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            indices, signs = self._features(text)
+            if indices.size:
+                matrix[row] = np.bincount(indices, weights=signs, minlength=self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+_BACKENDS: dict[str, Callable[[Settings], Embedder]] = {
+    "hashing": lambda settings: HashingEmbedder(dim=settings.embedding_dim),
+}
+
+
+def register_embedder(name: str, factory: Callable[[Settings], Embedder]) -> None:
+    """注册新的向量化后端，配置 ``embedder_backend=<name>`` 即可启用。"""
+
+    _BACKENDS[name] = factory
+    get_embedder.cache_clear()
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> Embedder:
+    settings = get_settings()
+    try:
+        factory = _BACKENDS[settings.embedder_backend]
+    except KeyError as exc:
+        raise ValueError(f"unknown embedder backend: {settings.embedder_backend}") from exc
+    return factory(settings)
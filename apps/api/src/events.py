@@ -0,0 +1,247 @@
+"""领域事件：事务性发件箱 + 批量投递到 Redis Stream。
+
+- 写路径调用 ``emit`` 把事件加入当前会话，与业务行同一次 commit 落库；请求路径从不等待消息中间件；
+- ``OutboxRelay`` 按 id 顺序批量读取未投递事件，用非事务 pipeline 一次往返完成整批 XADD，
+  成功后再标记 ``published_at``。两步之间崩溃会导致重复投递，语义为至少一次，消费方按事件 ``id`` 去重；
+- 事件按 ``star_id`` 分片到 ``events_stream[:分片号]``，同一颗智星的事件始终进入同一条 Stream；
+- 多个 API 进程都会启动中继，PostgreSQL 下通过会话级 advisory lock 只让一个进程投递，保证顺序；
+- 已投递事件保留 ``outbox_retention_s`` 后清理。
+
+也可以单独运行中继进程::
+
+    python events.py relay
+    python events.py drain      # 投递积压事件后退出
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import delete, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import metrics
+from config import get_settings
+from db import SessionFactory, engine
+from models import OutboxEvent
+from redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+STAR_CREATED = "STAR_CREATED"
+STAR_MAGNITUDE_CHANGED = "STAR_MAGNITUDE_CHANGED"
+KNOWLEDGE_INGESTED = "KNOWLEDGE_INGESTED"
+
+_ADVISORY_LOCK_KEY = 0x6D79_7374_6172  # "mystar"
+_PURGE_INTERVAL_S = 60.0
+
+
+def emit(session: AsyncSession, event_type: str, star_id: UUID | None, payload: dict[str, Any]) -> OutboxEvent:
+    """把事件加入当前会话（不提交），随调用方的业务事务一起落库。"""
+
+    event = OutboxEvent(
+        event_type=event_type,
+        star_id=star_id,
+        payload=json.dumps(payload, ensure_ascii=False, default=str),
+    )
+    session.add(event)
+    return event
+
+
+def stream_key(star_id: UUID | None) -> str:
+    settings = get_settings()
+    if settings.events_stream_shards <= 1 or star_id is None:
+        return settings.events_stream
+    return f"{settings.events_stream}:{zlib.crc32(star_id.bytes) % settings.events_stream_shards}"
+
+
+class OutboxRelay:
+    def __init__(self, *, batch_size: int, poll_interval: float, maxlen: int, retention: float) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.maxlen = maxlen
+        self.retention = retention
+        self._task: asyncio.Task[None] | None = None
+        self._lock_conn: AsyncConnection | None = None
+        self._last_purge = 0.0
+
+    # ---- 生命周期 ----
+
+    async def start(self) -> None:
+        """在后台启动中继（应用启动时调用）；未配置 Redis 时不启动，事件留在发件箱中。"""
+
+        if get_redis() is not None and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._release()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if not await self._acquire():
+                    await asyncio.sleep(max(self.poll_interval, 1.0))
+                    continue
+                published = await self.drain_once()
+                await self._maybe_purge()
+                if published < self.batch_size:  # 积压清空后再按间隔轮询
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("outbox relay failed, retrying", exc_info=True)
+                await self._release()
+                await asyncio.sleep(max(self.poll_interval, 1.0))
+
+    # ---- 单进程投递（advisory lock） ----
+
+    async def _acquire(self) -> bool:
+        if engine.dialect.name != "postgresql":
+            return True  # SQLite 仅用于本地单进程
+        if self._lock_conn is not None:
+            await self._lock_conn.execute(text("SELECT 1"))  # 锁随连接存在，连接断开即失去投递权
+            return True
+        conn = await engine.connect()
+        try:
+            acquired = (
+                await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+            ).scalar()
+            await conn.commit()  # 会话级锁在提交后仍然保持，不占用长事务
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self._lock_conn = conn
+        return True
+
+    async def _release(self) -> None:
+        if self._lock_conn is None:
+            return
+        conn, self._lock_conn = self._lock_conn, None
+        try:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+            await conn.commit()
+        except Exception:  # 连接已断开时锁已随之释放
+            pass
+        finally:
+            await conn.close()
+
+    # ---- 投递 ----
+
+    async def drain_once(self) -> int:
+        """投递一批未投递事件，返回本批条数。"""
+
+        redis = get_redis()
+        if redis is None:
+            return 0
+        started = time.perf_counter()
+        async with SessionFactory() as session:
+            rows = (
+                await session.exec(
+                    select(
+                        OutboxEvent.id,
+                        OutboxEvent.event_type,
+                        OutboxEvent.star_id,
+                        OutboxEvent.payload,
+                        OutboxEvent.created_at,
+                    )
+                    .where(OutboxEvent.published_at.is_(None))  # type: ignore[union-attr]
+                    .order_by(OutboxEvent.id)  # type: ignore[arg-type]
+                    .limit(self.batch_size),
+                )
+            ).all()
+            if not rows:
+                return 0
+
+            async with redis.pipeline(transaction=False) as pipe:
+                for event_id, event_type, star_id, payload, created_at in rows:
+                    pipe.xadd(
+                        stream_key(star_id),
+                        {
+                            "id": event_id,
+                            "type": event_type,
+                            "star_id": str(star_id) if star_id else "",
+                            "payload": payload,
+                            "created_at": created_at.isoformat(),
+                        },
+                        maxlen=self.maxlen,
+                        approximate=True,
+                    )
+                await pipe.execute()
+
+            await session.exec(  # type: ignore[call-overload]
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_([row[0] for row in rows]))  # type: ignore[union-attr]
+                .values(published_at=datetime.utcnow()),
+            )
+            await session.commit()
+
+        metrics.OUTBOX_PUBLISHED.inc(len(rows))
+        metrics.OUTBOX_BATCH_SECONDS.observe(time.perf_counter() - started)
+        return len(rows)
+
+    async def drain(self) -> int:
+        """持续投递直到发件箱清空，返回总条数。"""
+
+        total = 0
+        while published := await self.drain_once():
+            total += published
+        return total
+
+    async def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < _PURGE_INTERVAL_S:
+            return
+        self._last_purge = now
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        async with SessionFactory() as session:
+            await session.exec(delete(OutboxEvent).where(OutboxEvent.published_at < cutoff))  # type: ignore[call-overload, operator]
+            await session.commit()
+
+
+@lru_cache(maxsize=1)
+def get_relay() -> OutboxRelay:
+    settings = get_settings()
+    return OutboxRelay(
+        batch_size=settings.outbox_batch_size,
+        poll_interval=settings.outbox_poll_interval_s,
+        maxlen=settings.events_stream_maxlen,
+        retention=settings.outbox_retention_s,
+    )
+
+
+async def _main(command: str) -> None:
+    relay = get_relay()
+    try:
+        if command == "drain":
+            if not await relay._acquire():
+                raise SystemExit("another relay is publishing; nothing to do")
+            print(f"published {await relay.drain()} events")
+        else:
+            await relay.run()
+    finally:
+        await relay.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="发件箱事件中继")
+    parser.add_argument("command", choices=["relay", "drain"])
+    asyncio.run(_main(parser.parse_args().command))
@@ -0,0 +1,425 @@
+"""推理调度：在 LLM 后端前把并发的对话请求合并为微批次，并做连续批处理（continuous batching）。
+
+- 请求按智星分队列，组批时在各智星之间轮转取请求，单颗热门智星不会挤占其它智星的名额；
+- 空闲时攒批：等到凑满 ``max_batch_size`` 或最早的请求已等待 ``max_wait_ms`` 再开始；
+- 解码过程中，每一步结束都会移出已完成/已取消的序列并补入新请求，批次始终尽量满载；
+- 每个请求的 token 经各自的有界队列流式送回，完整结果同时写入请求自己的 future；
+  某个流式请求的队列已满（客户端读得慢）时，该序列暂停解码、留在批次中，其余序列照常推进。
+
+后端通过 ``InferenceBackend`` 协议接入（prefill + 逐步 decode）；``FakeBackend`` 是确定性的 CPU 假后端，
+可设置模拟的单步耗时，用于离线压测吞吐：``python inference.py bench``。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import random
+import re
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Protocol
+from uuid import UUID, uuid4
+
+from config import get_settings
+
+
+# 占位模型的“分词”规则：英文单词/数字作为一个 token，其余字符（含中文）逐字切分。
+TOKEN_PATTERN = re.compile(r"\s+|[A-Za-z0-9_]+|.", re.DOTALL)
+
+
+class SchedulerOverloaded(RuntimeError):
+    """排队请求已达上限。"""
+
+
+@dataclass
+class GenerationRequest:
+    prompt: str
+    max_new_tokens: int = 512
+    # 预设输出：占位/假后端逐 token 回放这段文本（PoC 与离线压测用），真实后端忽略。
+    scripted: str | None = None
+
+
+class InferenceBackend(Protocol):
+    def prefill(self, requests: list[GenerationRequest]) -> list[Any]:
+        """批量处理一组新请求的提示词，返回每条序列的解码状态。"""
+        ...
+
+    def decode_step(self, states: list[Any]) -> list[str | None]:
+        """对当前批次的所有序列各解码一个 token；返回 None 表示该序列已结束。"""
+        ...
+
+
+@dataclass
+class _FakeState:
+    tokens: list[str]
+    position: int = 0
+
+
+class FakeBackend:
+    """确定性的 CPU 假后端。
+
+    有 ``scripted`` 时按原文回放，否则以提示词的 CRC32 为种子生成固定的 token 序列；
+    ``step_ms`` / ``prefill_ms`` 模拟一次前向的固定开销（与批大小无关，体现批处理的收益），
+    ``per_sequence_ms`` 模拟随批大小线性增长的部分。
+    """
+
+    _VOCAB = ("星", "尘", "光", "域", "智", "的", "是", "在", "了", "，", "。", " star", " dust", " light")
+
+    def __init__(self, step_ms: float = 0.0, prefill_ms: float = 0.0, per_sequence_ms: float = 0.0) -> None:
+        self.step_ms = step_ms
+        self.prefill_ms = prefill_ms
+        self.per_sequence_ms = per_sequence_ms
+
+    def _simulate(self, fixed_ms: float, batch_size: int) -> None:
+        cost = fixed_ms + self.per_sequence_ms * batch_size
+        if cost > 0:
+            time.sleep(cost / 1000)
+
+    def prefill(self, requests: list[GenerationRequest]) -> list[Any]:
+        self._simulate(self.prefill_ms, len(requests))
+        states = []
+        for request in requests:
+            if request.scripted is not None:
+                tokens = [m.group(0) for m in TOKEN_PATTERN.finditer(request.scripted)]
+            else:
+                rng = random.Random(zlib.crc32(request.prompt.encode()))
+                tokens = [rng.choice(self._VOCAB) for _ in range(request.max_new_tokens)]
+            states.append(_FakeState(tokens=tokens[: request.max_new_tokens]))
+        return states
+
+    def decode_step(self, states: list[Any]) -> list[str | None]:
+        self._simulate(self.step_ms, len(states))
+        out: list[str | None] = []
+        for state in states:
+            if state.position >= len(state.tokens):
+                out.append(None)
+            else:
+                out.append(state.tokens[state.position])
+                state.position += 1
+        return out
+
+
+_BACKENDS: dict[str, Any] = {
+    "placeholder": lambda settings: FakeBackend(),
+    "fake": lambda settings: FakeBackend(
+        step_ms=settings.inference_fake_step_ms,
+        prefill_ms=settings.inference_fake_prefill_ms,
+        per_sequence_ms=settings.inference_fake_per_sequence_ms,
+    ),
+}
+
+
+def register_backend(name: str, factory: Any) -> None:
+    """注册新的推理后端（如 vLLM / llama.cpp），``factory(settings)`` 返回 InferenceBackend。"""
+
+    _BACKENDS[name] = factory
+
+
+_DONE = object()
+
+
+@dataclass(eq=False)
+class _Sequence:
+    star_id: UUID
+    request: GenerationRequest
+    future: asyncio.Future[str]
+    tokens: asyncio.Queue[Any] | None
+    arrived_at: float
+    state: Any = None
+    output: list[str] = field(default_factory=list)
+    cancelled: bool = False
+
+    @property
+    def paused(self) -> bool:
+        """流式消费者尚未取走缓冲的 token，本步不为它解码。"""
+
+        return self.tokens is not None and self.tokens.qsize() >= self.tokens.maxsize - 1
+
+    def emit(self, token: str) -> None:
+        self.output.append(token)
+        if self.tokens is not None:
+            self.tokens.put_nowait(token)
+
+    def finish(self, exc: BaseException | None = None) -> None:
+        if self.future.done():
+            return
+        if exc is None:
+            self.future.set_result("".join(self.output))
+        else:
+            self.future.set_exception(exc)
+            self.future.exception()  # 流式调用方从 token 队列取异常，这里避免 "never retrieved" 告警
+        if self.tokens is not None:
+            self.tokens.put_nowait(_DONE if exc is None else exc)
+
+
+class InferenceScheduler:
+    def __init__(
+        self,
+        backend: InferenceBackend,
+        *,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_queue: int = 1024,
+        stream_buffer: int = 64,
+    ) -> None:
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.stream_buffer = stream_buffer
+        self._pending: OrderedDict[UUID, deque[_Sequence]] = OrderedDict()
+        self._pending_count = 0
+        self._running: list[_Sequence] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._stats: Counter[str] = Counter()
+
+    # ---- 调用方接口 ----
+
+    def submit(self, star_id: UUID, request: GenerationRequest, *, stream: bool = False) -> _Sequence:
+        self._ensure_running()
+        if self._pending_count >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise SchedulerOverloaded(f"inference queue is full ({self.max_queue})")
+        loop = asyncio.get_running_loop()
+        sequence = _Sequence(
+            star_id=star_id,
+            request=request,
+            future=loop.create_future(),
+            # 多留一格给结束标记（_DONE / 异常），finish 时队列不会已满
+            tokens=asyncio.Queue(maxsize=self.stream_buffer + 1) if stream else None,
+            arrived_at=loop.time(),
+        )
+        self._pending.setdefault(star_id, deque()).append(sequence)
+        self._pending_count += 1
+        self._stats["submitted"] += 1
+        self._wakeup.set()  # type: ignore[union-attr]
+        return sequence
+
+    async def stream(self, star_id: UUID, request: GenerationRequest) -> AsyncIterator[str]:
+        """逐 token 产出结果；调用方停止迭代即取消该请求，调度器在下一步把它移出批次。"""
+
+        sequence = self.submit(star_id, request, stream=True)
+        try:
+            while True:
+                paused = sequence.paused
+                item = await sequence.tokens.get()  # type: ignore[union-attr]
+                if paused:
+                    # 腾出了缓冲：唤醒可能因所有序列都暂停而挂起的调度循环
+                    self._wakeup.set()  # type: ignore[union-attr]
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            sequence.cancelled = True
+            self._wakeup.set()  # type: ignore[union-attr]
+
+    async def complete(self, star_id: UUID, request: GenerationRequest) -> str:
+        sequence = self.submit(star_id, request)
+        try:
+            return await sequence.future
+        finally:
+            sequence.cancelled = True
+
+    def stats(self) -> dict[str, Any]:
+        steps = self._stats["decode_steps"]
+        return {
+            **dict(self._stats),
+            "pending": self._pending_count,
+            "running": len(self._running),
+            "avg_batch_size": round(self._stats["decoded_tokens"] / steps, 2) if steps else None,
+        }
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        error = SchedulerOverloaded("inference scheduler is shutting down")
+        for sequence in itertools.chain(self._running, *self._pending.values()):
+            sequence.finish(error)
+        self._running.clear()
+        self._pending.clear()
+        self._pending_count = 0
+
+    # ---- 调度循环 ----
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        # 首次使用或事件循环已更换（如测试中多次启动应用）：在当前循环上重建调度任务
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._running.clear()
+        self._pending.clear()
+        self._pending_count = 0
+        self._task = loop.create_task(self._run())
+
+    def _oldest_arrival(self) -> float:
+        return min(queue[0].arrived_at for queue in self._pending.values())
+
+    def _admit(self, slots: int) -> list[_Sequence]:
+        """在各智星队列之间轮转取请求，每轮每颗智星最多一个。"""
+
+        admitted: list[_Sequence] = []
+        while slots > 0 and self._pending:
+            for star_id in list(self._pending):
+                queue = self._pending[star_id]
+                sequence = queue.popleft()
+                self._pending_count -= 1
+                if not queue:
+                    del self._pending[star_id]
+                else:
+                    self._pending.move_to_end(star_id)
+                if sequence.cancelled:
+                    sequence.finish()
+                    continue
+                admitted.append(sequence)
+                slots -= 1
+                if slots == 0:
+                    break
+        return admitted
+
+    async def _wait_for_batch(self) -> None:
+        assert self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        while not self._pending_count:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        deadline = self._oldest_arrival() + self.max_wait
+        while self._pending_count < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except TimeoutError:
+                break
+
+    async def _run(self) -> None:
+        while True:
+            if not self._running:
+                await self._wait_for_batch()
+
+            admitted = self._admit(self.max_batch_size - len(self._running))
+            if admitted:
+                try:
+                    states = await asyncio.to_thread(self.backend.prefill, [s.request for s in admitted])
+                except Exception as exc:  # 失败只影响本次补入的请求
+                    for sequence in admitted:
+                        sequence.finish(exc)
+                    admitted = []
+                else:
+                    for sequence, state in zip(admitted, states):
+                        sequence.state = state
+                    self._stats["prefill_batches"] += 1
+                    self._stats["prefilled"] += len(admitted)
+            self._running.extend(admitted)
+            if not self._running:
+                continue
+
+            batch = [s for s in self._running if s.cancelled or not s.paused]
+            paused = [s for s in self._running if not s.cancelled and s.paused]
+            if not batch:
+                # 所有序列都在等客户端读取：挂起到有消费者取走 token 或有新请求到达
+                self._wakeup.clear()  # type: ignore[union-attr]
+                await self._wakeup.wait()  # type: ignore[union-attr]
+                continue
+            try:
+                tokens = await asyncio.to_thread(self.backend.decode_step, [s.state for s in batch])
+            except Exception as exc:
+                for sequence in batch:
+                    sequence.finish(exc)
+                self._running = paused
+                continue
+            self._stats["decode_steps"] += 1
+            self._stats["decoded_tokens"] += len(batch)
+
+            still_running = paused
+            for sequence, token in zip(batch, tokens):
+                if sequence.cancelled:
+                    self._stats["cancelled"] += 1
+                    sequence.finish()
+                    continue
+                if token is not None:
+                    sequence.emit(token)
+                if token is None or len(sequence.output) >= sequence.request.max_new_tokens:
+                    self._stats["completed"] += 1
+                    sequence.finish()
+                else:
+                    still_running.append(sequence)
+            self._running = still_running
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> InferenceScheduler:
+    settings = get_settings()
+    factory = _BACKENDS.get(settings.inference_backend)
+    if factory is None:
+        raise ValueError(f"unknown inference backend: {settings.inference_backend}")
+    return InferenceScheduler(
+        factory(settings),
+        max_batch_size=settings.inference_max_batch_size,
+        max_wait_ms=settings.inference_max_wait_ms,
+        max_queue=settings.inference_max_queue,
+        stream_buffer=settings.inference_stream_buffer,
+    )
+
+
+async def _bench(args: argparse.Namespace) -> None:
+    backend = FakeBackend(step_ms=args.step_ms, prefill_ms=args.prefill_ms, per_sequence_ms=args.per_sequence_ms)
+    scheduler = InferenceScheduler(backend, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+    stars = [uuid4() for _ in range(args.stars)]
+    latencies: list[float] = []
+
+    async def one(i: int) -> int:
+        started = time.perf_counter()
+        text = await scheduler.complete(
+            stars[i % len(stars)], GenerationRequest(prompt=f"bench {i}", max_new_tokens=args.tokens),
+        )
+        latencies.append(time.perf_counter() - started)
+        return len(text)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await scheduler.close()
+
+    latencies.sort()
+    stats = scheduler.stats()
+    print(f"requests={args.requests} elapsed={elapsed:.3f}s")
+    print(f"throughput={args.requests * args.tokens / elapsed:.1f} tokens/s avg_batch={stats['avg_batch_size']}")
+    print(f"latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar inference scheduler tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    bench = sub.add_parser("bench", help="用 FakeBackend 离线压测调度器吞吐")
+    bench.add_argument("--requests", type=int, default=256)
+    bench.add_argument("--stars", type=int, default=16)
+    bench.add_argument("--tokens", type=int, default=64)
+    bench.add_argument("--max-batch", type=int, default=16)
+    bench.add_argument("--max-wait-ms", type=float, default=5.0)
+    bench.add_argument("--step-ms", type=float, default=2.0)
+    bench.add_argument("--prefill-ms", type=float, default=5.0)
+    bench.add_argument("--per-sequence-ms", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        asyncio.run(_bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""星尘（知识）入库流水线：流式读取 -> 切块 -> 批量向量化 -> 写入智星索引。
+
+任务状态流转：``pending`` -> ``processing`` -> ``completed`` / ``failed``，
+``chunk_count`` / ``embedding_index`` / ``error`` 在任务结束时回写到 ``knowledge_tasks``。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import codecs
+import logging
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import get_settings
+from db import SessionFactory
+from embeddings import get_embedder
+from events import KNOWLEDGE_INGESTED, emit
+from models import KnowledgeTask
+from object_store import check_payload_uri, get_object_store
+from reply_cache import get_reply_cache
+from vector_index import open_index
+
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_payload(uri: str) -> AsyncIterator[str]:
+    """按块流式读取原文，按 UTF-8 增量解码，不把整份文件读入内存。
+
+    只读取 ``knowledge-raw`` 桶中由上传接口写入的对象（见 ``check_payload_uri``）；
+    接口层已校验过，这里再校验一次，防止历史任务或其他入口写入的地址绕过检查。
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for block in get_object_store().open_stream(*check_payload_uri(uri)):
+        yield decoder.decode(block)
+    if tail := decoder.decode(b"", final=True):
+        yield tail
+
+
+async def _iter_text(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+async def iter_chunks(blocks: AsyncIterator[str], size: int, overlap: int) -> AsyncIterator[str]:
+    """把文本流切成定长、首尾重叠的块；内存占用只与块大小有关。"""
+
+    step = max(1, size - overlap)
+    buffer = ""
+    async for block in blocks:
+        buffer += block
+        start = 0
+        while len(buffer) - start >= size:
+            chunk = buffer[start : start + size].strip()
+            if chunk:
+                yield chunk
+            start += step
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def _index_payload(task: KnowledgeTask, content: str | None) -> int:
+    settings = get_settings()
+    if content is not None:
+        blocks = _iter_text(content)
+    elif task.payload_uri:
+        blocks = iter_payload(task.payload_uri)
+    else:
+        return 0
+
+    embedder = get_embedder()
+    index = open_index(task.star_id)
+    chunk_count = 0
+    batch: list[str] = []
+
+    async def flush() -> None:
+        nonlocal chunk_count
+        # 向量化与落盘都是 CPU/IO 密集操作，放到线程池中避免阻塞事件循环。
+        vectors = await asyncio.to_thread(embedder.embed, batch)
+        metadata = [
+            {"task_id": str(task.id), "chunk_index": chunk_count + i, "text": text}
+            for i, text in enumerate(batch)
+        ]
+        await asyncio.to_thread(index.add, vectors, metadata)
+        chunk_count += len(batch)
+        batch.clear()
+
+    async for chunk in iter_chunks(blocks, settings.ingest_chunk_chars, settings.ingest_chunk_overlap):
+        batch.append(chunk)
+        if len(batch) >= settings.ingest_embed_batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return chunk_count
+
+
+async def run_ingestion(task_id: UUID, content: str | None = None) -> None:
+    """后台任务入口：处理单个 knowledge_task，任何异常都记录到任务上而不是抛给调用方。"""
+
+    async with SessionFactory() as session:
+        task = await session.get(KnowledgeTask, task_id)
+        if task is None:
+            logger.warning("knowledge task %s disappeared before ingestion", task_id)
+            return
+
+        task.status = "processing"
+        await session.commit()
+
+        try:
+            chunk_count = await _index_payload(task, content)
+        except Exception as exc:  # 失败原因需要完整落库
+            logger.exception("knowledge task %s failed", task_id)
+            task.status = "failed"
+            task.error = f"{type(exc).__name__}: {exc}"[:2000]
+        else:
+            task.status = "completed"
+            task.chunk_count = chunk_count
+            task.embedding_index = open_index(task.star_id).name
+            # 新星尘会改变检索上下文，之前缓存的回复不再可信
+            get_reply_cache().invalidate_star(task.star_id)
+        task.completed_at = datetime.utcnow()
+        if task.status == "completed":
+            emit(
+                session,
+                KNOWLEDGE_INGESTED,
+                task.star_id,
+                {
+                    "task_id": task.id,
+                    "star_id": task.star_id,
+                    "source_type": task.source_type,
+                    "payload_uri": task.payload_uri,
+                    "content_hash": task.content_hash,
+                    "chunk_count": task.chunk_count,
+                    "embedding_index": task.embedding_index,
+                },
+            )
+        await session.commit()
+
+
+@dataclass
+class IngestItem:
+    star_id: UUID
+    source_type: str = "upload"
+    payload_uri: str | None = None
+    content: str | None = None
+
+
+async def create_tasks(session: AsyncSession, items: Sequence[IngestItem]) -> list[UUID]:
+    """批量创建 pending 任务：一条多行 INSERT（按驱动分页）+ 一次提交，而不是逐条 add/commit。"""
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": uuid4(),
+            "star_id": item.star_id,
+            "source_type": item.source_type,
+            "payload_uri": item.payload_uri,
+            "status": "pending",
+            "chunk_count": 0,
+            "created_at": now,
+        }
+        for item in items
+    ]
+    if rows:
+        await session.exec(insert(KnowledgeTask), params=rows)  # type: ignore[call-overload]
+        await session.commit()
+    return [row["id"] for row in rows]
+
+
+async def run_ingestion_batch(jobs: Sequence[tuple[UUID, str | None]]) -> None:
+    """后台处理一整批任务，并发度受 ``ingest_concurrency`` 限制。"""
+
+    pending = iter(jobs)
+
+    async def worker() -> None:
+        # 多个 worker 共享同一个迭代器，各自取下一条任务，避免为整批任务一次性创建协程。
+        for task_id, content in pending:
+            await run_ingestion(task_id, content)
+
+    concurrency = min(get_settings().ingest_concurrency, len(jobs))
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
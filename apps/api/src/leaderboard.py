@@ -0,0 +1,385 @@
+"""星等排行榜：全站 / 星域 × 时间窗口（全部、近 30 天、近 7 天、近 1 天）。
+
+数据结构：
+- ``star_latest_magnitude``：每颗智星最新一次评估结果，评估写路径在同一事务内增量 upsert；
+- Redis 有序集合 ``leaderboard:<scope>:<window>``（scope 为 ``global`` 或 ``domain:<星域>``），
+  score 为 overall，取前 N 名与查询名次都是 O(log n)；
+- 限时窗口另有 ``...:exp`` 有序集合记录每颗智星的评估时间，读取前用 Lua 脚本摘除窗口外的成员（摊还 O(log n)）。
+
+未配置 Redis、Redis 故障或镜像尚未完整建立时直接查询 ``star_latest_magnitude``（走复合索引）。
+``python leaderboard.py rebuild`` 从 ``magnitude_history`` 重建表与 Redis 镜像，完成后写入
+``leaderboard-built`` 标记；Redis 被清空或重启丢数据后标记随之消失，读路径回退到数据库，直到再次 rebuild。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import and_, delete, func, insert, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import SessionFactory
+from events import STAR_MAGNITUDE_CHANGED, emit
+from models import MagnitudeHistory, Star, StarLatestMagnitude
+from redis_client import get_redis
+from timeline import upsert_rollups
+
+
+logger = logging.getLogger(__name__)
+
+WINDOWS: dict[str, timedelta | None] = {
+    "all": None,
+    "30d": timedelta(days=30),
+    "7d": timedelta(days=7),
+    "1d": timedelta(days=1),
+}
+
+KEY_PREFIX = "leaderboard"
+REBUILD_PREFIX = "leaderboard-rebuild"
+BUILT_KEY = "leaderboard-built"
+REBUILD_BATCH_SIZE = 1000
+
+# 摘除窗口外成员；分批 ZREM，避免 unpack 参数过多。
+_TRIM_SCRIPT = """
+local removed = 0
+while true do
+  local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. ARGV[1], 'LIMIT', 0, 500)
+  if #expired == 0 then
+    return removed
+  end
+  redis.call('ZREM', KEYS[1], unpack(expired))
+  redis.call('ZREM', KEYS[2], unpack(expired))
+  removed = removed + #expired
+end
+"""
+
+
+@dataclass
+class LeaderboardEntry:
+    rank: int
+    star_id: UUID
+    name: str
+    domain: str
+    overall: float
+    level: str
+    evaluated_at: datetime
+
+
+@dataclass
+class StarRank:
+    star_id: UUID
+    rank: int | None  # 不在该榜单（未评估、星域不符或超出时间窗口）时为 None
+    overall: float | None
+    total: int
+
+
+def _scope(domain: str | None) -> str:
+    return f"domain:{domain}" if domain else "global"
+
+
+def _key(scope: str, window: str, prefix: str = KEY_PREFIX) -> str:
+    return f"{prefix}:{scope}:{window}"
+
+
+def _timestamp(value: datetime) -> float:
+    # 库中时间统一为 naive UTC
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _cutoff(window: str, now: datetime) -> datetime | None:
+    span = WINDOWS[window]
+    return now - span if span else None
+
+
+def _mirror(pipe: Any, row: StarLatestMagnitude, now: datetime, prefix: str = KEY_PREFIX) -> None:
+    """把一条最新星等写入它所属的全部榜单集合（全站 + 所在星域，各个时间窗口）。"""
+
+    member = str(row.star_id)
+    evaluated_ts = _timestamp(row.evaluated_at)
+    for scope in (_scope(None), _scope(row.domain)):
+        for window in WINDOWS:
+            cutoff = _cutoff(window, now)
+            if cutoff and row.evaluated_at < cutoff:
+                continue
+            pipe.zadd(_key(scope, window, prefix), {member: row.overall})
+            if cutoff:
+                pipe.zadd(_key(scope, window, prefix) + ":exp", {member: evaluated_ts})
+
+
+def _upsert(dialect: str, rows: list[dict[str, Any]]) -> Any:
+    module = postgresql if dialect == "postgresql" else sqlite
+    statement = module.insert(StarLatestMagnitude).values(rows)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[StarLatestMagnitude.star_id],
+        set_={"overall": excluded.overall, "level": excluded.level, "evaluated_at": excluded.evaluated_at},
+        # 乱序到达的旧评估不覆盖新结果
+        where=StarLatestMagnitude.evaluated_at <= excluded.evaluated_at,
+    ).returning(StarLatestMagnitude.star_id)
+
+
+async def record_magnitude(session: AsyncSession, record: MagnitudeHistory) -> None:
+    """写入一条评估历史，并在同一事务内 upsert 该星的最新星等；提交后同步到 Redis 榜单。
+
+    智星不存在时抛出 LookupError。
+    """
+
+    await record_magnitudes(session, [record])
+
+
+async def record_magnitudes(session: AsyncSession, records: Sequence[MagnitudeHistory]) -> None:
+    """批量版 ``record_magnitude``：历史一次 executemany 插入，最新星等与时间线汇总各一条多行 upsert，Redis 一次 pipeline。
+
+    任一智星不存在时抛出 LookupError，整批都不写入。
+    """
+
+    if not records:
+        return
+    star_ids = {record.star_id for record in records}
+    domains = dict(
+        (await session.exec(select(Star.id, Star.domain).where(Star.id.in_(star_ids)))).all(),  # type: ignore[attr-defined]
+    )
+    if missing := star_ids - domains.keys():
+        raise LookupError(f"star {next(iter(missing))} not found")
+
+    # 同一批内同一颗星出现多次时只 upsert 最新的一条（多行 upsert 不能两次更新同一行）
+    latest: dict[UUID, StarLatestMagnitude] = {}
+    for record in records:
+        current = latest.get(record.star_id)
+        if current is None or record.evaluated_at >= current.evaluated_at:
+            latest[record.star_id] = StarLatestMagnitude(
+                star_id=record.star_id,
+                domain=domains[record.star_id],
+                overall=record.overall,
+                level=record.level,
+                evaluated_at=record.evaluated_at,
+            )
+
+    await session.exec(insert(MagnitudeHistory), params=[record.model_dump() for record in records])  # type: ignore[call-overload]
+    await upsert_rollups(session, records)
+    dialect = session.bind.dialect.name  # type: ignore[union-attr]
+    rows = [row.model_dump() for row in latest.values()]
+    applied = {row[0] for row in (await session.exec(_upsert(dialect, rows))).all()}  # type: ignore[call-overload]
+    for star_id in applied:
+        emit(session, STAR_MAGNITUDE_CHANGED, star_id, latest[star_id].model_dump())
+    await session.commit()
+
+    redis = get_redis()
+    if not applied or redis is None:
+        return
+    try:
+        now = datetime.utcnow()
+        async with redis.pipeline(transaction=True) as pipe:
+            for star_id in applied:
+                _mirror(pipe, latest[star_id], now)
+            await pipe.execute()
+    except Exception:  # 镜像失败不影响评估结果，执行 rebuild 即可恢复
+        logger.warning("failed to mirror magnitudes of %d stars to redis", len(applied), exc_info=True)
+
+
+def _filtered(statement: Any, domain: str | None, cutoff: datetime | None) -> Any:
+    if domain:
+        statement = statement.where(StarLatestMagnitude.domain == domain)
+    if cutoff:
+        statement = statement.where(StarLatestMagnitude.evaluated_at >= cutoff)
+    return statement
+
+
+async def _trim(redis: Any, key: str, cutoff: datetime) -> None:
+    await redis.eval(_TRIM_SCRIPT, 2, key, key + ":exp", repr(_timestamp(cutoff)))
+
+
+async def _live_key(redis: Any, domain: str | None, window: str, cutoff: datetime | None) -> str | None:
+    """返回可直接读取的榜单 key（限时窗口先摘除过期成员）；镜像尚未建立时返回 None，由调用方查库。
+
+    只看榜单 key 是否存在不够：Redis 清空后新的评估只会镜像那几颗星，榜单 key 存在却不完整。
+    """
+
+    if not await redis.exists(BUILT_KEY):
+        return None
+    key = _key(_scope(domain), window)
+    if cutoff:
+        await _trim(redis, key, cutoff)
+    return key
+
+
+async def top(
+    session: AsyncSession,
+    domain: str | None = None,
+    window: str = "all",
+    limit: int = 50,
+    offset: int = 0,
+) -> list[LeaderboardEntry]:
+    """按 overall 倒序取榜单的一段（同分按 star_id 倒序）。"""
+
+    cutoff = _cutoff(window, datetime.utcnow())
+    redis = get_redis()
+    if redis is not None:
+        try:
+            key = await _live_key(redis, domain, window, cutoff)
+            members = None if key is None else await redis.zrevrange(key, offset, offset + limit - 1)
+        except Exception:
+            logger.warning("redis leaderboard unavailable, falling back to database", exc_info=True)
+            members = None
+        if members is not None:
+            ids = [UUID(member) for member in members]
+            rows = (
+                await session.exec(
+                    select(StarLatestMagnitude, Star.name)
+                    .join(Star, Star.id == StarLatestMagnitude.star_id)  # type: ignore[arg-type]
+                    .where(StarLatestMagnitude.star_id.in_(ids)),  # type: ignore[attr-defined]
+                )
+            ).all()
+            by_id = {row.star_id: (row, name) for row, name in rows}
+            ranked = [by_id[star_id] for star_id in ids if star_id in by_id]
+            return [_entry(offset + i, row, name) for i, (row, name) in enumerate(ranked, start=1)]
+
+    statement = _filtered(
+        select(StarLatestMagnitude, Star.name).join(Star, Star.id == StarLatestMagnitude.star_id),  # type: ignore[arg-type]
+        domain,
+        cutoff,
+    )
+    statement = statement.order_by(
+        StarLatestMagnitude.overall.desc(),  # type: ignore[attr-defined]
+        StarLatestMagnitude.star_id.desc(),  # type: ignore[attr-defined]
+    ).offset(offset).limit(limit)
+    rows = (await session.exec(statement)).all()
+    return [_entry(offset + i, row, name) for i, (row, name) in enumerate(rows, start=1)]
+
+
+def _entry(rank: int, row: StarLatestMagnitude, name: str) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        rank=rank,
+        star_id=row.star_id,
+        name=name,
+        domain=row.domain,
+        overall=row.overall,
+        level=row.level,
+        evaluated_at=row.evaluated_at,
+    )
+
+
+async def rank_of(session: AsyncSession, star_id: UUID, domain: str | None = None, window: str = "all") -> StarRank:
+    """查询单颗智星在某个榜单中的名次（从 1 开始）。"""
+
+    cutoff = _cutoff(window, datetime.utcnow())
+    redis = get_redis()
+    if redis is not None:
+        try:
+            key = await _live_key(redis, domain, window, cutoff)
+            if key is not None:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.zrevrank(key, str(star_id))
+                    pipe.zscore(key, str(star_id))
+                    pipe.zcard(key)
+                    rank, score, total = await pipe.execute()
+        except Exception:
+            logger.warning("redis leaderboard unavailable, falling back to database", exc_info=True)
+            key = None
+        if key is not None:
+            return StarRank(star_id=star_id, rank=None if rank is None else rank + 1, overall=score, total=total)
+
+    total = (await session.exec(_filtered(select(func.count()).select_from(StarLatestMagnitude), domain, cutoff))).one()
+    latest = await session.get(StarLatestMagnitude, star_id)
+    if latest is None or (domain and latest.domain != domain) or (cutoff and latest.evaluated_at < cutoff):
+        return StarRank(star_id=star_id, rank=None, overall=None, total=total)
+    ahead = (
+        await session.exec(
+            _filtered(select(func.count()).select_from(StarLatestMagnitude), domain, cutoff).where(
+                or_(
+                    StarLatestMagnitude.overall > latest.overall,
+                    and_(StarLatestMagnitude.overall == latest.overall, StarLatestMagnitude.star_id > star_id),
+                ),
+            ),
+        )
+    ).one()
+    return StarRank(star_id=star_id, rank=ahead + 1, overall=latest.overall, total=total)
+
+
+async def rebuild() -> int:
+    """从 ``magnitude_history`` 重建 ``star_latest_magnitude`` 与 Redis 榜单，返回上榜智星数。"""
+
+    ranked = select(
+        MagnitudeHistory.star_id,
+        MagnitudeHistory.overall,
+        MagnitudeHistory.level,
+        MagnitudeHistory.evaluated_at,
+        func.row_number()
+        .over(
+            partition_by=MagnitudeHistory.star_id,
+            order_by=(MagnitudeHistory.evaluated_at.desc(), MagnitudeHistory.id.desc()),  # type: ignore[attr-defined]
+        )
+        .label("rn"),
+    ).subquery()
+    latest = (
+        select(ranked.c.star_id, Star.domain, ranked.c.overall, ranked.c.level, ranked.c.evaluated_at)
+        .join(Star, Star.id == ranked.c.star_id)  # type: ignore[arg-type]
+        .where(ranked.c.rn == 1)
+    )
+
+    async with SessionFactory() as session:
+        await session.exec(delete(StarLatestMagnitude))  # type: ignore[call-overload]
+        await session.exec(  # type: ignore[call-overload]
+            insert(StarLatestMagnitude).from_select(
+                ["star_id", "domain", "overall", "level", "evaluated_at"],
+                latest,
+            ),
+        )
+        await session.commit()
+        count = (await session.exec(select(func.count()).select_from(StarLatestMagnitude))).one()
+
+        redis = get_redis()
+        if redis is not None:
+            await _rebuild_redis(redis, session)
+    return count
+
+
+async def _rebuild_redis(redis: Any, session: AsyncSession) -> None:
+    """先写入临时 key，再逐个 RENAME 覆盖线上 key，重建过程中读请求看到的始终是完整榜单。"""
+
+    stale = {key async for key in redis.scan_iter(match=f"{KEY_PREFIX}:*")}
+    async for key in redis.scan_iter(match=f"{REBUILD_PREFIX}:*"):
+        await redis.delete(key)
+
+    now = datetime.utcnow()
+    result = await session.stream_scalars(select(StarLatestMagnitude))
+    async for rows in result.partitions(REBUILD_BATCH_SIZE):
+        async with redis.pipeline(transaction=False) as pipe:
+            for row in rows:
+                _mirror(pipe, row, now, prefix=REBUILD_PREFIX)
+            await pipe.execute()
+
+    built = [key async for key in redis.scan_iter(match=f"{REBUILD_PREFIX}:*")]
+    async with redis.pipeline(transaction=True) as pipe:
+        for key in built:
+            live = KEY_PREFIX + key[len(REBUILD_PREFIX) :]
+            pipe.rename(key, live)
+            stale.discard(live)
+        if stale:
+            pipe.delete(*stale)
+        pipe.set(BUILT_KEY, now.isoformat())
+        await pipe.execute()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar leaderboard maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="从 magnitude_history 重建 star_latest_magnitude 与 Redis 榜单")
+    args = parser.parse_args()
+
+    if args.cmd == "rebuild":
+        count = asyncio.run(rebuild())
+        print(f"rebuilt leaderboard with {count} stars")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,31 @@
 
 当前实现为占位实现：
 - 根据星名与星域，对用户消息做简单风格化改写；
-- 未来可以在此接入本地 llama.cpp、vLLM 或云端大模型。
+- 以异步 token 流的形式逐段产出，便于上层做 SSE / WebSocket 流式推送；
+- 回答前先在智星的星尘索引中检索相关片段，按 token 预算拼入提示词（RAG）；
+- 生成经推理调度器（``inference``）与其它请求合并成微批次执行；
+- 相同/相近的问题命中回复缓存（``reply_cache``）时不再检索与生成；
+- 未来可以通过 ``inference.register_backend`` 接入本地 llama.cpp、vLLM 或云端大模型。
 """
 
 from __future__ import annotations
 
+import logging
+import time
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable
 
+from config import get_settings
+from inference import TOKEN_PATTERN, GenerationRequest, get_scheduler
 from models import Star
 
+if TYPE_CHECKING:
+    from vector_index import SearchHit
+
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class ChatMessage:
@@ -19,21 +34,51 @@ class ChatMessage:
     content: str
 
 
-def generate_reply(star: Star, messages: Iterable[ChatMessage]) -> str:
-    """基础对话能力：给任意智星生成一条回复。
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文逐字计，英文单词/数字串计为一个，标点各计一个。"""
 
-    参数:
-        star: 当前对话对应的智星，便于做人格/口吻控制。
-        messages: 历史消息（简单起见，这里只看最后一条用户消息）。
-    """
+    return sum(1 for match in TOKEN_PATTERN.finditer(text) if not match.group(0).isspace())
 
-    last_user = next((m for m in reversed(list(messages)) if m.role == "user"), None)
-    question = last_user.content if last_user else "你好，星主。"  # type: ignore[union-attr]
 
+def pack_context(hits: list[SearchHit], token_budget: int) -> list[SearchHit]:
+    """按相关度从高到低装入星尘片段，直到用完 token 预算。"""
+
+    packed: list[SearchHit] = []
+    used = 0
+    for hit in hits:
+        cost = estimate_tokens(hit.text)
+        if used + cost > token_budget:
+            continue
+        packed.append(hit)
+        used += cost
+    return packed
+
+
+def build_prompt(star: Star, messages: list[ChatMessage], contexts: list[SearchHit]) -> str:
+    """组装送入模型的提示词：人格设定 + 检索到的星尘 + 对话历史。"""
+
+    lines = [f"你是「{star.name}」，一颗专注于「{star.domain}」星域的智星。"]
+    if star.persona:
+        lines.append(f"人格设定：{star.persona}")
+    if contexts:
+        lines.append("以下是星主提供的星尘知识，回答时优先参考：")
+        lines.extend(f"[{i}] {hit.text}" for i, hit in enumerate(contexts, start=1))
+    lines.append("")
+    lines.extend(f"{m.role}: {m.content}" for m in messages)
+    lines.append("assistant:")
+    return "\n".join(lines)
+
+
+def _render_placeholder(star: Star, question: str, contexts: list[SearchHit]) -> str:
     # 这里是非常简化的“人格化”输出逻辑，后续可替换为真实 LLM 调用。
     header = f"【{star.name} · {star.domain} 智星】"
+    references = ""
+    if contexts:
+        snippets = "\n".join(f"- {hit.text[:60]}…" for hit in contexts)
+        references = f"结合你的星尘，我找到了这些相关内容：\n{snippets}\n\n"
     body = (
         f"我已经收到你的问题：{question}\n\n"
+        f"{references}"
         "当前仍处于 PoC 阶段，回答由占位模型生成。"
         "后续会替换为真实大语言模型，并结合你的星尘知识与强化学习反馈，"
         "逐步进化为更专业、更稳定的智星。"
@@ -41,3 +86,56 @@ def generate_reply(star: Star, messages: Iterable[ChatMessage]) -> str:
     return f"{header}\n{body}"
 
 
+async def generate_reply(star: Star, messages: Iterable[ChatMessage]) -> AsyncIterator[str]:
+    """基础对话能力：以异步生成器的形式逐个产出回复 token。
+
+    参数:
+        star: 当前对话对应的智星，便于做人格/口吻控制。
+        messages: 历史消息（简单起见，这里只看最后一条用户消息）。
+
+    调用方停止迭代（或显式 ``aclose()``）即视为取消，调度器会在下一个解码步把它移出批次。
+    """
+
+    # 检索与回复缓存依赖 numpy 与向量索引，首次对话时才加载，缩短冷启动
+    from reply_cache import get_reply_cache
+    from retrieval import retrieve
+
+    history = list(messages)
+    last_user = next((m for m in reversed(history) if m.role == "user"), None)
+    question = last_user.content if last_user else "你好，星主。"  # type: ignore[union-attr]
+
+    settings = get_settings()
+    cache = get_reply_cache() if settings.reply_cache_enabled else None
+    if cache is not None and (cached := cache.lookup(star, history)) is not None:
+        for match in TOKEN_PATTERN.finditer(cached):
+            yield match.group(0)
+        return
+
+    started = time.perf_counter()
+    contexts = pack_context(await retrieve(star.id, question), settings.retrieval_context_tokens)
+    prompt = build_prompt(star, history, contexts)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("star %s prompt: %d tokens, %d contexts", star.id, estimate_tokens(prompt), len(contexts))
+
+    request = GenerationRequest(
+        prompt=prompt,
+        max_new_tokens=settings.inference_max_new_tokens,
+        scripted=_render_placeholder(star, question, contexts),
+    )
+    tokens = get_scheduler().stream(star.id, request)
+    output: list[str] = []
+    try:
+        async for token in tokens:
+            output.append(token)
+            yield token
+    finally:
+        await tokens.aclose()  # type: ignore[attr-defined]
+    # 只缓存完整生成的回复；中途取消时不会执行到这里
+    if cache is not None:
+        cache.store(star, history, "".join(output), time.perf_counter() - started)
+
+
+async def complete_reply(star: Star, messages: Iterable[ChatMessage]) -> str:
+    """非流式场景：把 token 流拼接成完整回复。"""
+
+    return "".join([token async for token in generate_reply(star, messages)])
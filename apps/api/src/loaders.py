@@ -0,0 +1,91 @@
+"""GraphQL DataLoader：把按行触发的 resolver 查询合并为按批查询，消除 N+1。
+
+每个请求在 context 中新建一组 loader，缓存只在单个请求内有效，不会跨请求读到旧数据。
+不同 loader 可能在同一轮事件循环中并发派发，因此每次批量加载都从会话工厂取独立的 AsyncSession。
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from strawberry.dataloader import DataLoader
+
+from cache import MAGNITUDE, get_cache
+from config import get_settings
+from models import MagnitudeHistory, User
+
+
+async def _load_latest_levels(
+    session_factory: async_sessionmaker[AsyncSession],
+    star_ids: Sequence[UUID],
+) -> list[str | None]:
+    """一次查询取出一批智星各自最新的星等。
+
+    使用 ``ROW_NUMBER() OVER (PARTITION BY star_id ORDER BY evaluated_at DESC)``，
+    PostgreSQL 与 SQLite 都支持，效果等价于 ``DISTINCT ON (star_id)``。
+    """
+
+    ranked = (
+        select(
+            MagnitudeHistory.star_id,
+            MagnitudeHistory.level,
+            func.row_number()
+            .over(
+                partition_by=MagnitudeHistory.star_id,
+                order_by=MagnitudeHistory.evaluated_at.desc(),  # type: ignore[attr-defined]
+            )
+            .label("rn"),
+        )
+        .where(MagnitudeHistory.star_id.in_(star_ids))  # type: ignore[attr-defined]
+        .subquery()
+    )
+    async with session_factory() as session:
+        rows = (await session.exec(select(ranked.c.star_id, ranked.c.level).where(ranked.c.rn == 1))).all()
+    levels = {star_id: level for star_id, level in rows}
+    return [levels.get(star_id) for star_id in star_ids]
+
+
+async def _load_latest_levels_cached(
+    session_factory: async_sessionmaker[AsyncSession],
+    star_ids: Sequence[UUID],
+) -> list[str | None]:
+    """先查两级缓存，只为未命中的智星回源；``run_evaluation`` 写入新星等时按星失效。"""
+
+    async def load_many(keys: list[str]) -> dict[str, str | None]:
+        levels = await _load_latest_levels(session_factory, [UUID(key) for key in keys])
+        return dict(zip(keys, levels))
+
+    return await get_cache().get_many_or_load(
+        MAGNITUDE, [str(star_id) for star_id in star_ids], load_many, get_settings().cache_ttl_s,
+    )
+
+
+async def _load_users(
+    session_factory: async_sessionmaker[AsyncSession],
+    user_ids: Sequence[UUID],
+) -> list[User | None]:
+    async with session_factory() as session:
+        users = (await session.exec(select(User).where(User.id.in_(user_ids)))).all()  # type: ignore[attr-defined]
+    by_id = {user.id: user for user in users}
+    return [by_id.get(user_id) for user_id in user_ids]
+
+
+@dataclass
+class Loaders:
+    latest_magnitude: DataLoader[UUID, str | None]
+    user: DataLoader[UUID, User | None]
+
+
+def build_loaders(session_factory: async_sessionmaker[AsyncSession]) -> Loaders:
+    """为单个 GraphQL 请求创建 loader 集合。"""
+
+    return Loaders(
+        latest_magnitude=DataLoader(load_fn=lambda keys: _load_latest_levels_cached(session_factory, keys)),
+        user=DataLoader(load_fn=lambda keys: _load_users(session_factory, keys)),
+    )
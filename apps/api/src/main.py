@@ -1,27 +1,104 @@
+import asyncio
+import logging
+import threading
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+from uuid import UUID
+
 from fastapi import Depends, FastAPI
-from sqlmodel import Session, select
-from strawberry.fastapi import GraphQLRouter
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.types import Receive, Scope, Send
 
+from cache import MAGNITUDE, SKILLS, STAR, STARS, TRIALS, get_cache, make_key
 from config import get_settings
-from db import get_session, init_db
-from models import MagnitudeHistory, Skill, Star, StarTrial, User
+from inference import get_scheduler
+from db import SessionFactory, get_session, prepare_schema
+from events import STAR_CREATED, emit, get_relay
+from metrics import PrometheusMiddleware, graphql_extension
+from metrics import router as metrics_router
+from models import Skill, Star, StarTrial, User
+from pagination import DEFAULT_PAGE_SIZE, Page, paginate
 from routes_agent import router as agent_router
 from routes_community import router as community_router
 from routes_evaluator import router as evaluator_router
 from routes_knowledge import router as knowledge_router
 from routes_skills import router as skills_router
+from routes_stars import router as stars_router
+from skill_gateway import get_skill_gateway
+from trial_runner import get_trial_runner
+
+if TYPE_CHECKING:
+    from strawberry.fastapi import GraphQLRouter
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 app = FastAPI(title=settings.app_name)
+app.add_middleware(PrometheusMiddleware)
 
 
 @app.on_event("startup")
-def on_startup() -> None:
-    init_db()
+async def on_startup() -> None:
+    await prepare_schema(settings.db_schema_mode)
+    await get_cache().start()
+    if settings.events_relay_enabled:
+        await get_relay().start()
+    if settings.startup_warmup == "eager":
+        _warm_up()
+    elif settings.startup_warmup == "background":
+        asyncio.get_running_loop().run_in_executor(None, _warm_up)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await get_cache().close()
+    await get_relay().close()
+    await get_trial_runner().close()  # 未落库的答案保持 pending，重启后可续跑
+    await get_skill_gateway().close()
+    await get_scheduler().close()
+
+
+def build_graphql_router() -> "GraphQLRouter":
+    import strawberry
+    from strawberry.fastapi import GraphQLRouter
 
+    from loaders import Loaders, build_loaders
 
-def build_graphql_router() -> GraphQLRouter:
-    import strawberry
+    T = TypeVar("T")
+
+    @strawberry.type
+    class PageInfo:
+        has_next_page: bool
+        end_cursor: str | None
+
+    @strawberry.type
+    class Edge(Generic[T]):
+        cursor: str
+        node: T
+
+    @strawberry.type
+    class Connection(Generic[T]):
+        edges: list[Edge[T]]
+        page_info: PageInfo
+
+    def to_connection(page: Page, nodes: list) -> Connection:
+        return Connection(
+            edges=[Edge(cursor=cursor, node=node) for cursor, node in zip(page.cursors, nodes)],
+            page_info=PageInfo(has_next_page=page.has_next_page, end_cursor=page.end_cursor),
+        )
+
+    @strawberry.input
+    class StarFilter:
+        domain: str | None = None
+        status: str | None = None
+
+    @strawberry.input
+    class KnowledgeInput:
+        star_id: str
+        source_type: str = "graphql"
+        payload_uri: str | None = None
+        content: str | None = None
 
     @strawberry.type
     class GQLUser:
@@ -37,18 +114,35 @@ def build_graphql_router() -> GraphQLRouter:
         owner_id: str
 
         @strawberry.field
-        def latest_magnitude(self, info) -> str | None:  # type: ignore[override]
-            session: Session = info.context["session"]
-            record = (
-                session.exec(
-                    select(MagnitudeHistory)
-                    .where(MagnitudeHistory.star_id == self.id)  # type: ignore[arg-type]
-                    .order_by(MagnitudeHistory.evaluated_at.desc()),
-                )
-                .first()
-            )
-            return record.level if record else None
+        async def latest_magnitude(self, info) -> str | None:  # type: ignore[override]
+            loaders: Loaders = info.context["loaders"]
+            return await loaders.latest_magnitude.load(UUID(self.id))
 
+        @strawberry.field
+        async def owner(self, info) -> GQLUser | None:  # type: ignore[override]
+            loaders: Loaders = info.context["loaders"]
+            user = await loaders.user.load(UUID(self.owner_id))
+            if not user:
+                return None
+            return GQLUser(id=str(user.id), email=user.email, display_name=user.display_name)
+
+    @strawberry.type
+    class GQLTrial:
+        id: str
+        title: str
+        status: str
+
+    @strawberry.type
+    class GQLSkill:
+        id: str
+        name: str
+        status: str
+
+    def star_dict(star: Star) -> dict[str, Any]:
+        return {"id": str(star.id), "name": star.name, "domain": star.domain, "owner_id": str(star.owner_id)}
+
+    # 查询的根字段会被并发解析，而 AsyncSession 不支持并发使用，
+    # 因此 Query resolver 各自从 SessionFactory 取独立会话；Mutation 串行执行，共用请求级会话。
     @strawberry.type
     class Query:
         @strawberry.field
@@ -56,15 +150,14 @@ def build_graphql_router() -> GraphQLRouter:
             return "stellar"
 
         @strawberry.field
-        def me(self, info) -> GQLUser | None:  # type: ignore[override]
+        async def me(self, info) -> GQLUser | None:  # type: ignore[override]
             # PoC：先返回或创建一个默认用户，后续接入真实 Auth
-            session: Session = info.context["session"]
-            user = session.exec(select(User).limit(1)).first()
-            if not user:
-                user = User(email="founder@mystar.local", display_name="首位星主")
-                session.add(user)
-                session.commit()
-                session.refresh(user)
+            async with SessionFactory() as session:
+                user = (await session.exec(select(User).limit(1))).first()
+                if not user:
+                    user = User(email="founder@mystar.local", display_name="首位星主")
+                    session.add(user)
+                    await session.commit()
             return GQLUser(
                 id=str(user.id),
                 email=user.email,
@@ -72,135 +165,256 @@ def build_graphql_router() -> GraphQLRouter:
             )
 
         @strawberry.field
-        def stars(self, info) -> list[GQLStar]:  # type: ignore[override]
-            session: Session = info.context["session"]
-            stars = session.exec(select(Star)).all()
-            return [
-                GQLStar(
-                    id=str(s.id),
-                    name=s.name,
-                    domain=s.domain,
-                    owner_id=str(s.owner_id),
-                )
-                for s in stars
-            ]
+        async def star(self, info, id: str) -> GQLStar | None:  # type: ignore[override]
+            """智星详情（经两级缓存）."""
 
-        @strawberry.field
-        def trials(self, info) -> list[str]:  # type: ignore[override]
-            """返回所有星试标题，最小可见化."""
+            star_id = UUID(id)
 
-            session: Session = info.context["session"]
-            trials = session.exec(select(StarTrial)).all()
-            return [t.title for t in trials]
+            async def load() -> dict[str, Any] | None:
+                async with SessionFactory() as session:
+                    star = await session.get(Star, star_id)
+                return star_dict(star) if star else None
+
+            data = await get_cache().get_or_load(STAR, str(star_id), load, settings.cache_ttl_s)
+            return GQLStar(**data) if data else None
+
+        @strawberry.field
+        async def stars(
+            self,
+            info,
+            filter: StarFilter | None = None,
+            first: int = DEFAULT_PAGE_SIZE,
+            after: str | None = None,
+        ) -> Connection[GQLStar]:  # type: ignore[override]
+            """按星域/状态过滤的智星列表，按创建时间倒序做游标分页."""
+
+            domain = filter.domain if filter else None
+            status = filter.status if filter else None
+
+            async def load() -> dict[str, Any]:
+                statement = select(Star)
+                if domain:
+                    statement = statement.where(Star.domain == domain)
+                if status:
+                    statement = statement.where(Star.status == status)
+                async with SessionFactory() as session:
+                    page = await paginate(session, statement, Star, first=first, after=after)
+                return asdict(page.map(star_dict))
+
+            key = make_key(domain, status, first, after)
+            page = Page(**await get_cache().get_or_load(STARS, key, load, settings.cache_list_ttl_s))
+            return to_connection(page, [GQLStar(**s) for s in page.items])
 
         @strawberry.field
-        def skills(self, info) -> list[str]:  # type: ignore[override]
-            """返回已注册星技名称列表."""
+        async def trials(
+            self,
+            info,
+            status: str | None = None,
+            first: int = DEFAULT_PAGE_SIZE,
+            after: str | None = None,
+        ) -> Connection[GQLTrial]:  # type: ignore[override]
+            """星试列表，按创建时间倒序做游标分页."""
+
+            async def load() -> dict[str, Any]:
+                statement = select(StarTrial)
+                if status:
+                    statement = statement.where(StarTrial.status == status)
+                async with SessionFactory() as session:
+                    page = await paginate(session, statement, StarTrial, first=first, after=after)
+                return asdict(page.map(lambda t: {"id": str(t.id), "title": t.title, "status": t.status}))
+
+            key = make_key(status, first, after)
+            page = Page(**await get_cache().get_or_load(TRIALS, key, load, settings.cache_list_ttl_s))
+            return to_connection(page, [GQLTrial(**t) for t in page.items])
 
-            session: Session = info.context["session"]
-            skills = session.exec(select(Skill)).all()
-            return [s.name for s in skills]
+        @strawberry.field
+        async def skills(
+            self,
+            info,
+            status: str | None = None,
+            first: int = DEFAULT_PAGE_SIZE,
+            after: str | None = None,
+        ) -> Connection[GQLSkill]:  # type: ignore[override]
+            """已注册星技列表，按创建时间倒序做游标分页."""
+
+            async def load() -> dict[str, Any]:
+                statement = select(Skill)
+                if status:
+                    statement = statement.where(Skill.status == status)
+                async with SessionFactory() as session:
+                    page = await paginate(session, statement, Skill, first=first, after=after)
+                return asdict(page.map(lambda s: {"id": str(s.id), "name": s.name, "status": s.status}))
+
+            key = make_key(status, first, after)
+            page = Page(**await get_cache().get_or_load(SKILLS, key, load, settings.cache_list_ttl_s))
+            return to_connection(page, [GQLSkill(**s) for s in page.items])
 
     @strawberry.type
     class Mutation:
         @strawberry.mutation
-        def create_star(self, info, name: str, domain: str) -> GQLStar:  # type: ignore[override]
-            session: Session = info.context["session"]
-            user = session.exec(select(User).limit(1)).first()
+        async def create_star(self, info, name: str, domain: str) -> GQLStar:  # type: ignore[override]
+            session: AsyncSession = info.context["session"]
+            user = (await session.exec(select(User).limit(1))).first()
             if not user:
                 user = User(email="founder@mystar.local", display_name="首位星主")
                 session.add(user)
-                session.commit()
-                session.refresh(user)
             star = Star(name=name, domain=domain, owner_id=user.id)
             session.add(star)
-            session.commit()
-            session.refresh(star)
-            return GQLStar(id=str(star.id), name=star.name, domain=star.domain, owner_id=str(star.owner_id))
+            emit(session, STAR_CREATED, star.id, {"star_id": star.id, "owner_id": user.id, "name": name, "domain": domain})
+            await session.commit()
+            await get_cache().invalidate(STARS)
+            return GQLStar(**star_dict(star))
 
         @strawberry.mutation
-        def ingest_knowledge(self, info, star_id: str) -> bool:  # type: ignore[override]
-            """占位 GraphQL Mutation：内部转到 REST /knowledge/v1/uploads。
-
-            目前仅在数据库中记录一条知识任务，不做真实向量化。
-            """
-
-            from uuid import UUID
-
+        async def ingest_knowledge(
+            self,
+            info,
+            star_id: str,
+            payload_uri: str | None = None,
+            content: str | None = None,
+        ) -> bool:  # type: ignore[override]
+            """GraphQL 版星尘上传：与 REST /knowledge/v1/uploads 一致，创建任务后交给后台流水线处理。"""
+
+            from ingestion import run_ingestion
             from models import KnowledgeTask
-
-            session: Session = info.context["session"]
-            task = KnowledgeTask(star_id=UUID(star_id), source_type="graphql", status="completed")
+            from object_store import check_payload_uri
+            from rate_limit import client_key, get_rate_limiter
+
+            if payload_uri is not None:
+                check_payload_uri(payload_uri)
+            # 与 REST 共用上传额度；超限时 RateLimited 作为 GraphQL 错误返回
+            await get_rate_limiter().check("upload", user=client_key(info.context["request"]), star_id=UUID(star_id))
+            session: AsyncSession = info.context["session"]
+            task = KnowledgeTask(star_id=UUID(star_id), source_type="graphql", payload_uri=payload_uri, status="pending")
             session.add(task)
-            session.commit()
+            await session.commit()
+            info.context["background_tasks"].add_task(run_ingestion, task.id, content)
             return True
 
         @strawberry.mutation
-        def evaluate_star(self, info, star_id: str) -> str:  # type: ignore[override]
-            """占位 GraphQL Mutation：根据星尘数量给星等。"""
-
-            from uuid import UUID
-
-            session: Session = info.context["session"]
-            # 直接调用 Evaluator 的核心逻辑：这里简单起见，重复一遍映射规则
-            from models import KnowledgeTask as KT
-
-            task_count = session.exec(
-                select(KT).where(KT.star_id == UUID(star_id)),
-            ).count()
-            overall = min(5.0, 1.0 + task_count * 0.5)
-            if overall >= 4.5:
-                level = "L5"
-            elif overall >= 3.5:
-                level = "L4"
-            elif overall >= 2.5:
-                level = "L3"
-            elif overall >= 1.5:
-                level = "L2"
-            else:
-                level = "L1"
-
-            record = MagnitudeHistory(star_id=UUID(star_id), overall=overall, level=level)
-            session.add(record)
-            session.commit()
-            return level
+        async def ingest_knowledge_batch(self, info, items: list[KnowledgeInput]) -> list[str]:  # type: ignore[override]
+            """批量星尘上传：与 REST /knowledge/v1/uploads:batch 一致，返回按输入顺序排列的任务 ID。"""
+
+            from ingestion import IngestItem, create_tasks, run_ingestion_batch
+            from object_store import check_payload_uri
+            from routes_knowledge import check_backfill_limits
+
+            if len(items) > settings.ingest_batch_max_items:
+                raise ValueError(f"batch exceeds {settings.ingest_batch_max_items} items")
+            for item in items:
+                if item.payload_uri is not None:
+                    check_payload_uri(item.payload_uri)
+            await check_backfill_limits(info.context["request"], (UUID(i.star_id) for i in items))
+            session: AsyncSession = info.context["session"]
+            task_ids = await create_tasks(
+                session,
+                [
+                    IngestItem(star_id=UUID(i.star_id), source_type=i.source_type, payload_uri=i.payload_uri)
+                    for i in items
+                ],
+            )
+            if task_ids:
+                info.context["background_tasks"].add_task(
+                    run_ingestion_batch, list(zip(task_ids, (i.content for i in items))),
+                )
+            return [str(task_id) for task_id in task_ids]
+
+        @strawberry.mutation
+        async def evaluate_star(self, info, star_id: str) -> str:  # type: ignore[override]
+            """评估一颗智星并返回星等；与 ``/evaluator/v1/run`` 共用 ``scoring`` 评估引擎。"""
+
+            from scoring import evaluate
+
+            session: AsyncSession = info.context["session"]
+            records = await evaluate(session, star_ids=[UUID(star_id)])
+            if not records:
+                raise ValueError(f"star {star_id} not found")
+            await get_cache().invalidate(MAGNITUDE, str(records[0].star_id))
+            return records[0].level
 
         @strawberry.mutation
-        def create_trial(self, info, title: str, prompt: str) -> bool:  # type: ignore[override]
+        async def create_trial(self, info, title: str, prompt: str) -> bool:  # type: ignore[override]
             """通过 GraphQL 创建一条星试记录."""
 
-            session: Session = info.context["session"]
+            session: AsyncSession = info.context["session"]
             trial = StarTrial(title=title, prompt=prompt, status="ongoing")
             session.add(trial)
-            session.commit()
+            await session.commit()
+            await get_cache().invalidate(TRIALS)
             return True
 
         @strawberry.mutation
-        def register_skill(self, info, name: str, description: str | None = None) -> bool:  # type: ignore[override]
+        async def register_skill(self, info, name: str, description: str | None = None) -> bool:  # type: ignore[override]
             """通过 GraphQL 注册一个简单星技."""
 
-            session: Session = info.context["session"]
+            session: AsyncSession = info.context["session"]
             skill = Skill(name=name, description=description, status="published")
             session.add(skill)
-            session.commit()
+            await session.commit()
+            await get_cache().invalidate(SKILLS)
             return True
 
-    schema = strawberry.Schema(query=Query, mutation=Mutation)
+    schema = strawberry.Schema(query=Query, mutation=Mutation, extensions=[graphql_extension()])
 
-    def get_context(session: Session = Depends(get_session)):
-        return {"session": session}
+    async def get_context(session: AsyncSession = Depends(get_session)):
+        return {"session": session, "loaders": build_loaders(SessionFactory)}
 
     return GraphQLRouter(schema, path="/graphql", context_getter=get_context)
 
 
+class LazyGraphQL:
+    """首个 GraphQL 请求（或启动预热）时才导入 strawberry 并构建 schema，之后直接转发给 GraphQLRouter。"""
+
+    def __init__(self) -> None:
+        self._router: GraphQLRouter | None = None
+        self._lock = threading.Lock()
+
+    def load(self) -> "GraphQLRouter":
+        if self._router is None:
+            with self._lock:  # 预热线程与首个请求可能同时触发构建
+                if self._router is None:
+                    self._router = build_graphql_router()
+        return self._router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.load()(scope, receive, send)
+
+
+graphql_app = LazyGraphQL()
+
+
+def _warm_up() -> None:
+    """提前加载按需导入的重模块，使首个请求不必承担导入开销。"""
+
+    try:
+        graphql_app.load()
+        import ingestion  # noqa: F401
+        import reply_cache  # noqa: F401
+        import retrieval  # noqa: F401
+    except Exception:  # 预热失败不影响服务，首个请求会再次尝试
+        logger.exception("startup warm-up failed")
+
+
 @app.get("/health")
 def healthcheck() -> dict[str, str]:
     return {"status": "ok", "env": settings.environment}
 
 
-app.include_router(build_graphql_router(), include_in_schema=False)
+@app.get("/cache/stats")
+def cache_stats() -> dict[str, Any]:
+    """读缓存与对话回复缓存的命中/未命中计数，用于评估容量与 TTL 设置。"""
+
+    from reply_cache import get_reply_cache
+
+    return {**get_cache().stats(), "replies": get_reply_cache().stats()}
+
+
+app.add_route("/graphql", graphql_app, methods=["GET", "POST"], include_in_schema=False)
+app.add_websocket_route("/graphql", graphql_app)
 app.include_router(agent_router)
 app.include_router(knowledge_router)
 app.include_router(evaluator_router)
 app.include_router(community_router)
 app.include_router(skills_router)
+app.include_router(stars_router)
+app.include_router(metrics_router)
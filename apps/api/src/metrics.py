@@ -0,0 +1,209 @@
+"""Prometheus 指标：HTTP 路由与 GraphQL 字段耗时、数据库查询与连接池，以及 ``GET /metrics``。
+
+- HTTP：按路由模板（而非原始路径）统计耗时直方图，外加全局在途请求数；
+- GraphQL：根字段与异步解析器按 ``类型.字段`` 统计耗时（同步标量字段不计，避免逐字段开销），
+  扩展类在构建 schema 时才创建，本模块不在导入期加载 strawberry；
+- 数据库：每条 SQL 的耗时、每个请求的查询次数与累计耗时、连接池等待时间与占用率；
+  超过 ``db_slow_query_ms`` 的语句记入慢查询日志。
+
+数据库钩子挂在 ``db.py`` 的引擎上，这里只负责指标定义与按请求聚合。
+"""
+
+from __future__ import annotations
+
+import inspect
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP 请求耗时（按路由模板）",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "正在处理的 HTTP 请求数")
+
+GRAPHQL_FIELD_SECONDS = Histogram(
+    "graphql_resolver_duration_seconds",
+    "GraphQL 字段解析耗时（根字段与异步解析器）",
+    ["field"],
+    buckets=LATENCY_BUCKETS,
+)
+GRAPHQL_OPERATIONS = Counter(
+    "graphql_operations_total",
+    "GraphQL 操作次数",
+    ["operation", "status"],
+)
+
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "单条 SQL 耗时", ["statement"], buckets=QUERY_BUCKETS)
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "超过慢查询阈值的 SQL 条数", ["statement"])
+DB_REQUEST_QUERIES = Histogram(
+    "db_queries_per_request",
+    "每个 HTTP 请求执行的 SQL 条数",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+)
+DB_REQUEST_SECONDS = Histogram(
+    "db_time_per_request_seconds",
+    "每个 HTTP 请求花在 SQL 上的累计时间",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "从连接池取得连接的等待时间",
+    buckets=QUERY_BUCKETS,
+)
+OUTBOX_PUBLISHED = Counter("outbox_events_published_total", "发件箱投递到 Redis Stream 的事件数")
+OUTBOX_BATCH_SECONDS = Histogram(
+    "outbox_publish_batch_seconds",
+    "发件箱单批投递耗时（读取 + 批量 XADD + 标记已投递）",
+    buckets=QUERY_BUCKETS,
+)
+SKILL_INVOCATIONS = Counter(
+    "skill_invocations_total",
+    "星技调用次数（ok / client_error / error / timeout / saturated / rejected / blocked / cached）",
+    ["outcome"],
+)
+SKILL_INVOKE_SECONDS = Histogram(
+    "skill_invoke_duration_seconds",
+    "星技调用耗时（含等待并发名额）",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "被准入控制拒绝的请求数（scope: chat / upload / generation；limit: user / star / capacity）",
+    ["scope", "limit"],
+)
+GENERATIONS_IN_FLIGHT = Gauge("generations_in_flight", "本 worker 正在进行的生成数（含流式推送中的回复）")
+GENERATION_SLOTS = Gauge("generation_slots", "本 worker 的在途生成数上限（0 表示不限）")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "当前被占用的连接数")
+DB_POOL_SATURATION = Gauge("db_pool_saturation", "连接池占用率（占用数 / (pool_size + max_overflow)）")
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def _statement_kind(statement: str) -> str:
+    # 只取首个关键字作为标签，避免把完整 SQL 变成高基数标签
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def observe_query(statement: str, seconds: float, slow_query_ms: float | None = None) -> None:
+    """记录一条 SQL 的耗时，并计入当前请求的统计；由 ``db.py`` 的引擎事件调用。"""
+
+    kind = _statement_kind(statement)
+    DB_QUERY_SECONDS.labels(kind).observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+    if slow_query_ms is not None and seconds * 1000 >= slow_query_ms:
+        DB_SLOW_QUERIES.labels(kind).inc()
+        logger.warning("slow query (%.1f ms): %s", seconds * 1000, " ".join(statement.split())[:1000])
+
+
+def track_pool(pool: Any, capacity: int) -> None:
+    """把连接池占用情况注册为按需计算的 gauge（抓取时读取，不需要额外的事件钩子）。"""
+
+    DB_POOL_CHECKED_OUT.set_function(pool.checkedout)
+    DB_POOL_SATURATION.set_function(lambda: pool.checkedout() / capacity if capacity else 0.0)
+
+
+class PrometheusMiddleware:
+    """纯 ASGI 中间件：不包装响应体，流式响应（SSE）按发送完最后一个分块计时。"""
+
+    def __init__(self, app: ASGIApp, skip_paths: tuple[str, ...] = ("/metrics",)) -> None:
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            # 路由匹配后 FastAPI 会把命中的 route 写回 scope；未命中的请求归为一类，避免路径成为高基数标签
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            DB_REQUEST_QUERIES.labels(route).observe(stats.queries)
+            DB_REQUEST_SECONDS.labels(route).observe(stats.db_seconds)
+
+
+async def _observe_async(result: Awaitable[Any], field: str, start: float) -> Any:
+    try:
+        return await result
+    finally:
+        GRAPHQL_FIELD_SECONDS.labels(field).observe(time.perf_counter() - start)
+
+
+@lru_cache(maxsize=1)
+def graphql_extension() -> type:
+    from strawberry.extensions import SchemaExtension
+
+    class GraphQLMetrics(SchemaExtension):
+        def on_execute(self):  # type: ignore[override]
+            yield
+            result = self.execution_context.result
+            status = "error" if result is not None and result.errors else "ok"
+            GRAPHQL_OPERATIONS.labels(self.execution_context.operation_name or "anonymous", status).inc()
+
+        def resolve(self, _next: Callable[..., Any], root: Any, info: Any, *args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            result = _next(root, info, *args, **kwargs)
+            field = f"{info.parent_type.name}.{info.field_name}"
+            if inspect.isawaitable(result):
+                return _observe_async(result, field, start)
+            if info.path.prev is None:
+                GRAPHQL_FIELD_SECONDS.labels(field).observe(time.perf_counter() - start)
+            return result
+
+    return GraphQLMetrics
+
+
+router = APIRouter(tags=["ops"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Optional
 from uuid import UUID, uuid4
 
+from sqlalchemy import JSON, BigInteger, Index, Integer, text
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -20,12 +21,19 @@ class User(SQLModel, table=True):
 
 class Star(SQLModel, table=True):
     __tablename__ = "stars"  # type: ignore[assignment]
+    __table_args__ = (
+        # keyset 分页：ORDER BY created_at DESC, id DESC，以及按星域/状态过滤后的分页
+        Index("ix_stars_created_at_id", "created_at", "id"),
+        Index("ix_stars_domain_status_created_at_id", "domain", "status", "created_at", "id"),
+        Index("ix_stars_status_created_at_id", "status", "created_at", "id"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     owner_id: UUID = Field(foreign_key="users.id", index=True)
     name: str
     domain: str
     persona: Optional[str] = None
+    current_model_version: UUID | None = None
     status: str = Field(default="active")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -33,30 +41,140 @@ class Star(SQLModel, table=True):
     owner: Optional[User] = Relationship(back_populates="stars")
 
 
+# 训练产出的模型版本；data_start / data_end 即 training_data_span（左闭右开），
+# 下一次导出训练数据从该智星最新版本的 data_end 开始。
+class StarModelVersion(SQLModel, table=True):
+    __tablename__ = "star_model_versions"  # type: ignore[assignment]
+    __table_args__ = (Index("ix_star_model_versions_star_id_created_at", "star_id", "created_at"),)
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    star_id: UUID = Field(foreign_key="stars.id")
+    version_name: str
+    artifact_uri: str
+    training_method: str = "qlora"  # qlora / dpo / sft
+    data_start: datetime | None = None  # 为空表示从最早的数据开始
+    data_end: datetime
+    metrics: dict = Field(default_factory=dict, sa_type=JSON)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class MagnitudeHistory(SQLModel, table=True):
     __tablename__ = "magnitude_history"  # type: ignore[assignment]
+    __table_args__ = (
+        # 时间线按智星 + 时间范围扫描；前缀同时覆盖按 star_id 的查询
+        Index("ix_magnitude_history_star_id_evaluated_at", "star_id", "evaluated_at"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
-    star_id: UUID = Field(foreign_key="stars.id", index=True)
+    star_id: UUID = Field(foreign_key="stars.id")
+    overall: float = 0.0
+    level: str = "L1"
+    # 各维度得分（1-5），overall 为其加权和；多维评估上线前的历史记录为空
+    depth: float | None = None
+    originality: float | None = None
+    consistency: float | None = None
+    utility: float | None = None
+    evaluated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# 每颗智星最新一次评估结果（排行榜数据源）：评估写路径增量 upsert，可由 magnitude_history 重建。
+class StarLatestMagnitude(SQLModel, table=True):
+    __tablename__ = "star_latest_magnitude"  # type: ignore[assignment]
+    __table_args__ = (
+        # 全站榜 / 星域榜：ORDER BY overall DESC, star_id DESC
+        Index("ix_star_latest_magnitude_overall_star_id", "overall", "star_id"),
+        Index("ix_star_latest_magnitude_domain_overall_star_id", "domain", "overall", "star_id"),
+        Index("ix_star_latest_magnitude_evaluated_at", "evaluated_at"),
+    )
+
+    star_id: UUID = Field(foreign_key="stars.id", primary_key=True)
+    domain: str
     overall: float = 0.0
     level: str = "L1"
     evaluated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+# 星等时间线的按小时 / 按天汇总：评估写路径在同一事务内增量 upsert，可由 magnitude_history 重建。
+class MagnitudeRollup(SQLModel, table=True):
+    __tablename__ = "magnitude_rollups"  # type: ignore[assignment]
+
+    star_id: UUID = Field(foreign_key="stars.id", primary_key=True)
+    granularity: str = Field(primary_key=True)  # hour / day
+    bucket_start: datetime = Field(primary_key=True)
+    samples: int = 0
+    sum_overall: float = 0.0
+    min_overall: float = 0.0
+    max_overall: float = 0.0
+    last_overall: float = 0.0
+    last_level: str = "L1"
+    last_evaluated_at: datetime
+
+
+class Conversation(SQLModel, table=True):
+    __tablename__ = "conversations"  # type: ignore[assignment]
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+    star_id: UUID = Field(foreign_key="stars.id", index=True)
+    user_id: UUID | None = Field(default=None, foreign_key="users.id", index=True)
+    channel: str = "api"  # web / mobile / api / trial
+    status: str = "active"  # active / closed
+    feedback_score: int | None = None
+    # 上下文压缩状态：seq <= summary_until_seq 的消息已折叠进 summary，
+    # tail_tokens 为其后尚未折叠的消息 token 总数，message_count 为已分配的最大 seq。
+    summary: str | None = None
+    summary_until_seq: int = 0
+    tail_tokens: int = 0
+    message_count: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    closed_at: datetime | None = None
+
+
+class ConversationMessage(SQLModel, table=True):
+    __tablename__ = "conversation_messages"  # type: ignore[assignment]
+    __table_args__ = (Index("ux_conversation_messages_conversation_id_seq", "conversation_id", "seq", unique=True),)
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    conversation_id: UUID = Field(foreign_key="conversations.id")
+    seq: int
+    role: str  # user / assistant
+    content: str
+    tokens: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ConversationFeedback(SQLModel, table=True):
+    __tablename__ = "conversation_feedback"  # type: ignore[assignment]
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    conversation_id: UUID = Field(foreign_key="conversations.id", index=True)
+    rating: int  # 1-5
+    comment: str | None = None
+    labels: list[str] = Field(default_factory=list, sa_type=JSON)  # 深度 / 准确等标签
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class KnowledgeTask(SQLModel, table=True):
     __tablename__ = "knowledge_tasks"  # type: ignore[assignment]
 
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     star_id: UUID = Field(foreign_key="stars.id", index=True)
     source_type: str = "upload"
-    status: str = "completed"  # PoC 阶段直接标记完成
+    status: str = "pending"  # pending -> processing -> completed / failed
     payload_uri: str | None = None
+    content_hash: str | None = Field(default=None, index=True)  # 原始文件的 SHA-256，用于去重
+    chunk_count: int = 0
+    embedding_index: str | None = None
+    error: str | None = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: datetime | None = None
 
 
 class StarTrial(SQLModel, table=True):
     __tablename__ = "star_trials"  # type: ignore[assignment]
+    __table_args__ = (
+        Index("ix_star_trials_created_at_id", "created_at", "id"),
+        Index("ix_star_trials_status_created_at_id", "status", "created_at", "id"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     title: str
@@ -65,13 +183,67 @@ class StarTrial(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class TrialEntry(SQLModel, table=True):
+    __tablename__ = "trial_entries"  # type: ignore[assignment]
+    __table_args__ = (
+        # 同一颗智星只能报名一次；报名接口据此做幂等插入
+        Index("ux_trial_entries_trial_id_star_id", "trial_id", "star_id", unique=True),
+        # 作答器按状态分页读取待作答条目
+        Index("ix_trial_entries_trial_id_status_id", "trial_id", "status", "id"),
+    )
+
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    trial_id: UUID = Field(foreign_key="star_trials.id")
+    star_id: UUID = Field(foreign_key="stars.id", index=True)
+    status: str = "pending"  # pending -> answered / failed
+    response: str | None = None
+    response_uri: str | None = None  # 音视频等大体积回答存对象存储，文本回答直接存 response
+    error: str | None = None
+    score: float | None = None
+    rank: int | None = None
+    reward_points: int | None = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    submitted_at: datetime | None = None
+
+
 class Skill(SQLModel, table=True):
     __tablename__ = "skills"  # type: ignore[assignment]
+    __table_args__ = (
+        Index("ix_skills_created_at_id", "created_at", "id"),
+        Index("ix_skills_status_created_at_id", "status", "created_at", "id"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     name: str
     description: str | None = None
     api_endpoint: str | None = None
+    # 调用配置，为空时使用 skill_timeout_ms / skill_max_concurrency / skill_cache_ttl_s 默认值
+    timeout_ms: int | None = None
+    max_concurrency: int | None = None
+    idempotent: bool = False  # 幂等星技的结果可以缓存
+    cache_ttl_s: float | None = None
     status: str = "published"
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+
+# 事务性发件箱：与业务行在同一事务内写入，由 events.OutboxRelay 批量投递到 Redis Stream。
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = "outbox_events"  # type: ignore[assignment]
+    __table_args__ = (
+        # 待投递事件按 id 顺序读取；部分索引只包含未投递的行，随投递自动收缩
+        Index(
+            "ix_outbox_events_pending_id",
+            "id",
+            postgresql_where=text("published_at IS NULL"),
+            sqlite_where=text("published_at IS NULL"),
+        ),
+        Index("ix_outbox_events_published_at", "published_at"),
+    )
+
+    # 自增 id 即投递顺序；SQLite 只有 INTEGER PRIMARY KEY 才会自增
+    id: int | None = Field(default=None, primary_key=True, sa_type=BigInteger().with_variant(Integer, "sqlite"))
+    event_type: str
+    star_id: UUID | None = None  # 分区键：同一颗智星的事件按写入顺序投递到同一条 Stream
+    payload: str  # 写入时即序列化好的 JSON，投递时原样转发
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    published_at: datetime | None = None
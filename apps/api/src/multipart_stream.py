@@ -0,0 +1,131 @@
+"""流式解析 multipart/form-data 请求体。
+
+Starlette 的 ``request.form()`` 会先把文件落到临时文件再交给路由；这里直接在请求体字节流上增量解析，
+每到一块网络数据就产出对应的分段事件，文件内容可以边收边转发（例如写入对象存储），内存占用只与网络块大小有关。
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart  # type: ignore[no-redef]
+    from multipart.multipart import parse_options_header  # type: ignore[no-redef]
+
+
+MULTIPART_MEDIA_TYPE = "multipart/form-data"
+
+
+class MultipartError(ValueError):
+    """请求体不是合法的 multipart/form-data。"""
+
+
+@dataclass
+class PartStart:
+    name: str
+    filename: str | None
+    content_type: str | None
+
+
+@dataclass
+class PartData:
+    data: bytes
+
+
+@dataclass
+class PartEnd:
+    pass
+
+
+MultipartEvent = PartStart | PartData | PartEnd
+
+
+def multipart_boundary(content_type: str) -> bytes | None:
+    """从 Content-Type 中取出 boundary；不是 multipart/form-data 时返回 None。"""
+
+    media_type, options = parse_options_header(content_type)
+    if media_type != MULTIPART_MEDIA_TYPE.encode():
+        return None
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise MultipartError("missing multipart boundary")
+    return boundary
+
+
+async def iter_multipart(stream: AsyncIterator[bytes], boundary: bytes) -> AsyncIterator[MultipartEvent]:
+    """把请求体字节流解析为 ``PartStart`` / ``PartData`` / ``PartEnd`` 事件序列。"""
+
+    events: list[MultipartEvent] = []
+    headers: dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+    finished = False
+
+    def on_part_begin() -> None:
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MultipartError("multipart part without a name")
+        filename = options.get(b"filename")
+        content_type = headers.get(b"content-type")
+        events.append(
+            PartStart(
+                name=options[b"name"].decode("utf-8", "replace"),
+                filename=filename.decode("utf-8", "replace") if filename is not None else None,
+                content_type=content_type.decode("latin-1") if content_type else None,
+            ),
+        )
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if end > start:
+            events.append(PartData(bytes(data[start:end])))
+
+    def on_part_end() -> None:
+        events.append(PartEnd())
+
+    def on_end() -> None:
+        nonlocal finished
+        finished = True
+
+    parser = multipart.MultipartParser(
+        boundary,
+        callbacks={
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_end": on_end,
+        },
+    )
+    async for block in stream:
+        if not block:
+            continue
+        try:
+            parser.write(block)
+        except multipart.exceptions.MultipartParseError as exc:
+            raise MultipartError(str(exc)) from exc
+        for event in events:
+            yield event
+        events.clear()
+    if not finished:
+        raise MultipartError("truncated multipart body")
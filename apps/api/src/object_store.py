@@ -0,0 +1,289 @@
+"""对象存储抽象：把字节流按固定大小分片写入 MinIO/S3，并以内容哈希寻址去重。
+
+- 写入时边传边算 SHA-256，API 进程内只缓冲一个分片（``upload_part_size``）外加少量网络块；
+- 先分片上传到暂存键，得到哈希后在服务端复制到目标键；目标键已存在时只删除暂存对象；
+- 对象最终落在 ``sha256/<前两位>/<哈希>``，相同内容只保存一份；
+- ``LocalObjectStore`` 以本地目录模拟桶，便于在没有 MinIO 的环境下开发与测试。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import os
+import queue
+import re
+import threading
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Protocol
+from urllib.parse import urlparse
+from uuid import uuid4
+
+from config import get_settings
+
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+@dataclass
+class StoredObject:
+    bucket: str
+    key: str
+    size: int
+    sha256: str
+    deduplicated: bool
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+
+def content_key(sha256: str) -> str:
+    return f"sha256/{sha256[:2]}/{sha256}"
+
+
+_CONTENT_KEY = re.compile(r"sha256/([0-9a-f]{2})/\1[0-9a-f]{62}")
+
+
+def safe_key(key: str) -> str:
+    """校验对象键；拒绝空键、绝对路径以及 ``.`` / ``..`` 段，避免本地后端拼路径时越出桶目录。"""
+
+    if not key or key.startswith("/") or "\\" in key or "\0" in key:
+        raise ValueError(f"invalid object key: {key!r}")
+    if any(part in ("", ".", "..") for part in key.split("/")):
+        raise ValueError(f"invalid object key: {key!r}")
+    return key
+
+
+def parse_uri(uri: str) -> tuple[str, str]:
+    """``s3://bucket/key`` -> (bucket, key)。"""
+
+    parsed = urlparse(uri)
+    if parsed.scheme != "s3" or not parsed.netloc:
+        raise ValueError(f"not an object store uri: {uri}")
+    return parsed.netloc, safe_key(parsed.path.removeprefix("/"))
+
+
+def check_payload_uri(uri: str) -> tuple[str, str]:
+    """校验客户端提交的原文地址，返回 (bucket, key)。
+
+    只接受上传接口签发的地址：``knowledge-raw`` 桶中的内容寻址键（``sha256/<前两位>/<哈希>``），
+    其他桶、本地路径与 ``file://`` 一律拒绝，避免借入库读取服务器上的任意文件或对象。
+    """
+
+    raw_bucket = get_settings().knowledge_raw_bucket
+    bucket, key = parse_uri(uri)
+    if bucket != raw_bucket or not _CONTENT_KEY.fullmatch(key):
+        raise ValueError(f"payload_uri must be an uploaded object (s3://{raw_bucket}/sha256/...)")
+    return bucket, key
+
+
+class ObjectStore(Protocol):
+    async def put_stream(self, bucket: str, chunks: AsyncIterator[bytes]) -> StoredObject:
+        """流式写入并按内容哈希寻址；内容已存在时丢弃本次写入并返回 ``deduplicated=True``。"""
+        ...
+
+    def open_stream(self, bucket: str, key: str) -> AsyncIterator[bytes]:
+        """按块流式读取对象。"""
+        ...
+
+
+class LocalObjectStore:
+    """本地文件系统版对象存储：``<root>/<bucket>/<key>``。"""
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+
+    def _path(self, bucket: str, key: str) -> Path:
+        return self.root / safe_key(bucket) / safe_key(key)
+
+    async def put_stream(self, bucket: str, chunks: AsyncIterator[bytes]) -> StoredObject:
+        staging = self._path(bucket, f".staging/{uuid4().hex}")
+        staging.parent.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with staging.open("wb") as fh:
+                async for chunk in chunks:
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    await asyncio.to_thread(fh.write, chunk)
+            digest = hasher.hexdigest()
+            key = content_key(digest)
+            target = self._path(bucket, key)
+            deduplicated = target.exists()
+            if deduplicated:
+                staging.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staging, target)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+        return StoredObject(bucket=bucket, key=key, size=size, sha256=digest, deduplicated=deduplicated)
+
+    async def open_stream(self, bucket: str, key: str) -> AsyncIterator[bytes]:
+        with self._path(bucket, key).open("rb") as fh:
+            while block := await asyncio.to_thread(fh.read, READ_BLOCK_SIZE):
+                yield block
+
+
+_EOF = object()
+
+
+class _QueueReader(io.RawIOBase):
+    """把异步侧推入队列的字节块暴露为同步文件对象，供 minio 客户端按分片读取。"""
+
+    def __init__(self, source: queue.Queue) -> None:
+        self._source = source
+        self._buffer = bytearray()
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            item = self._source.get()
+            if item is _EOF:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item  # minio 会中止（abort）本次分片上传
+            else:
+                self._buffer += item
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class MinioObjectStore:
+    """MinIO/S3 版对象存储：边收边以未知长度的分片上传写入暂存键，得到哈希后在服务端落到内容寻址键。
+
+    API 进程内只缓冲一个分片外加少量网络块，不落本地磁盘；目标键已存在时只删除暂存对象。
+    """
+
+    QUEUE_DEPTH = 4  # 上传线程落后时，异步侧最多积压的网络块数
+    MAX_COPY_SIZE = 5 * 1024**3  # 单次 CopyObject 的上限，更大的对象走服务端分片复制（compose）
+
+    def __init__(self, endpoint: str, access_key: str, secret_key: str, *, secure: bool, part_size: int) -> None:
+        from minio import Minio
+
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+        self.part_size = part_size
+        self._known_buckets: set[str] = set()
+        self._bucket_lock = threading.Lock()
+
+    def _ensure_bucket(self, bucket: str) -> None:
+        with self._bucket_lock:
+            if bucket in self._known_buckets:
+                return
+            if not self.client.bucket_exists(bucket):
+                self.client.make_bucket(bucket)
+            self._known_buckets.add(bucket)
+
+    def _exists(self, bucket: str, key: str) -> bool:
+        from minio.error import S3Error
+
+        try:
+            self.client.stat_object(bucket, key)
+        except S3Error as exc:
+            if exc.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise
+        return True
+
+    def _promote(self, bucket: str, staging_key: str, key: str, size: int) -> bool:
+        """把暂存对象复制到内容寻址键后删除；目标已存在时直接丢弃暂存对象。返回是否去重。"""
+
+        from minio.commonconfig import ComposeSource, CopySource
+
+        try:
+            if self._exists(bucket, key):
+                return True
+            if size <= self.MAX_COPY_SIZE:
+                self.client.copy_object(bucket, key, CopySource(bucket, staging_key))
+            else:
+                self.client.compose_object(bucket, key, [ComposeSource(bucket, staging_key)])
+            return False
+        finally:
+            self.client.remove_object(bucket, staging_key)
+
+    async def put_stream(self, bucket: str, chunks: AsyncIterator[bytes]) -> StoredObject:
+        await asyncio.to_thread(self._ensure_bucket, bucket)
+        staging_key = f".staging/{uuid4().hex}"
+        pending: queue.Queue = queue.Queue(maxsize=self.QUEUE_DEPTH)
+        upload = asyncio.ensure_future(
+            asyncio.to_thread(
+                self.client.put_object,
+                bucket,
+                staging_key,
+                _QueueReader(pending),
+                length=-1,
+                part_size=self.part_size,
+            ),
+        )
+
+        async def feed(item: object) -> None:
+            # 队列满时等待上传线程消费（背压）；上传线程异常退出时立即停止投递。
+            while True:
+                if upload.done():
+                    upload.result()
+                    raise RuntimeError("object upload finished before the stream ended")
+                try:
+                    pending.put_nowait(item)
+                    return
+                except queue.Full:
+                    await asyncio.sleep(0.005)
+
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            async for chunk in chunks:
+                hasher.update(chunk)
+                size += len(chunk)
+                await feed(chunk)
+            await feed(_EOF)
+            await upload
+        except BaseException as exc:
+            if not upload.done():
+                # 通知上传线程放弃：minio 会中止分片上传，不留下残缺对象。
+                await asyncio.to_thread(pending.put, exc if isinstance(exc, Exception) else RuntimeError("cancelled"))
+                await asyncio.gather(upload, return_exceptions=True)
+            raise
+
+        digest = hasher.hexdigest()
+        key = content_key(digest)
+        deduplicated = await asyncio.to_thread(self._promote, bucket, staging_key, key, size)
+        return StoredObject(bucket=bucket, key=key, size=size, sha256=digest, deduplicated=deduplicated)
+
+    async def open_stream(self, bucket: str, key: str) -> AsyncIterator[bytes]:
+        response = await asyncio.to_thread(self.client.get_object, bucket, key)
+        try:
+            blocks = response.stream(READ_BLOCK_SIZE)
+            while block := await asyncio.to_thread(next, blocks, b""):
+                yield block
+        finally:
+            response.close()
+            response.release_conn()
+
+
+@lru_cache(maxsize=1)
+def get_object_store() -> ObjectStore:
+    settings = get_settings()
+    if settings.object_store_backend == "local":
+        return LocalObjectStore(settings.object_store_local_dir)
+    if settings.object_store_backend == "minio":
+        return MinioObjectStore(
+            settings.minio_endpoint,
+            settings.minio_access_key,
+            settings.minio_secret_key,
+            secure=settings.minio_secure,
+            part_size=settings.upload_part_size,
+        )
+    raise ValueError(f"unknown object store backend: {settings.object_store_backend}")
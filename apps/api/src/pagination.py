@@ -0,0 +1,103 @@
+"""Relay 风格的游标（keyset）分页。
+
+所有列表统一按 ``(created_at, id)`` 倒序翻页：游标编码最后一条记录的排序键，
+下一页通过 ``(created_at, id) < cursor`` 直接在复合索引上定位，代价与翻到第几页无关（不使用 OFFSET）。
+"""
+
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Generic, TypeVar
+from uuid import UUID
+
+from pydantic import BaseModel
+from sqlalchemy import tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """解析游标，格式不合法时抛出 ValueError。"""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(f"invalid cursor: {cursor!r}") from exc
+
+
+@dataclass
+class Page(Generic[T]):
+    items: list[T]
+    cursors: list[str]
+    has_next_page: bool
+
+    @property
+    def end_cursor(self) -> str | None:
+        return self.cursors[-1] if self.cursors else None
+
+    def map(self, fn: Callable[[T], U]) -> Page[U]:
+        """转换每一项（例如 ORM 对象 -> 可缓存的 dict），游标与翻页信息保持不变。"""
+
+        return Page(items=[fn(item) for item in self.items], cursors=self.cursors, has_next_page=self.has_next_page)
+
+
+async def paginate(
+    session: AsyncSession,
+    statement: SelectOfScalar[T],
+    model: Any,
+    first: int = DEFAULT_PAGE_SIZE,
+    after: str | None = None,
+) -> Page[T]:
+    """对 ``select(model)`` 语句做 keyset 分页；``model`` 需要有 ``created_at`` 与 ``id`` 列。"""
+
+    first = max(1, min(first, MAX_PAGE_SIZE))
+    if after:
+        created_at, id = decode_cursor(after)
+        statement = statement.where(tuple_(model.created_at, model.id) < tuple_(created_at, id))
+    statement = statement.order_by(model.created_at.desc(), model.id.desc()).limit(first + 1)
+
+    rows = list((await session.exec(statement)).all())
+    items = rows[:first]
+    return Page(
+        items=items,
+        cursors=[encode_cursor(row.created_at, row.id) for row in items],  # type: ignore[attr-defined]
+        has_next_page=len(rows) > first,
+    )
+
+
+class PageInfo(BaseModel):
+    has_next_page: bool
+    end_cursor: str | None
+
+
+class Edge(BaseModel, Generic[T]):
+    cursor: str
+    node: T
+
+
+class Connection(BaseModel, Generic[T]):
+    edges: list[Edge[T]]
+    page_info: PageInfo
+
+    @classmethod
+    def from_page(cls, page: Page[Any], nodes: list[T]) -> "Connection[T]":
+        return cls(
+            edges=[{"cursor": cursor, "node": node} for cursor, node in zip(page.cursors, nodes)],
+            page_info=PageInfo(has_next_page=page.has_next_page, end_cursor=page.end_cursor),
+        )
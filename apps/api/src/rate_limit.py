@@ -0,0 +1,246 @@
+"""准入控制：按用户 / 智星的令牌桶限流，以及每个 worker 的在途生成数上限。
+
+- 令牌桶按 ``(场景, 用户)`` 与 ``(场景, 智星)`` 分别计数，一次请求需同时通过两个桶，任一不足则都不扣减；
+- 进程内桶是快速路径：本进程已超限的请求直接拒绝，不访问 Redis；
+- 配置了 Redis 时再由 Lua 脚本在 Redis 上原子地检查并扣减全局桶（时间取 Redis 的 ``TIME``，
+  不受各 worker 时钟偏差影响），多 worker 共享同一额度；Redis 不可用时退化为仅按进程内桶限流；
+- 超限时抛出 ``RateLimited``，路由转换为 429 + ``Retry-After``，而不是无限排队；
+- ``GenerationSlots`` 限制每个 worker 同时进行的生成数（含流式响应的整个推送过程），在途数与上限暴露为指标。
+
+用户默认按客户端 IP 识别；部署在会鉴权并覆盖写入 ``rate_limit_user_header`` 的网关之后时，
+打开 ``rate_limit_trust_user_header`` 改按该请求头识别。客户端自带的请求头不可信，不能作为限流依据。
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+
+import metrics
+from config import get_settings
+from redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# KEYS 为各个桶；ARGV[1] 为本次消耗，其后每个桶依次是 rate、burst。
+# 返回 {受限的桶序号（0 表示放行）, 需等待的秒数}；秒数以字符串返回，避免 Lua 数字被截断为整数。
+_TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local limiting, wait = 0, 0
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  levels[i] = tokens
+  if tokens < cost and (cost - tokens) / rate > wait then
+    limiting, wait = i, (cost - tokens) / rate
+  end
+end
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  local tokens = levels[i]
+  if limiting == 0 then
+    tokens = tokens - cost
+  end
+  redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+  redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {limiting, tostring(wait)}
+"""
+
+
+class RateLimited(RuntimeError):
+    """请求超过限流额度或 worker 已满载。"""
+
+    def __init__(self, message: str, retry_after: float, limit: str) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.limit = limit  # user / star / capacity
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def too_many_requests(exc: RateLimited) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(exc), headers=exc.headers)
+
+
+def client_key(conn: HTTPConnection) -> str:
+    """限流用的用户标识（HTTP 与 WebSocket 通用）：信任网关时取用户请求头，否则取客户端 IP。"""
+
+    settings = get_settings()
+    user = conn.headers.get(settings.rate_limit_user_header) if settings.rate_limit_trust_user_header else None
+    if user:
+        return f"user:{user}"
+    return f"ip:{conn.client.host if conn.client else 'unknown'}"
+
+
+@dataclass(frozen=True)
+class Limit:
+    rate: float  # 每秒补充的令牌数
+    burst: float  # 桶容量，即允许的突发请求数
+
+
+class TokenBuckets:
+    """进程内令牌桶；只在事件循环线程中使用。桶数超过 ``max_keys`` 时淘汰最久未用的桶（等价于重新装满）。"""
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (tokens, updated)
+
+    def _level(self, key: str, limit: Limit, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (limit.burst, now))
+        return min(limit.burst, tokens + max(0.0, now - updated) * limit.rate)
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def take(self, rules: Sequence[tuple[str, Limit]], cost: float = 1.0) -> tuple[int, float]:
+        """所有桶都有足够令牌时一起扣减并返回 (-1, 0)；否则都不扣减，返回 (受限的规则序号, 需等待的秒数)。"""
+
+        now = time.monotonic()
+        levels = [self._level(key, limit, now) for key, limit in rules]
+        limiting, wait = -1, 0.0
+        for i, ((_, limit), tokens) in enumerate(zip(rules, levels)):
+            if tokens < cost and (cost - tokens) / limit.rate > wait:
+                limiting, wait = i, (cost - tokens) / limit.rate
+        for (key, _), tokens in zip(rules, levels):
+            self._store(key, tokens if limiting >= 0 else tokens - cost, now)
+        return limiting, wait
+
+    def refund(self, rules: Sequence[tuple[str, Limit]], cost: float = 1.0) -> None:
+        now = time.monotonic()
+        for key, limit in rules:
+            self._store(key, min(limit.burst, self._level(key, limit, now) + cost), now)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, Limit], *, max_keys: int, enabled: bool = True, prefix: str = "ratelimit") -> None:
+        self.limits = limits  # "<场景>:user" / "<场景>:star" -> Limit
+        self.enabled = enabled
+        self.prefix = prefix
+        self.local = TokenBuckets(max_keys)
+        self._script: Any = None
+
+    def _rules(self, scope: str, user: str | None, star_id: UUID | None) -> list[tuple[str, str, Limit]]:
+        """返回 (类别, 桶 key, 额度) 列表；类别为 user / star。"""
+
+        rules = []
+        if user is not None and f"{scope}:user" in self.limits:
+            rules.append(("user", f"{scope}:{user}", self.limits[f"{scope}:user"]))
+        if star_id is not None and f"{scope}:star" in self.limits:
+            rules.append(("star", f"{scope}:star:{star_id}", self.limits[f"{scope}:star"]))
+        return rules
+
+    async def check(
+        self,
+        scope: str,
+        *,
+        user: str | None = None,
+        star_id: UUID | None = None,
+        cost: float = 1.0,
+    ) -> None:
+        """按场景检查并扣减用户与智星的额度；超限时抛出 RateLimited。"""
+
+        rules = self._rules(scope, user, star_id)
+        if not self.enabled or not rules:
+            return
+        buckets = [(key, limit) for _, key, limit in rules]
+        limiting, wait = self.local.take(buckets, cost)
+        if limiting < 0:
+            limiting, wait = await self._take_global(buckets, cost)
+            if limiting >= 0:
+                self.local.refund(buckets, cost)  # 全局拒绝的请求不占用本进程额度
+        if limiting >= 0:
+            kind = rules[limiting][0]
+            metrics.RATE_LIMITED.labels(scope, kind).inc()
+            raise RateLimited(f"{scope} rate limit exceeded for this {kind}, retry in {wait:.1f}s", wait, kind)
+
+    async def _take_global(self, rules: Sequence[tuple[str, Limit]], cost: float) -> tuple[int, float]:
+        redis = get_redis()
+        if redis is None:
+            return -1, 0.0
+        if self._script is None:
+            self._script = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+        args: list[Any] = [cost]
+        for _, limit in rules:
+            args += [limit.rate, limit.burst]
+        try:
+            limiting, wait = await self._script(keys=[f"{self.prefix}:{key}" for key, _ in rules], args=args)
+        except Exception:  # Redis 故障时按进程内额度放行，不影响请求
+            logger.warning("global rate limit check failed, falling back to local buckets", exc_info=True)
+            return -1, 0.0
+        return int(limiting) - 1, float(wait)
+
+
+class GenerationSlots:
+    """每个 worker 同时进行的生成数上限；满载时立即拒绝（RateLimited），不排队。"""
+
+    def __init__(self, limit: int, retry_after_s: float) -> None:
+        self.limit = limit  # 0 表示不限
+        self.retry_after_s = retry_after_s
+        self.in_flight = 0
+
+    def acquire(self) -> None:
+        if self.limit and self.in_flight >= self.limit:
+            metrics.RATE_LIMITED.labels("generation", "capacity").inc()
+            raise RateLimited(f"worker is at capacity ({self.limit} generations in flight)", self.retry_after_s, "capacity")
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+@lru_cache(maxsize=1)
+def get_rate_limiter() -> RateLimiter:
+    settings = get_settings()
+    return RateLimiter(
+        {
+            "chat:user": Limit(settings.rate_limit_chat_user_rate, settings.rate_limit_chat_user_burst),
+            "chat:star": Limit(settings.rate_limit_chat_star_rate, settings.rate_limit_chat_star_burst),
+            "upload:user": Limit(settings.rate_limit_upload_user_rate, settings.rate_limit_upload_user_burst),
+            "upload:star": Limit(settings.rate_limit_upload_star_rate, settings.rate_limit_upload_star_burst),
+            "backfill:user": Limit(settings.rate_limit_backfill_user_rate, settings.rate_limit_backfill_user_burst),
+            "backfill:star": Limit(settings.rate_limit_backfill_star_rate, settings.rate_limit_backfill_star_burst),
+        },
+        max_keys=settings.rate_limit_max_keys,
+        enabled=settings.rate_limit_enabled,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_generation_slots() -> GenerationSlots:
+    settings = get_settings()
+    slots = GenerationSlots(settings.max_inflight_generations, settings.generation_retry_after_s)
+    metrics.GENERATIONS_IN_FLIGHT.set_function(lambda: slots.in_flight)
+    metrics.GENERATION_SLOTS.set(slots.limit)
+    return slots
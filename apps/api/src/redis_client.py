@@ -0,0 +1,24 @@
+"""API 进程共享的 Redis 异步客户端。
+
+未配置 ``redis_url`` 时返回 None，依赖 Redis 的组件（如共享缓存）退化为进程内实现。
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from config import get_settings
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> Redis | None:
+    url = get_settings().redis_url
+    if not url:
+        return None
+    from redis.asyncio import Redis
+
+    return Redis.from_url(url, decode_responses=True, health_check_interval=30)
@@ -0,0 +1,241 @@
+"""对话回复缓存：同一颗智星被反复问到相同/相近的问题时，直接复用之前生成的回复。
+
+缓存键 = 智星 ID + 智星“口径指纹”（当前模型版本 + 名称/星域/人格设定）+ 上文哈希 + 归一化后的对话尾部：
+- 上文是尾部之前的全部消息（对话摘要 + 窗口内的历史），同一个问题在不同对话里的回复不会互相复用；
+- 精确层：对上文哈希与归一化后的对话尾部做哈希精确匹配；
+- 语义层（可选，``reply_cache_semantic_threshold`` 非空时启用）：只用于没有上文的首轮提问，在同一颗智星的
+  这类条目中按问题向量做余弦相似度匹配，超过阈值即命中；
+- 容量按条目数与字节数双重上限做 LRU 淘汰，条目另有 TTL；
+- 智星的模型版本或人格设定变化时（查询时发现口径指纹不同），该星的全部条目立即作废；
+  星尘入库完成后同样作废（检索上下文变了）。
+
+缓存在进程内，统计命中率与累计节省的生成耗时。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+
+import numpy as np
+
+from config import get_settings
+from models import Star
+from retrieval import embed_query
+
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = "?？!！.。~～、，,;；"
+
+
+def normalize(text: str) -> str:
+    """全角半角统一、大小写折叠、压缩空白并去掉句尾语气标点。"""
+
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", text).strip().rstrip(_TRAILING_PUNCTUATION).strip()
+
+
+def star_fingerprint(star: Star) -> str:
+    raw = f"{star.current_model_version}|{star.name}|{star.domain}|{star.persona or ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+@dataclass
+class _Entry:
+    star_id: UUID
+    reply: str
+    size: int
+    expires_at: float
+    latency: float  # 生成这条回复实际花费的时间，命中时计入“节省的耗时”
+    vector: np.ndarray | None
+
+
+class ReplyCache:
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        tail_messages: int = 1,
+        semantic_threshold: float | None = None,
+        semantic_per_star: int = 256,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.tail_messages = tail_messages
+        self.semantic_threshold = semantic_threshold
+        self.semantic_per_star = semantic_per_star
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._fingerprints: dict[UUID, str] = {}
+        self._by_star: dict[UUID, set[str]] = {}
+        # 每颗智星带向量的条目（按写入顺序），以及按需拼好的相似度矩阵
+        self._semantic: dict[UUID, OrderedDict[str, None]] = {}
+        self._matrices: dict[UUID, tuple[list[str], np.ndarray]] = {}
+        self._stats: Counter[str] = Counter()
+        self._saved_seconds = 0.0
+
+    def _split(self, messages: Sequence[Any]) -> tuple[str, str]:
+        """拆成 (上文哈希, 归一化后的尾部)；没有上文时哈希为空串。"""
+
+        cut = max(len(messages) - self.tail_messages, 0) if self.tail_messages > 0 else 0
+        tail = "\n".join(f"{m.role}:{normalize(m.content)}" for m in messages[cut:])
+        if not cut:
+            return "", tail
+        hasher = hashlib.sha256()
+        for m in messages[:cut]:
+            hasher.update(f"{m.role}:{m.content}\0".encode())
+        return hasher.hexdigest(), tail
+
+    def _key(self, star: Star, context: str, tail: str) -> str:
+        raw = f"{star.id}|{star_fingerprint(star)}|{context}|{tail}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _check_fingerprint(self, star: Star) -> None:
+        fingerprint = star_fingerprint(star)
+        previous = self._fingerprints.get(star.id)
+        if previous is not None and previous != fingerprint:
+            self.invalidate_star(star.id)
+        self._fingerprints[star.id] = fingerprint
+
+    # ---- 查询 ----
+
+    def lookup(self, star: Star, messages: Sequence[Any]) -> str | None:
+        self._check_fingerprint(star)
+        context, tail = self._split(messages)
+        key = self._key(star, context, tail)
+        now = time.monotonic()
+
+        entry = self._live(key, now)
+        if entry is not None:
+            self._stats["exact_hits"] += 1
+        elif self.semantic_threshold is not None and tail and not context:
+            entry = self._nearest(star.id, tail, now)
+            if entry is not None:
+                self._stats["semantic_hits"] += 1
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._saved_seconds += entry.latency
+        return entry.reply
+
+    def _live(self, key: str, now: float) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._stats["expired"] += 1
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, star_id: UUID, tail: str, now: float) -> _Entry | None:
+        keys = self._semantic.get(star_id)
+        if not keys:
+            return None
+        cached = self._matrices.get(star_id)
+        if cached is None:
+            ordered = list(keys)
+            cached = (ordered, np.stack([self._entries[k].vector for k in ordered]))  # type: ignore[misc]
+            self._matrices[star_id] = cached
+        ordered, matrix = cached
+        scores = matrix @ embed_query(tail)
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:  # type: ignore[operator]
+            return None
+        return self._live(ordered[best], now)
+
+    # ---- 写入与淘汰 ----
+
+    def store(self, star: Star, messages: Sequence[Any], reply: str, latency: float) -> None:
+        self._check_fingerprint(star)
+        context, tail = self._split(messages)
+        key = self._key(star, context, tail)
+        semantic = self.semantic_threshold is not None and tail and not context
+        vector = embed_query(tail) if semantic else None
+        size = len(reply.encode()) + len(key) + (vector.nbytes if vector is not None else 0)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(
+            star_id=star.id,
+            reply=reply,
+            size=size,
+            expires_at=time.monotonic() + self.ttl,
+            latency=latency,
+            vector=vector,
+        )
+        self._bytes += size
+        self._by_star.setdefault(star.id, set()).add(key)
+        self._stats["stores"] += 1
+        if vector is not None:
+            keys = self._semantic.setdefault(star.id, OrderedDict())
+            keys[key] = None
+            self._matrices.pop(star.id, None)
+            while len(keys) > self.semantic_per_star:
+                oldest, _ = keys.popitem(last=False)
+                self._entries[oldest].vector = None  # 只退出语义层，精确层仍可命中
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        star_keys = self._by_star[entry.star_id]
+        star_keys.discard(key)
+        if not star_keys:
+            del self._by_star[entry.star_id]
+        keys = self._semantic.get(entry.star_id)
+        if keys is not None and key in keys:
+            del keys[key]
+            self._matrices.pop(entry.star_id, None)
+            if not keys:
+                del self._semantic[entry.star_id]
+
+    def invalidate_star(self, star_id: UUID) -> None:
+        """作废某颗智星的全部缓存回复。"""
+
+        for key in list(self._by_star.get(star_id, ())):
+            self._remove(key)
+        self._stats["invalidations"] += 1
+
+    # ---- 统计 ----
+
+    def stats(self) -> dict[str, Any]:
+        hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **dict(self._stats),
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "saved_seconds": round(self._saved_seconds, 3),
+        }
+
+
+@lru_cache(maxsize=1)
+def get_reply_cache() -> ReplyCache:
+    settings = get_settings()
+    return ReplyCache(
+        max_entries=settings.reply_cache_max_entries,
+        max_bytes=settings.reply_cache_max_bytes,
+        ttl=settings.reply_cache_ttl_s,
+        tail_messages=settings.reply_cache_tail_messages,
+        semantic_threshold=settings.reply_cache_semantic_threshold,
+        semantic_per_star=settings.reply_cache_semantic_per_star,
+    )
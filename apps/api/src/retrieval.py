@@ -0,0 +1,58 @@
+"""对话检索：在智星的星尘索引中为当前问题做 top-k 检索（打包进提示词见 ``llm.pack_context``）。
+
+延迟控制：
+- 查询向量按文本做 LRU 缓存，重复/热门问题无需再次向量化；
+- 索引由 ``vector_index.open_index`` 按 LRU 常驻内存（活跃智星保持“热”）；
+- 检索整体受 ``retrieval_timeout_ms`` 约束，超时直接降级为无上下文回答，不拖慢对话。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from functools import lru_cache
+from uuid import UUID
+
+import numpy as np
+
+from config import get_settings
+from embeddings import get_embedder
+from vector_index import SearchHit, open_index
+
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+@lru_cache(maxsize=settings.retrieval_query_cache_size)
+def embed_query(text: str) -> np.ndarray:
+    vector = get_embedder().embed([text])[0]
+    vector.flags.writeable = False  # 缓存中的数组被多次复用，禁止原地修改
+    return vector
+
+
+def _search(star_id: UUID, query: str, k: int) -> list[SearchHit]:
+    index = open_index(star_id)
+    if not len(index):
+        return []
+    return index.search(embed_query(query.strip()), k)
+
+
+async def retrieve(star_id: UUID, query: str, k: int | None = None) -> list[SearchHit]:
+    """检索与问题最相关的星尘片段；超出延迟预算或出错时返回空列表。"""
+
+    k = k or settings.retrieval_top_k
+    try:
+        hits = await asyncio.wait_for(
+            asyncio.to_thread(_search, star_id, query, k),
+            timeout=settings.retrieval_timeout_ms / 1000,
+        )
+    except asyncio.TimeoutError:
+        logger.warning("retrieval for star %s exceeded %sms budget", star_id, settings.retrieval_timeout_ms)
+        return []
+    except Exception:  # 检索失败不应影响对话本身
+        logger.exception("retrieval for star %s failed", star_id)
+        return []
+    return [hit for hit in hits if hit.score >= settings.retrieval_min_score]
+
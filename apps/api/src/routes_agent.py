@@ -1,17 +1,30 @@
 from __future__ import annotations
 
-from typing import List
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any, List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import HTTPConnection
+from starlette.types import Receive, Scope, Send
 
+import conversations
 from db import get_session
-from llm import ChatMessage, generate_reply
-from models import Star
+from inference import SchedulerOverloaded
+from llm import ChatMessage, complete_reply, generate_reply
+from models import Conversation, ConversationFeedback, Star
+from rate_limit import GenerationSlots, RateLimited, client_key, get_generation_slots, get_rate_limiter, too_many_requests
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/agent/v1", tags=["agent"])
 
 
@@ -29,21 +42,379 @@ class ChatResponse(BaseModel):
     reply: str
 
 
+class SessionCreateRequest(BaseModel):
+    star_id: UUID
+    channel: str = "api"
+
+
+class SessionResponse(BaseModel):
+    conversation_id: UUID
+    star_id: UUID
+    channel: str
+    status: str
+    created_at: datetime
+
+
+class SessionMessageRequest(BaseModel):
+    content: str
+
+
+class SessionMessageResponse(BaseModel):
+    conversation_id: UUID
+    seq: int  # 本轮回复的序号
+    reply: str
+    compacted: bool
+
+
+class HistoryMessage(BaseModel):
+    seq: int
+    role: str
+    content: str
+    created_at: datetime
+
+
+class SessionHistoryResponse(BaseModel):
+    conversation_id: UUID
+    summary: str | None
+    summary_until_seq: int
+    messages: List[HistoryMessage]
+    next_before: int | None  # 传给下一页的 before；为空表示没有更早的消息
+
+
+class FeedbackRequest(BaseModel):
+    rating: int = Field(ge=1, le=5)
+    comment: str | None = None
+    labels: List[str] = []
+
+
+class FeedbackResponse(BaseModel):
+    id: UUID
+    conversation_id: UUID
+    rating: int
+    created_at: datetime
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_events(request: Request, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """把 token 流包装成 SSE 事件。
+
+    StreamingResponse 每发送一个事件都会等待底层传输写出，生成器因此受客户端消费速度约束；调度器为每个
+    流式请求只缓冲 ``inference_stream_buffer`` 个 token，缓冲满时暂停该序列的解码，背压一直传到推理批次；
+    客户端断开后立即停止迭代并关闭上游生成器，不再继续生成。
+    """
+
+    try:
+        async for token in tokens:
+            if await request.is_disconnected():
+                return
+            yield _sse("token", {"content": token})
+        yield _sse("done", {})
+    except SchedulerOverloaded as exc:
+        yield _sse("error", {"detail": str(exc)})
+    finally:
+        await tokens.aclose()  # type: ignore[attr-defined]
+
+
+class _GenerationStreamingResponse(StreamingResponse):
+    """占用生成名额的 SSE 响应：名额在响应结束时释放。
+
+    不能只靠 token 生成器的 finally：客户端在第一个事件发出前断开时生成器从未开始迭代，finally 不会执行。
+    """
+
+    def __init__(self, request: Request, tokens: AsyncIterator[str], slots: GenerationSlots) -> None:
+        super().__init__(
+            _sse_events(request, tokens),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self._tokens = tokens
+        self._slots = slots
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._slots.release()
+            await self._tokens.aclose()  # type: ignore[attr-defined]
+
+
+async def _admit(conn: HTTPConnection, star_id: UUID | None, *, user: bool = True) -> None:
+    """按用户与智星限流；先于数据库查询执行，被拒绝的请求不占用连接池。
+
+    智星要查库才能知道时先传 ``star_id=None`` 只检查用户，查到后再以 ``user=False`` 检查智星。
+    """
+
+    try:
+        await get_rate_limiter().check("chat", user=client_key(conn) if user else None, star_id=star_id)
+    except RateLimited as exc:
+        raise too_many_requests(exc) from exc
+
+
+def _acquire_generation() -> GenerationSlots:
+    """占用一个生成名额，调用方负责释放（流式响应交给 ``_GenerationStreamingResponse``）。"""
+
+    slots = get_generation_slots()
+    try:
+        slots.acquire()
+    except RateLimited as exc:
+        raise too_many_requests(exc) from exc
+    return slots
+
+
 @router.post("/chat", response_model=ChatResponse)
-def chat_with_star(payload: ChatRequest, session: Session = Depends(get_session)) -> ChatResponse:
+async def chat_with_star(
+    payload: ChatRequest,
+    request: Request,
+    stream: bool = Query(default=False, description="为 true 时以 SSE 流式返回 token"),
+    session: AsyncSession = Depends(get_session),
+):
     """为任意智星提供基础对话能力。
 
     - 查出 star；
-    - 调用 LLM 抽象层生成回复；
+    - 调用 LLM 抽象层生成回复，``stream=true`` 时按 token 以 SSE 推送；
+    - 超过用户 / 智星限流额度或本 worker 生成名额已满时返回 429 + Retry-After；
     - 未来可在此记录对话日志并触发 RL 训练事件。
     """
 
-    star = session.exec(select(Star).where(Star.id == payload.star_id)).first()
+    await _admit(request, payload.star_id)
+    star = await session.get(Star, payload.star_id)
     if not star:
         raise HTTPException(status_code=404, detail="star not found")
 
     messages = [ChatMessage(role=m.role, content=m.content) for m in payload.messages]
-    reply = generate_reply(star, messages)
+    slots = _acquire_generation()
+    if stream:
+        return _GenerationStreamingResponse(request, generate_reply(star, messages), slots)
+
+    try:
+        reply = await complete_reply(star, messages)
+    except SchedulerOverloaded as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    finally:
+        slots.release()
     return ChatResponse(reply=reply)
 
 
+async def _stream_over_websocket(websocket: WebSocket, tokens: AsyncIterator[str]) -> None:
+    """在 WebSocket 上推送一次回复，期间监听客户端的 cancel 消息与断开。"""
+
+    async def produce() -> None:
+        try:
+            async for token in tokens:
+                await websocket.send_json({"type": "token", "content": token})
+        except SchedulerOverloaded as exc:
+            await websocket.send_json({"type": "error", "detail": str(exc)})
+            return
+        await websocket.send_json({"type": "done"})
+
+    producer = asyncio.create_task(produce())
+    try:
+        while not producer.done():
+            listener = asyncio.create_task(websocket.receive_json())
+            done, _ = await asyncio.wait({producer, listener}, return_when=asyncio.FIRST_COMPLETED)
+            if listener not in done:
+                listener.cancel()
+                break
+            message = listener.result()  # 断开时抛出 WebSocketDisconnect，由 finally 负责取消生成
+            if message.get("type") == "cancel":
+                producer.cancel()
+                await websocket.send_json({"type": "cancelled"})
+                return
+            await websocket.send_json({"type": "error", "detail": "reply in progress"})
+        try:
+            await producer
+        except WebSocketDisconnect:
+            raise
+        except Exception as exc:
+            # 生成过程中的异常以 error 帧告知客户端，连接保持可用
+            logger.exception("websocket reply generation failed")
+            await websocket.send_json({"type": "error", "detail": f"reply generation failed: {type(exc).__name__}"})
+    finally:
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        await tokens.aclose()  # type: ignore[attr-defined]
+
+
+@router.websocket("/chat/ws")
+async def chat_with_star_ws(websocket: WebSocket, session: AsyncSession = Depends(get_session)) -> None:
+    """WebSocket 版对话：每条客户端消息为一个 ChatRequest，服务端按 token 推送。
+
+    推送期间客户端可发送 ``{"type": "cancel"}`` 中止本次生成；断开连接同样会中止生成。
+    """
+
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            try:
+                payload = ChatRequest.model_validate(data)
+            except ValidationError as exc:
+                await websocket.send_json({"type": "error", "detail": exc.errors(include_url=False, include_context=False)})
+                continue
+
+            try:
+                await get_rate_limiter().check("chat", user=client_key(websocket), star_id=payload.star_id)
+            except RateLimited as exc:
+                await websocket.send_json({"type": "error", "detail": str(exc), "retry_after": exc.retry_after})
+                continue
+
+            star = await session.get(Star, payload.star_id)
+            if not star:
+                await websocket.send_json({"type": "error", "detail": "star not found"})
+                continue
+
+            messages = [ChatMessage(role=m.role, content=m.content) for m in payload.messages]
+            try:
+                async with get_generation_slots().slot():
+                    await _stream_over_websocket(websocket, generate_reply(star, messages))
+            except RateLimited as exc:
+                await websocket.send_json({"type": "error", "detail": str(exc), "retry_after": exc.retry_after})
+    except WebSocketDisconnect:
+        return
+
+
+@router.post("/session", response_model=SessionResponse, status_code=201)
+async def create_session(payload: SessionCreateRequest, session: AsyncSession = Depends(get_session)):
+    """创建持久化会话。之后每轮只需提交新消息，历史与上下文窗口由服务端维护。"""
+
+    star = await session.get(Star, payload.star_id)
+    if not star:
+        raise HTTPException(status_code=404, detail="star not found")
+
+    conversation = Conversation(star_id=star.id, channel=payload.channel)
+    session.add(conversation)
+    await session.commit()
+    return SessionResponse(
+        conversation_id=conversation.id,
+        star_id=conversation.star_id,
+        channel=conversation.channel,
+        status=conversation.status,
+        created_at=conversation.created_at,
+    )
+
+
+async def _persist_on_completion(tokens: AsyncIterator[str], conversation_id: UUID, user_seq: int) -> AsyncIterator[str]:
+    """透传 token；回复完整生成后再落库。客户端中途断开时上游被关闭，未完成的回复不保存。"""
+
+    output: list[str] = []
+    try:
+        async for token in tokens:
+            output.append(token)
+            yield token
+    finally:
+        await tokens.aclose()  # type: ignore[attr-defined]
+    await conversations.finish_turn(conversation_id, user_seq, "".join(output))
+
+
+@router.post("/session/{conversation_id}/message", response_model=SessionMessageResponse)
+async def send_session_message(
+    conversation_id: UUID,
+    payload: SessionMessageRequest,
+    request: Request,
+    stream: bool = Query(default=False, description="为 true 时以 SSE 流式返回 token"),
+    session: AsyncSession = Depends(get_session),
+):
+    """在会话中发送一条消息。
+
+    上下文 = 滚动摘要 + 尚未折叠的尾部消息，每轮的数据库与提示词开销与会话长度无关。
+    按用户限流先于查询会话；按智星限流与生成名额在查到会话后、写入用户消息之前检查，被拒绝（429）的消息不会落库。
+    """
+
+    await _admit(request, None)
+    conversation = await session.get(Conversation, conversation_id)  # start_turn 随后从 identity map 取得，不再查询
+    if not conversation:
+        raise HTTPException(status_code=404, detail="conversation not found")
+    await _admit(request, conversation.star_id, user=False)
+
+    slots = _acquire_generation()
+    streaming = False
+    try:
+        try:
+            turn = await conversations.start_turn(session, conversation_id, payload.content)
+        except LookupError as exc:
+            raise HTTPException(status_code=404, detail="conversation not found") from exc
+        except conversations.ConversationClosed as exc:
+            raise HTTPException(status_code=409, detail="conversation is closed") from exc
+
+        star = await session.get(Star, turn.conversation.star_id)
+        if not star:
+            raise HTTPException(status_code=404, detail="star not found")
+
+        if stream:
+            tokens = _persist_on_completion(generate_reply(star, turn.messages), conversation_id, turn.user_seq)
+            streaming = True  # 名额随响应结束释放
+            return _GenerationStreamingResponse(request, tokens, slots)
+
+        try:
+            reply = await complete_reply(star, turn.messages)
+        except SchedulerOverloaded as exc:
+            raise HTTPException(status_code=503, detail=str(exc)) from exc
+    finally:
+        if not streaming:
+            slots.release()
+    compacted = await conversations.finish_turn(conversation_id, turn.user_seq, reply)
+    return SessionMessageResponse(
+        conversation_id=conversation_id,
+        seq=turn.user_seq + 1,
+        reply=reply,
+        compacted=compacted,
+    )
+
+
+@router.get("/session/{conversation_id}/history", response_model=SessionHistoryResponse)
+async def get_session_history(
+    conversation_id: UUID,
+    before: int | None = Query(default=None, ge=1, description="只返回 seq 小于该值的消息"),
+    limit: int = Query(default=50, ge=1, le=200),
+    session: AsyncSession = Depends(get_session),
+):
+    """按 seq 倒序分页返回完整消息记录，以及当前的滚动摘要。"""
+
+    try:
+        conversation, messages = await conversations.history(session, conversation_id, before, limit)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail="conversation not found") from exc
+
+    return SessionHistoryResponse(
+        conversation_id=conversation.id,
+        summary=conversation.summary,
+        summary_until_seq=conversation.summary_until_seq,
+        messages=[
+            HistoryMessage(seq=m.seq, role=m.role, content=m.content, created_at=m.created_at) for m in messages
+        ],
+        next_before=messages[-1].seq if len(messages) == limit else None,
+    )
+
+
+@router.post("/session/{conversation_id}/feedback", response_model=FeedbackResponse, status_code=201)
+async def submit_feedback(
+    conversation_id: UUID,
+    payload: FeedbackRequest,
+    session: AsyncSession = Depends(get_session),
+):
+    """提交会话评价。明细进入 conversation_feedback（训练数据导出读取），会话上保留最近一次评分。"""
+
+    conversation = await session.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="conversation not found")
+
+    feedback = ConversationFeedback(
+        conversation_id=conversation_id,
+        rating=payload.rating,
+        comment=payload.comment,
+        labels=payload.labels,
+    )
+    conversation.feedback_score = payload.rating
+    session.add(feedback)
+    session.add(conversation)
+    await session.commit()
+    return FeedbackResponse(
+        id=feedback.id,
+        conversation_id=conversation_id,
+        rating=feedback.rating,
+        created_at=feedback.created_at,
+    )
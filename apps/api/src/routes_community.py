@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import json
+from collections.abc import AsyncIterator
+from dataclasses import asdict
+from typing import Any
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from cache import TRIALS, get_cache, make_key
+from config import get_settings
 from db import get_session
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, Connection, Page, paginate
 from models import StarTrial
+from trial_runner import enroll, get_trial_runner
 
 
 router = APIRouter(prefix="/community/v1", tags=["community"])
@@ -31,17 +41,92 @@ class TrialListItem(BaseModel):
 
 
 @router.post("/trials", response_model=TrialCreateResponse)
-def create_trial(body: TrialCreateRequest, session: Session = Depends(get_session)) -> TrialCreateResponse:
+async def create_trial(body: TrialCreateRequest, session: AsyncSession = Depends(get_session)) -> TrialCreateResponse:
   trial = StarTrial(title=body.title, prompt=body.prompt, status="ongoing")
   session.add(trial)
-  session.commit()
-  session.refresh(trial)
+  await session.commit()
+  await get_cache().invalidate(TRIALS)
   return TrialCreateResponse(id=trial.id, title=trial.title, status=trial.status)
 
 
-@router.get("/trials", response_model=list[TrialListItem])
-def list_trials(session: Session = Depends(get_session)) -> list[TrialListItem]:
-  trials = session.exec(select(StarTrial).order_by(StarTrial.created_at.desc())).all()
-  return [TrialListItem(id=t.id, title=t.title, status=t.status) for t in trials]
-
-
+@router.get("/trials", response_model=Connection[TrialListItem])
+async def list_trials(
+  first: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  after: str | None = Query(default=None, description="上一页返回的 end_cursor"),
+  status: str | None = None,
+  session: AsyncSession = Depends(get_session),
+) -> Connection[TrialListItem]:
+  async def load() -> dict:
+    statement = select(StarTrial)
+    if status:
+      statement = statement.where(StarTrial.status == status)
+    page = await paginate(session, statement, StarTrial, first=first, after=after)
+    return asdict(page.map(lambda t: {"id": str(t.id), "title": t.title, "status": t.status}))
+
+  ttl = get_settings().cache_list_ttl_s
+  try:
+    page = Page(**await get_cache().get_or_load(TRIALS, make_key(status, first, after), load, ttl))
+  except ValueError as exc:
+    raise HTTPException(status_code=400, detail=str(exc)) from exc
+  return Connection[TrialListItem].from_page(page, [TrialListItem(**item) for item in page.items])
+
+
+class TrialJoinRequest(BaseModel):
+  star_ids: list[UUID] = Field(min_length=1, max_length=10_000)
+
+
+class TrialJoinResponse(BaseModel):
+  trial_id: UUID
+  enrolled: int
+  progress: dict
+
+
+@router.post("/trials/{trial_id}/join", response_model=TrialJoinResponse, status_code=202)
+async def join_trial(
+  trial_id: UUID,
+  body: TrialJoinRequest,
+  session: AsyncSession = Depends(get_session),
+) -> TrialJoinResponse:
+  """批量报名并在后台自动作答；重复报名与不存在的智星会被忽略。进度见 ``/trials/{id}/progress``。"""
+
+  try:
+    enrolled = await enroll(session, trial_id, body.star_ids)
+  except LookupError as exc:
+    raise HTTPException(status_code=404, detail="trial not found") from exc
+  run = get_trial_runner().start(trial_id, enrolled=enrolled)
+  return TrialJoinResponse(trial_id=trial_id, enrolled=enrolled, progress=run.snapshot())
+
+
+@router.post("/trials/{trial_id}/run", response_model=TrialJoinResponse, status_code=202)
+async def run_trial(
+  trial_id: UUID,
+  retry_failed: bool = Query(default=False, description="为 true 时把作答失败的条目重置为 pending 一并重试"),
+  session: AsyncSession = Depends(get_session),
+) -> TrialJoinResponse:
+  """续跑作答（例如进程重启后）：只处理仍为 pending 的条目。"""
+
+  if await session.get(StarTrial, trial_id) is None:
+    raise HTTPException(status_code=404, detail="trial not found")
+  run = get_trial_runner().start(trial_id, retry_failed=retry_failed)
+  return TrialJoinResponse(trial_id=trial_id, enrolled=0, progress=run.snapshot())
+
+
+@router.get("/trials/{trial_id}/progress")
+async def trial_progress(trial_id: UUID, request: Request) -> StreamingResponse:
+  """以 SSE 推送作答进度：每次批量落库后一个 ``progress`` 事件，结束时发送 ``done``。"""
+
+  async def events() -> AsyncIterator[str]:
+    async for snapshot in get_trial_runner().watch(trial_id):
+      if await request.is_disconnected():
+        return
+      yield _sse("done" if snapshot["done"] else "progress", snapshot)
+
+  return StreamingResponse(
+    events(),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+  )
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+  return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,56 +1,133 @@
 from __future__ import annotations
 
+from datetime import datetime
+from typing import Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, model_validator
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from cache import MAGNITUDE, get_cache
+from config import get_settings
 from db import get_session
-from models import KnowledgeTask, MagnitudeHistory
+from leaderboard import rank_of, top
 
 
 router = APIRouter(prefix="/evaluator/v1", tags=["evaluator"])
 
 
 class EvalRequest(BaseModel):
-    star_id: UUID
+    """三选一：单颗智星、一批智星或整个星域。"""
+
+    star_id: UUID | None = None
+    star_ids: list[UUID] | None = None
+    domain: str | None = None
+
+    @model_validator(mode="after")
+    def _one_target(self) -> EvalRequest:
+        if sum(target is not None for target in (self.star_id, self.star_ids, self.domain)) != 1:
+            raise ValueError("exactly one of star_id, star_ids or domain is required")
+        if self.star_ids is not None and not 0 < len(self.star_ids) <= get_settings().evaluation_max_star_ids:
+            raise ValueError(f"star_ids must contain 1-{get_settings().evaluation_max_star_ids} ids")
+        return self
 
 
 class EvalResponse(BaseModel):
     star_id: UUID
     overall: float
     level: str
+    depth: float | None = None
+    originality: float | None = None
+    consistency: float | None = None
+    utility: float | None = None
 
 
-@router.post("/run", response_model=EvalResponse)
-def run_evaluation(body: EvalRequest, session: Session = Depends(get_session)) -> EvalResponse:
-    """最小“评估”：根据星尘任务数量给出一个简单分数并记录一条历史。
+class EvalRunResponse(BaseModel):
+    evaluated: int
+    items: list[EvalResponse]
+
+
+LeaderboardWindow = Literal["all", "30d", "7d", "1d"]
+
+
+class LeaderboardItem(BaseModel):
+    rank: int
+    star_id: UUID
+    name: str
+    domain: str
+    overall: float
+    level: str
+    evaluated_at: datetime
 
-    - 真实版本会调用自动评估脚本，对回答样本做打分；
-    - 这里先用 knowledge_task 数量映射到 0-5 分，再映射到 L1-L5。
-    """
 
-    task_count = session.exec(
-        select(KnowledgeTask).where(KnowledgeTask.star_id == body.star_id),
-    ).count()
+class LeaderboardResponse(BaseModel):
+    domain: str | None
+    window: str
+    items: list[LeaderboardItem]
 
-    overall = min(5.0, 1.0 + task_count * 0.5)
-    if overall >= 4.5:
-        level = "L5"
-    elif overall >= 3.5:
-        level = "L4"
-    elif overall >= 2.5:
-        level = "L3"
-    elif overall >= 1.5:
-        level = "L2"
-    else:
-        level = "L1"
 
-    record = MagnitudeHistory(star_id=body.star_id, overall=overall, level=level)
-    session.add(record)
-    session.commit()
+class RankResponse(BaseModel):
+    star_id: UUID
+    domain: str | None
+    window: str
+    rank: int | None
+    overall: float | None
+    total: int
+
 
-    return EvalResponse(star_id=body.star_id, overall=overall, level=level)
+@router.post("/run", response_model=EvalRunResponse)
+async def run_evaluation(body: EvalRequest, session: AsyncSession = Depends(get_session)) -> EvalRunResponse:
+    """批量评估：一次聚合查询取得整批输入，向量化打分，评估历史与最新星等批量写入。
 
+    - 真实版本会调用自动评估脚本，对回答样本做打分；
+    - 打分规则见 ``scoring``；单颗智星不存在时返回 404，批量与星域评估忽略不存在的智星。
+    """
 
+    from scoring import evaluate  # 打分依赖 numpy，首次评估时加载
+
+    settings = get_settings()
+    star_ids = [body.star_id] if body.star_id is not None else body.star_ids
+    records = await evaluate(session, star_ids=star_ids, domain=body.domain, batch_size=settings.evaluation_batch_size)
+    if body.star_id is not None and not records:
+        raise HTTPException(status_code=404, detail=f"star {body.star_id} not found")
+
+    if len(records) == 1:
+        await get_cache().invalidate(MAGNITUDE, str(records[0].star_id))
+    elif records:
+        await get_cache().invalidate(MAGNITUDE)
+    return EvalRunResponse(
+        evaluated=len(records),
+        items=[EvalResponse(**record.model_dump(exclude={"id", "evaluated_at"})) for record in records],
+    )
+
+
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    domain: str | None = Query(default=None, description="星域；为空时为全站榜"),
+    window: LeaderboardWindow = "all",
+    limit: int = Query(default=50, ge=1, le=200),
+    offset: int = Query(default=0, ge=0, le=10000),
+    session: AsyncSession = Depends(get_session),
+) -> LeaderboardResponse:
+    """星等榜单：按最新一次评估的 overall 倒序，时间窗口按最近评估时间过滤。"""
+
+    entries = await top(session, domain=domain, window=window, limit=limit, offset=offset)
+    return LeaderboardResponse(
+        domain=domain,
+        window=window,
+        items=[LeaderboardItem(**vars(entry)) for entry in entries],
+    )
+
+
+@router.get("/leaderboard/{star_id}/rank", response_model=RankResponse)
+async def get_star_rank(
+    star_id: UUID,
+    domain: str | None = None,
+    window: LeaderboardWindow = "all",
+    session: AsyncSession = Depends(get_session),
+) -> RankResponse:
+    """查询某颗智星在指定榜单中的名次。"""
+
+    result = await rank_of(session, star_id, domain=domain, window=window)
+    return RankResponse(domain=domain, window=window, **vars(result))
@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import json
+from collections import Counter
+from collections.abc import AsyncIterator, Iterable
+from datetime import datetime
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from sqlmodel import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from config import get_settings
 from db import get_session
 from models import KnowledgeTask
+from multipart_stream import MultipartError, PartData, PartEnd, PartStart, iter_multipart, multipart_boundary
+from object_store import StoredObject, check_payload_uri, get_object_store
+from rate_limit import RateLimited, client_key, get_rate_limiter, too_many_requests
 
 
 router = APIRouter(prefix="/knowledge/v1", tags=["knowledge"])
@@ -17,32 +26,342 @@ class IngestRequest(BaseModel):
     star_id: UUID
     source_type: str = "upload"
     payload_uri: str | None = None
+    content: str | None = None  # 直接随请求提交的短文本（如笔记），无需先落对象存储
 
 
 class IngestResponse(BaseModel):
     task_id: UUID
     status: str
+    payload_uri: str | None = None
+    content_hash: str | None = None
+    deduplicated: bool = False
+
+
+class BatchIngestRequest(BaseModel):
+    items: list[IngestRequest]
+
+
+class BatchIngestResponse(BaseModel):
+    task_ids: list[UUID]
+    status: str
+
+
+class TaskStatusResponse(BaseModel):
+    task_id: UUID
+    star_id: UUID
+    status: str
+    payload_uri: str | None
+    content_hash: str | None
+    chunk_count: int
+    embedding_index: str | None
+    error: str | None
+    created_at: datetime
+    completed_at: datetime | None
+
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+async def _admit(request: Request, star_id: UUID | None = None) -> None:
+    """上传限流：不带 star_id 时按用户检查（在读取请求体之前），带 star_id 时按智星检查。"""
 
+    try:
+        if star_id is None:
+            await get_rate_limiter().check("upload", user=client_key(request))
+        else:
+            await get_rate_limiter().check("upload", star_id=star_id)
+    except RateLimited as exc:
+        raise too_many_requests(exc) from exc
 
-@router.post("/uploads", response_model=IngestResponse)
-def ingest_knowledge(body: IngestRequest, session: Session = Depends(get_session)) -> IngestResponse:
-    """最小实现：创建一条 knowledge_task，立即标记为 completed。
 
-    后续可以在这里：
-    - 将原始内容写入 MinIO；
-    - 推送向量化任务到队列；
-    - 触发 RL Trainer 的事件。
+async def check_backfill_limits(request: Request, star_ids: Iterable[UUID]) -> None:
+    """批量回填按条目扣减额度：用户扣除总条数，每颗涉及的智星扣除各自的条数。超限时抛出 RateLimited。
+
+    REST 与 GraphQL 的批量入库共用。
+    """
+
+    counts = Counter(star_ids)
+    limiter = get_rate_limiter()
+    await limiter.check("backfill", user=client_key(request), cost=sum(counts.values()))
+    for star_id, count in counts.items():
+        await limiter.check("backfill", star_id=star_id, cost=count)
+
+
+def _check_payload_uris(items: list[IngestRequest]) -> None:
+    """``payload_uri`` 只能引用上传接口写入的对象，其他地址（本地路径、其他桶等）返回 400。"""
+
+    for i, item in enumerate(items):
+        if item.payload_uri is None:
+            continue
+        try:
+            check_payload_uri(item.payload_uri)
+        except ValueError as exc:
+            detail = str(exc) if len(items) == 1 else f"item {i}: {exc}"
+            raise HTTPException(status_code=400, detail=detail) from exc
+
+
+def _form_star_id(fields: dict[str, str]) -> UUID:
+    if "star_id" not in fields:
+        raise HTTPException(status_code=422, detail="star_id must precede the file part")
+    try:
+        return UUID(fields["star_id"])
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail="star_id is not a valid UUID") from exc
+
+
+async def _receive_upload(request: Request, boundary: bytes) -> tuple[IngestRequest, StoredObject]:
+    """流式接收 multipart 上传：文件部分边收边写入 knowledge-raw 桶，其余部分作为表单字段。
+
+    ``star_id`` 字段须出现在文件部分之前，以便在接收文件前完成智星维度的限流。
     """
 
+    settings = get_settings()
+    events = iter_multipart(request.stream(), boundary)
+    fields: dict[str, str] = {}
+    stored: StoredObject | None = None
+    name: str | None = None
+    value = bytearray()
+
+    async def file_data() -> AsyncIterator[bytes]:
+        # 与外层循环共享同一个事件流，读到该文件部分结束为止；超过大小上限时中止，对象存储不会留下该对象。
+        size = 0
+        async for event in events:
+            if isinstance(event, PartEnd):
+                return
+            if isinstance(event, PartData):
+                size += len(event.data)
+                if size > settings.upload_max_bytes:
+                    raise HTTPException(status_code=413, detail=f"file exceeds {settings.upload_max_bytes} bytes")
+                yield event.data
+
+    try:
+        async for event in events:
+            if isinstance(event, PartStart):
+                if event.filename is None:
+                    name = event.name
+                    value.clear()
+                    continue
+                if stored is not None:
+                    raise HTTPException(status_code=422, detail="only one file per upload")
+                # 先按智星限流再接收文件：被拒绝的上传不写入对象存储
+                await _admit(request, _form_star_id(fields))
+                stored = await get_object_store().put_stream(settings.knowledge_raw_bucket, file_data())
+            elif isinstance(event, PartData):
+                value.extend(event.data)
+                if len(value) > MAX_FIELD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"form field {name!r} is too large")
+            elif name is not None:
+                fields[name] = value.decode("utf-8", "replace")
+                name = None
+    except MultipartError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    if stored is None:
+        raise HTTPException(status_code=422, detail="multipart upload requires a file part")
+    try:
+        body = IngestRequest.model_validate({**fields, "payload_uri": stored.uri, "content": None})
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=json.loads(exc.json(include_url=False))) from exc
+    return body, stored
+
+
+@router.post(
+    "/uploads",
+    response_model=IngestResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": IngestRequest.model_json_schema()},
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["star_id", "file"],
+                        "properties": {
+                            "star_id": {"type": "string", "format": "uuid"},
+                            "source_type": {"type": "string", "default": "upload"},
+                            "file": {"type": "string", "format": "binary"},
+                        },
+                    },
+                },
+            },
+        },
+    },
+)
+async def ingest_knowledge(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session),
+) -> IngestResponse:
+    """创建一条 knowledge_task（pending），由后台流水线完成切块、向量化与入索引。
+
+    - JSON：引用此前上传得到的 ``payload_uri``（``s3://knowledge-raw/sha256/...``）或直接携带短文本 ``content``；
+    - multipart/form-data：原始文件以固定大小分片流式写入对象存储，边传边计算 SHA-256，
+      同一颗智星重复上传相同内容时直接返回已有任务；
+    - 超过用户 / 智星的上传额度时返回 429 + Retry-After。
+    """
+
+    await _admit(request)
+    try:
+        boundary = multipart_boundary(request.headers.get("content-type", ""))
+    except MultipartError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    content_hash: str | None = None
+    if boundary is not None:
+        body, stored = await _receive_upload(request, boundary)
+        content_hash = stored.sha256
+    else:
+        try:
+            body = IngestRequest.model_validate_json(await request.body())
+        except ValidationError as exc:
+            raise HTTPException(status_code=422, detail=json.loads(exc.json(include_url=False))) from exc
+        _check_payload_uris([body])
+        await _admit(request, body.star_id)
+
+    if content_hash:
+        existing = (
+            await session.exec(
+                select(KnowledgeTask)
+                .where(
+                    KnowledgeTask.star_id == body.star_id,
+                    KnowledgeTask.content_hash == content_hash,
+                    KnowledgeTask.status != "failed",
+                )
+                .limit(1),
+            )
+        ).first()
+        if existing:
+            return IngestResponse(
+                task_id=existing.id,
+                status=existing.status,
+                payload_uri=existing.payload_uri,
+                content_hash=existing.content_hash,
+                deduplicated=True,
+            )
+
     task = KnowledgeTask(
         star_id=body.star_id,
         source_type=body.source_type,
         payload_uri=body.payload_uri,
-        status="completed",
+        content_hash=content_hash,
+        status="pending",
     )
     session.add(task)
-    session.commit()
-    session.refresh(task)
-    return IngestResponse(task_id=task.id, status=task.status)
+    await session.commit()
+    from ingestion import run_ingestion  # 入库流水线依赖向量化与索引，首次使用时加载
+
+    background_tasks.add_task(run_ingestion, task.id, body.content)
+    return IngestResponse(
+        task_id=task.id,
+        status=task.status,
+        payload_uri=task.payload_uri,
+        content_hash=task.content_hash,
+    )
+
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+_batch_adapter = TypeAdapter(list[IngestRequest] | BatchIngestRequest)
+
+
+async def _read_batch(request: Request) -> list[IngestRequest]:
+    """解析批量上传请求体：NDJSON（逐行流式解析）或 JSON（数组 / ``{"items": [...]}``）。"""
 
+    limit = get_settings().ingest_batch_max_items
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
 
+    if content_type in NDJSON_MEDIA_TYPES:
+        items: list[IngestRequest] = []
+        buffer = b""
+        line_no = 0
+
+        def parse(line: bytes) -> None:
+            nonlocal line_no
+            line_no += 1
+            if not line.strip():
+                return
+            if len(items) >= limit:
+                raise HTTPException(status_code=413, detail=f"batch exceeds {limit} items")
+            try:
+                items.append(IngestRequest.model_validate_json(line))
+            except ValidationError as exc:
+                raise HTTPException(status_code=422, detail=f"line {line_no}: {exc.errors(include_url=False)}") from exc
+
+        async for block in request.stream():
+            buffer += block
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                parse(line)
+        parse(buffer)
+        return items
+
+    try:
+        parsed = _batch_adapter.validate_json(await request.body())
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=json.loads(exc.json(include_url=False))) from exc
+    items = parsed.items if isinstance(parsed, BatchIngestRequest) else parsed
+    if len(items) > limit:
+        raise HTTPException(status_code=413, detail=f"batch exceeds {limit} items")
+    return items
+
+
+@router.post(
+    "/uploads:batch",
+    response_model=BatchIngestResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": IngestRequest.model_json_schema()}},
+                "application/x-ndjson": {"schema": {"type": "string", "description": "每行一个 IngestRequest"}},
+            },
+        },
+    },
+)
+async def ingest_knowledge_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session),
+) -> BatchIngestResponse:
+    """批量回填星尘：所有任务一次多行 INSERT 落库，并作为一个后台批次统一调度处理。
+
+    超过用户 / 智星的回填额度（按条目计）时返回 429 + Retry-After。
+    """
+
+    from ingestion import IngestItem, create_tasks, run_ingestion_batch
+
+    await _admit(request)
+    items = await _read_batch(request)
+    _check_payload_uris(items)
+    try:
+        await check_backfill_limits(request, (i.star_id for i in items))
+    except RateLimited as exc:
+        raise too_many_requests(exc) from exc
+    task_ids = await create_tasks(
+        session,
+        [IngestItem(star_id=i.star_id, source_type=i.source_type, payload_uri=i.payload_uri) for i in items],
+    )
+    if task_ids:
+        background_tasks.add_task(run_ingestion_batch, list(zip(task_ids, (i.content for i in items))))
+    return BatchIngestResponse(task_ids=task_ids, status="pending")
+
+
+@router.get("/tasks/{task_id}", response_model=TaskStatusResponse)
+async def get_task(task_id: UUID, session: AsyncSession = Depends(get_session)) -> TaskStatusResponse:
+    """查询解析/嵌入进度。"""
+
+    task = await session.get(KnowledgeTask, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="task not found")
+    return TaskStatusResponse(
+        task_id=task.id,
+        star_id=task.star_id,
+        status=task.status,
+        payload_uri=task.payload_uri,
+        content_hash=task.content_hash,
+        chunk_count=task.chunk_count,
+        embedding_index=task.embedding_index,
+        error=task.error,
+        created_at=task.created_at,
+        completed_at=task.completed_at,
+    )
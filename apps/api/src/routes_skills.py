@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+from dataclasses import asdict
+from typing import Any
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from cache import SKILLS, get_cache, make_key
+from config import get_settings
 from db import get_session
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, Connection, Page, paginate
 from models import Skill
+from skill_gateway import SkillError, SkillTimeout, SkillUnavailable, get_skill_gateway
 
 
 router = APIRouter(prefix="/skills/v1", tags=["skills"])
@@ -17,6 +24,10 @@ class SkillCreateRequest(BaseModel):
   name: str
   description: str | None = None
   api_endpoint: str | None = None
+  timeout_ms: int | None = Field(default=None, ge=1, le=60_000)
+  max_concurrency: int | None = Field(default=None, ge=1, le=10_000)
+  idempotent: bool = False
+  cache_ttl_s: float | None = Field(default=None, gt=0)
 
 
 class SkillCreateResponse(BaseModel):
@@ -32,17 +43,83 @@ class SkillListItem(BaseModel):
 
 
 @router.post("", response_model=SkillCreateResponse)
-def register_skill(body: SkillCreateRequest, session: Session = Depends(get_session)) -> SkillCreateResponse:
-  skill = Skill(name=body.name, description=body.description, api_endpoint=body.api_endpoint, status="published")
+async def register_skill(body: SkillCreateRequest, session: AsyncSession = Depends(get_session)) -> SkillCreateResponse:
+  skill = Skill(**body.model_dump(), status="published")
   session.add(skill)
-  session.commit()
-  session.refresh(skill)
+  await session.commit()
+  await get_cache().invalidate(SKILLS)
   return SkillCreateResponse(id=skill.id, name=skill.name, status=skill.status)
 
 
-@router.get("", response_model=list[SkillListItem])
-def list_skills(session: Session = Depends(get_session)) -> list[SkillListItem]:
-  skills = session.exec(select(Skill).order_by(Skill.created_at.desc())).all()
-  return [SkillListItem(id=s.id, name=s.name, status=s.status) for s in skills]
+@router.get("", response_model=Connection[SkillListItem])
+async def list_skills(
+  first: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  after: str | None = Query(default=None, description="上一页返回的 end_cursor"),
+  status: str | None = None,
+  session: AsyncSession = Depends(get_session),
+) -> Connection[SkillListItem]:
+  async def load() -> dict:
+    statement = select(Skill)
+    if status:
+      statement = statement.where(Skill.status == status)
+    page = await paginate(session, statement, Skill, first=first, after=after)
+    return asdict(page.map(lambda s: {"id": str(s.id), "name": s.name, "status": s.status}))
 
+  ttl = get_settings().cache_list_ttl_s
+  try:
+    page = Page(**await get_cache().get_or_load(SKILLS, make_key(status, first, after), load, ttl))
+  except ValueError as exc:
+    raise HTTPException(status_code=400, detail=str(exc)) from exc
+  return Connection[SkillListItem].from_page(page, [SkillListItem(**item) for item in page.items])
 
+
+class SkillInvokeRequest(BaseModel):
+  input: Any = None
+
+
+class SkillInvokeResponse(BaseModel):
+  skill_id: UUID
+  output: Any = None
+  status_code: int | None = None
+  error: str | None = None
+  cached: bool = False
+  elapsed_ms: float
+
+
+class SkillCall(BaseModel):
+  skill_id: UUID
+  input: Any = None
+
+
+class SkillBatchInvokeRequest(BaseModel):
+  calls: list[SkillCall] = Field(min_length=1)
+
+
+class SkillBatchInvokeResponse(BaseModel):
+  results: list[SkillInvokeResponse]
+
+
+@router.post("/invoke", response_model=SkillBatchInvokeResponse)
+async def invoke_skills(body: SkillBatchInvokeRequest) -> SkillBatchInvokeResponse:
+  """一轮对话用到多个星技时并发调用；单个星技失败时对应结果带 ``error``，不影响其它结果。"""
+
+  if len(body.calls) > get_settings().skill_max_fanout:
+    raise HTTPException(status_code=400, detail=f"at most {get_settings().skill_max_fanout} calls per request")
+  results = await get_skill_gateway().invoke_many([(call.skill_id, call.input) for call in body.calls])
+  return SkillBatchInvokeResponse(results=[SkillInvokeResponse(**asdict(result)) for result in results])
+
+
+@router.post("/{skill_id}/invoke", response_model=SkillInvokeResponse)
+async def invoke_skill(skill_id: UUID, body: SkillInvokeRequest) -> SkillInvokeResponse:
+  """经调用网关调用星技：熔断时 503，超时 504，星技自身出错 502，星技拒绝请求时透传其 4xx。"""
+
+  try:
+    result = await get_skill_gateway().invoke(skill_id, body.input)
+  except SkillUnavailable as exc:
+    raise HTTPException(status_code=exc.status_code or 503, detail=str(exc)) from exc
+  except SkillTimeout as exc:
+    raise HTTPException(status_code=504, detail=str(exc)) from exc
+  except SkillError as exc:
+    status = exc.status_code if exc.status_code and 400 <= exc.status_code < 500 else 502
+    raise HTTPException(status_code=status, detail=str(exc)) from exc
+  return SkillInvokeResponse(**asdict(result))
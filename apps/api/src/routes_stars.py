@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import get_settings
+from db import get_session
+from models import Star
+from timeline import timeline
+
+
+router = APIRouter(prefix="/stars/v1", tags=["stars"])
+
+
+class TimelinePointItem(BaseModel):
+    t: datetime
+    overall: float
+    level: str
+    min: float
+    max: float
+    samples: int
+
+
+class TimelineResponse(BaseModel):
+    star_id: UUID
+    start: datetime
+    end: datetime
+    resolution: str
+    points: list[TimelinePointItem]
+
+
+@router.get("/{star_id}/timeline", response_model=TimelineResponse)
+async def get_timeline(
+    star_id: UUID,
+    start: datetime | None = Query(default=None, description="起始时间（UTC），默认 end 之前 timeline_default_span_days 天"),
+    end: datetime | None = Query(default=None, description="结束时间（UTC，不含），默认当前时间"),
+    points: int | None = Query(default=None, ge=3, description="最多返回的点数，服务端用 LTTB 降采样"),
+    resolution: Literal["auto", "raw", "hour", "day"] = "auto",
+    session: AsyncSession = Depends(get_session),
+) -> TimelineResponse:
+    """星等时间线：按跨度自动选择原始记录或按小时 / 按天汇总，再降采样到 ``points`` 个点。"""
+
+    settings = get_settings()
+    points = min(points or settings.timeline_default_points, settings.timeline_max_points)
+    # 库中时间统一为 naive UTC
+    end = _to_naive_utc(end) if end is not None else datetime.utcnow()
+    start = _to_naive_utc(start) if start is not None else end - timedelta(days=settings.timeline_default_span_days)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be earlier than end")
+
+    used, series = await timeline(
+        session,
+        star_id,
+        start,
+        end,
+        points,
+        resolution=resolution,
+        max_raw_rows=settings.timeline_max_raw_rows,
+    )
+    if not series and await session.get(Star, star_id) is None:
+        raise HTTPException(status_code=404, detail="star not found")
+    return TimelineResponse(
+        star_id=star_id,
+        start=start,
+        end=end,
+        resolution=used,
+        points=[TimelinePointItem(**vars(point)) for point in series],
+    )
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return (value - value.utcoffset()).replace(tzinfo=None)  # type: ignore[operator]
@@ -0,0 +1,154 @@
+"""星等评估引擎：一次聚合查询取得一批智星的评估输入，NumPy 向量化打分，批量写入评估历史。
+
+四个维度（均为 1-5 分）：
+- depth：星尘积累，1 + 0.5 × 星尘任务数；
+- originality：星尘来源的多样性，1 + 来源类型数；
+- consistency：星尘入库成功率，1 + 4 × 已完成 / 全部任务；
+- utility：星试作答成功率，1 + 4 × 已作答 / 报名条目。
+
+overall 为各维度按 ``WEIGHTS`` 加权求和，再按 ``LEVEL_THRESHOLDS`` 映射到 L1-L5。
+REST 与 GraphQL 的评估入口都调用 ``evaluate``，映射规则只在此处维护。
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import case, distinct, func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from leaderboard import record_magnitudes
+from models import KnowledgeTask, MagnitudeHistory, Star, TrialEntry
+
+
+DIMENSIONS = ("depth", "originality", "consistency", "utility")
+WEIGHTS = np.array([0.4, 0.2, 0.2, 0.2])
+LEVELS = np.array(["L1", "L2", "L3", "L4", "L5"])
+LEVEL_THRESHOLDS = np.array([1.5, 2.5, 3.5, 4.5])  # overall >= 阈值即进入下一级
+
+
+@dataclass
+class Scores:
+    star_ids: list[UUID]
+    dimensions: np.ndarray  # (n, len(DIMENSIONS))
+    overall: np.ndarray
+    levels: np.ndarray
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def score(star_ids: list[UUID], inputs: np.ndarray) -> Scores:
+    """对一批智星打分。``inputs`` 的列依次为：任务数、已完成任务数、来源类型数、报名条目数、已作答条目数。"""
+
+    tasks, completed, sources, entries, answered = inputs.astype(np.float64).T
+    dimensions = np.column_stack(
+        (
+            1.0 + 0.5 * tasks,
+            1.0 + sources,
+            1.0 + 4.0 * _ratio(completed, tasks),
+            1.0 + 4.0 * _ratio(answered, entries),
+        ),
+    )
+    np.clip(dimensions, 1.0, 5.0, out=dimensions)
+    overall = np.round(dimensions @ WEIGHTS, 2)
+    levels = LEVELS[np.searchsorted(LEVEL_THRESHOLDS, overall, side="right")]
+    return Scores(star_ids=star_ids, dimensions=np.round(dimensions, 2), overall=overall, levels=levels)
+
+
+def _inputs_statement(star_filter: Any) -> Any:
+    # 两张明细表先在子查询内按 star_id 聚合（各自只扫描本批智星的行），再与 stars 左连接，一次往返取回整批输入
+    tasks = (
+        select(
+            KnowledgeTask.star_id,
+            func.count().label("tasks"),
+            func.sum(case((KnowledgeTask.status == "completed", 1), else_=0)).label("completed"),
+            func.count(distinct(KnowledgeTask.source_type)).label("sources"),
+        )
+        .where(KnowledgeTask.star_id.in_(star_filter))  # type: ignore[attr-defined]
+        .group_by(KnowledgeTask.star_id)
+        .subquery()
+    )
+    entries = (
+        select(
+            TrialEntry.star_id,
+            func.count().label("entries"),
+            func.sum(case((TrialEntry.status == "answered", 1), else_=0)).label("answered"),
+        )
+        .where(TrialEntry.star_id.in_(star_filter))  # type: ignore[attr-defined]
+        .group_by(TrialEntry.star_id)
+        .subquery()
+    )
+    return (
+        select(
+            Star.id,
+            func.coalesce(tasks.c.tasks, 0),
+            func.coalesce(tasks.c.completed, 0),
+            func.coalesce(tasks.c.sources, 0),
+            func.coalesce(entries.c.entries, 0),
+            func.coalesce(entries.c.answered, 0),
+        )
+        .outerjoin(tasks, tasks.c.star_id == Star.id)
+        .outerjoin(entries, entries.c.star_id == Star.id)
+        .where(Star.id.in_(star_filter))  # type: ignore[attr-defined]
+        .order_by(Star.id)
+    )
+
+
+async def _evaluate_batch(session: AsyncSession, star_filter: Any) -> list[MagnitudeHistory]:
+    rows = (await session.exec(_inputs_statement(star_filter))).all()
+    if not rows:
+        return []
+    scores = score([row[0] for row in rows], np.array([row[1:] for row in rows]))
+    now = datetime.utcnow()
+    records = [
+        MagnitudeHistory(
+            star_id=star_id,
+            overall=float(overall),
+            level=str(level),
+            evaluated_at=now,
+            **dict(zip(DIMENSIONS, map(float, dims))),
+        )
+        for star_id, overall, level, dims in zip(scores.star_ids, scores.overall, scores.levels, scores.dimensions)
+    ]
+    await record_magnitudes(session, records)
+    return records
+
+
+async def evaluate(
+    session: AsyncSession,
+    *,
+    star_ids: Sequence[UUID] | None = None,
+    domain: str | None = None,
+    batch_size: int = 1000,
+) -> list[MagnitudeHistory]:
+    """评估指定智星或整个星域，返回写入的评估记录；不存在的智星被忽略。
+
+    按星域评估时按 id 分批（keyset），每批一次聚合查询、一次向量化打分、一次批量写入。
+    """
+
+    if star_ids is not None:
+        records: list[MagnitudeHistory] = []
+        unique = sorted(set(star_ids))
+        for offset in range(0, len(unique), batch_size):
+            records += await _evaluate_batch(session, unique[offset : offset + batch_size])
+        return records
+
+    records = []
+    last_id: UUID | None = None
+    while True:
+        page = select(Star.id).where(Star.domain == domain).order_by(Star.id).limit(batch_size)
+        if last_id is not None:
+            page = page.where(Star.id > last_id)
+        batch = (await session.exec(page)).all()
+        if not batch:
+            return records
+        records += await _evaluate_batch(session, list(batch))
+        last_id = batch[-1]
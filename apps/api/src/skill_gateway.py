@@ -0,0 +1,461 @@
+"""星技调用网关：对话热路径上调用第三方星技 API。
+
+- 每个星技主机（scheme + host + port）共享一个长连接池（httpx.AsyncClient），避免每次调用重新握手；
+- 每个星技有独立的超时（含排队时间）、并发上限与熔断器：连续失败 ``skill_breaker_failures`` 次后熔断，
+  ``skill_breaker_reset_s`` 后放行一次探测请求，成功则恢复；只有请求真正发出后的失败才计入熔断，
+  等不到并发名额的超时记为 ``saturated``，不算星技故障；
+- ``api_endpoint`` 只允许 http/https，解析到内网、回环、链路本地等地址的主机须列入 ``skill_allowed_hosts``；
+  连接只建立到校验过的地址（Host 头与 TLS SNI 仍用原主机名），DNS 重绑定无法把请求导向内网；
+- 幂等星技（``Skill.idempotent``）的结果进入两级缓存，相同输入的并发调用合并为一次请求；
+- ``invoke_many`` 并发调用一轮对话用到的多个星技，单个失败不影响其它结果。
+
+本地联调可以启动桩服务::
+
+    python skill_gateway.py stub --port 8765    # /echo、/slow?ms=、/fail、/flaky
+    SKILL_ALLOWED_HOSTS='["127.0.0.1"]'         # 允许 API 调用本机上的桩服务
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+from uuid import UUID
+
+import metrics
+from cache import SKILL, SKILL_RESULTS, get_cache, make_key
+from config import get_settings
+from db import SessionFactory
+from models import Skill
+
+if TYPE_CHECKING:
+    import httpx
+
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_CHECK_TTL_S = 60.0
+
+
+class SkillError(RuntimeError):
+    """星技返回错误或无法连接。"""
+
+    def __init__(self, message: str, status_code: int | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SkillTimeout(SkillError):
+    """调用（含排队）超过星技的超时预算。"""
+
+
+class SkillUnavailable(SkillError):
+    """星技不存在、未配置 api_endpoint、api_endpoint 不被允许或已熔断。"""
+
+
+@dataclass
+class SkillSpec:
+    id: UUID
+    name: str
+    api_endpoint: str
+    timeout_s: float
+    max_concurrency: int
+    cache_ttl_s: float | None  # 为空表示不缓存（非幂等星技）
+
+
+@dataclass
+class SkillResult:
+    skill_id: UUID
+    output: Any = None
+    status_code: int | None = None
+    error: str | None = None
+    cached: bool = False
+    elapsed_ms: float = 0.0
+
+
+@dataclass
+class CircuitBreaker:
+    failure_threshold: int
+    reset_s: float
+    failures: int = 0
+    opened_at: float | None = None
+    probing: bool = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_s else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True  # 半开状态只放行一个探测请求
+            return True
+        return False
+
+    def release(self) -> None:
+        """请求未发出（如等不到并发名额）：不计成败，只归还探测名额。"""
+
+        self.probing = False
+
+    def record(self, ok: bool) -> None:
+        self.probing = False
+        if ok:
+            self.failures, self.opened_at = 0, None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class _SkillState:
+    semaphore: asyncio.Semaphore
+    breaker: CircuitBreaker
+    limit: int
+
+
+class SkillGateway:
+    def __init__(
+        self,
+        *,
+        pool_connections: int,
+        pool_keepalive: int,
+        keepalive_expiry_s: float,
+        breaker_failures: int,
+        breaker_reset_s: float,
+    ) -> None:
+        self.pool_connections = pool_connections
+        self.pool_keepalive = pool_keepalive
+        self.keepalive_expiry_s = keepalive_expiry_s
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_s = breaker_reset_s
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._states: dict[UUID, _SkillState] = {}
+        self._resolved: dict[str, tuple[float, list[str]]] = {}  # 主机 -> (检查时间, 校验过的公网地址)
+
+    # ---- 星技定义 ----
+
+    async def spec(self, skill_id: UUID) -> SkillSpec:
+        """读取星技的调用配置（两级缓存）；不存在或未配置 api_endpoint 时抛出 SkillUnavailable。"""
+
+        settings = get_settings()
+
+        async def load() -> dict[str, Any] | None:
+            async with SessionFactory() as session:
+                skill = await session.get(Skill, skill_id)
+            if skill is None:
+                return None
+            return {
+                "id": str(skill.id),
+                "name": skill.name,
+                "status": skill.status,
+                "api_endpoint": skill.api_endpoint,
+                "timeout_ms": skill.timeout_ms,
+                "max_concurrency": skill.max_concurrency,
+                "idempotent": skill.idempotent,
+                "cache_ttl_s": skill.cache_ttl_s,
+            }
+
+        row = await get_cache().get_or_load(SKILL, str(skill_id), load, settings.cache_ttl_s)
+        if row is None or row["status"] != "published":
+            raise SkillUnavailable(f"skill {skill_id} not found", status_code=404)
+        if not row["api_endpoint"]:
+            raise SkillUnavailable(f"skill {skill_id} has no api_endpoint")
+        return SkillSpec(
+            id=skill_id,
+            name=row["name"],
+            api_endpoint=row["api_endpoint"],
+            timeout_s=(row["timeout_ms"] or settings.skill_timeout_ms) / 1000,
+            max_concurrency=row["max_concurrency"] or settings.skill_max_concurrency,
+            cache_ttl_s=(row["cache_ttl_s"] or settings.skill_cache_ttl_s) if row["idempotent"] else None,
+        )
+
+    # ---- 调用 ----
+
+    async def invoke(self, skill_id: UUID, payload: Any) -> SkillResult:
+        """调用一个星技；失败时抛出 SkillError 及其子类。"""
+
+        spec = await self.spec(skill_id)
+        started = time.perf_counter()
+        if spec.cache_ttl_s is None:
+            output, status_code = await self._call(spec, payload)
+            cached = False
+        else:
+            calls = 0
+
+            async def load() -> list[Any]:
+                nonlocal calls
+                calls += 1
+                return list(await self._call(spec, payload))
+
+            key = make_key(str(skill_id), json.dumps(payload, sort_keys=True, default=str))
+            output, status_code = await get_cache().get_or_load(SKILL_RESULTS, key, load, spec.cache_ttl_s)
+            cached = calls == 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if cached:
+            metrics.SKILL_INVOCATIONS.labels("cached").inc()
+        return SkillResult(skill_id, output, status_code, cached=cached, elapsed_ms=round(elapsed_ms, 3))
+
+    async def invoke_many(self, calls: Sequence[tuple[UUID, Any]]) -> list[SkillResult]:
+        """并发调用多个星技，结果与输入顺序一致；单个调用失败时该项带 ``error``。"""
+
+        async def one(skill_id: UUID, payload: Any) -> SkillResult:
+            started = time.perf_counter()
+            try:
+                return await self.invoke(skill_id, payload)
+            except SkillError as exc:
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+                return SkillResult(skill_id, status_code=exc.status_code, error=str(exc), elapsed_ms=elapsed_ms)
+
+        return list(await asyncio.gather(*(one(skill_id, payload) for skill_id, payload in calls)))
+
+    async def _call(self, spec: SkillSpec, payload: Any) -> tuple[Any, int]:
+        import httpx
+
+        await self._check_endpoint(spec)
+        state = self._state(spec)
+        if not state.breaker.allow():
+            metrics.SKILL_INVOCATIONS.labels("rejected").inc()
+            raise SkillUnavailable(f"skill {spec.name} is unavailable (circuit open)")
+
+        started = time.perf_counter()
+        outcome, ok, sent = "error", False, False
+        try:
+            # 超时预算包含等待并发名额的时间：星技已饱和时调用方按时失败，而不是无限排队
+            async with asyncio.timeout(spec.timeout_s):
+                async with state.semaphore:
+                    sent = True
+                    response = await self._client(spec.api_endpoint).post(spec.api_endpoint, json=payload)
+            if response.status_code >= 500:
+                raise SkillError(f"skill {spec.name} returned {response.status_code}", status_code=response.status_code)
+            ok = True  # 4xx 是调用方的问题，不计入熔断
+            if response.status_code >= 400:
+                outcome = "client_error"
+                raise SkillError(
+                    f"skill {spec.name} rejected the request ({response.status_code}): {response.text[:500]}",
+                    status_code=response.status_code,
+                )
+            outcome = "ok"
+            try:
+                output = response.json()
+            except ValueError:
+                output = response.text
+            return output, response.status_code
+        except TimeoutError as exc:
+            if not sent:
+                outcome = "saturated"
+                raise SkillTimeout(
+                    f"skill {spec.name} is saturated: no free slot within {spec.timeout_s:.3f}s "
+                    f"({spec.max_concurrency} calls in flight)",
+                ) from exc
+            outcome = "timeout"
+            raise SkillTimeout(f"skill {spec.name} timed out after {spec.timeout_s:.3f}s") from exc
+        except httpx.HTTPError as exc:
+            raise SkillError(f"skill {spec.name} is unreachable: {type(exc).__name__}") from exc
+        finally:
+            if sent:
+                state.breaker.record(ok)
+            else:
+                state.breaker.release()
+            metrics.SKILL_INVOCATIONS.labels(outcome).inc()
+            metrics.SKILL_INVOKE_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+
+    async def _check_endpoint(self, spec: SkillSpec) -> None:
+        """防 SSRF：只允许 http/https，主机解析出的地址须全部是公网地址，除非主机在白名单中。
+
+        校验过的地址由 ``_addresses`` 缓存，建连时只连接这些地址（见 ``_PinnedBackend``）。
+        """
+
+        import httpx
+
+        try:
+            url = httpx.URL(spec.api_endpoint)
+        except httpx.InvalidURL as exc:
+            raise SkillUnavailable(f"skill {spec.name} has an invalid api_endpoint") from exc
+        host = url.host
+        if url.scheme not in ("http", "https") or not host:
+            metrics.SKILL_INVOCATIONS.labels("blocked").inc()
+            raise SkillUnavailable(f"skill {spec.name} api_endpoint must be an http(s) URL", status_code=403)
+        try:
+            await self._addresses(host)
+        except ValueError as exc:
+            metrics.SKILL_INVOCATIONS.labels("blocked").inc()
+            raise SkillUnavailable(f"skill {spec.name} api_endpoint {exc}", status_code=403) from exc
+        except OSError as exc:
+            raise SkillError(f"skill {spec.name} is unreachable: cannot resolve {host}") from exc
+
+    async def _addresses(self, host: str) -> list[str]:
+        """解析主机并要求全部地址都是公网地址，返回可连接的地址；白名单主机原样返回。
+
+        结果按主机缓存 ``ENDPOINT_CHECK_TTL_S`` 秒，热路径上不必每次都做 DNS 解析；建连时也只用这里
+        返回的地址。存在非公网地址时抛出 ValueError，无法解析时抛出 OSError。
+        """
+
+        if host in get_settings().skill_allowed_hosts:
+            return [host]
+        cached = self._resolved.get(host)
+        if cached is not None and time.monotonic() - cached[0] < ENDPOINT_CHECK_TTL_S:
+            return cached[1]
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None)
+        addresses: list[str] = []
+        for *_, sockaddr in infos:
+            address = ipaddress.ip_address(sockaddr[0])
+            if not address.is_global or address.is_multicast:
+                raise ValueError(f"resolves to a non-public address ({address})")
+            if str(address) not in addresses:
+                addresses.append(str(address))
+        self._resolved[host] = (time.monotonic(), addresses)
+        return addresses
+
+    def _state(self, spec: SkillSpec) -> _SkillState:
+        state = self._states.get(spec.id)
+        if state is None or state.limit != spec.max_concurrency:
+            state = _SkillState(
+                semaphore=asyncio.Semaphore(spec.max_concurrency),
+                breaker=state.breaker if state else CircuitBreaker(self.breaker_failures, self.breaker_reset_s),
+                limit=spec.max_concurrency,
+            )
+            self._states[spec.id] = state
+        return state
+
+    def breaker_state(self, skill_id: UUID) -> str:
+        state = self._states.get(skill_id)
+        return state.breaker.state if state else "closed"
+
+    def _client(self, endpoint: str) -> httpx.AsyncClient:
+        import httpx
+
+        url = httpx.URL(endpoint)
+        origin = f"{url.scheme}://{url.host}:{url.port or ''}"
+        client = self._clients.get(origin)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=self.pool_connections,
+                    max_keepalive_connections=self.pool_keepalive,
+                    keepalive_expiry=self.keepalive_expiry_s,
+                ),
+            )
+            # httpx 不直接暴露 httpcore 的 network_backend 参数，在连接池上替换
+            pool = transport._pool
+            pool._network_backend = _PinnedBackend(pool._network_backend, self._addresses)
+            client = httpx.AsyncClient(transport=transport, timeout=None)  # 超时由 _call 按星技统一控制
+            self._clients[origin] = client
+        return client
+
+    async def close(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+class _PinnedBackend:
+    """httpcore 网络后端：只连接 ``_check_endpoint`` 校验过的地址。
+
+    请求在连接层以外不变：Host 头与 TLS 的 SNI/证书校验仍使用原主机名，只是 TCP 连接建立到校验时解析出的
+    地址，避免检查之后主机名被重新解析到内网（DNS 重绑定）。
+    """
+
+    def __init__(self, inner: Any, resolve: Any) -> None:
+        self._inner = inner
+        self._resolve = resolve
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Any = None,
+    ) -> Any:
+        import httpcore
+
+        try:
+            addresses = await self._resolve(host)
+        except (ValueError, OSError) as exc:
+            raise httpcore.ConnectError(f"refusing to connect to {host}: {exc}") from exc
+        error: Exception | None = None
+        for address in addresses:
+            try:
+                return await self._inner.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options,
+                )
+            except httpcore.ConnectError as exc:
+                error = exc
+        raise error or httpcore.ConnectError(f"no address to connect to for {host}")
+
+    async def connect_unix_socket(self, *args: Any, **kwargs: Any) -> Any:
+        return await self._inner.connect_unix_socket(*args, **kwargs)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._inner.sleep(seconds)
+
+
+@lru_cache(maxsize=1)
+def get_skill_gateway() -> SkillGateway:
+    settings = get_settings()
+    return SkillGateway(
+        pool_connections=settings.skill_pool_connections,
+        pool_keepalive=settings.skill_pool_keepalive,
+        keepalive_expiry_s=settings.skill_pool_keepalive_expiry_s,
+        breaker_failures=settings.skill_breaker_failures,
+        breaker_reset_s=settings.skill_breaker_reset_s,
+    )
+
+
+def _stub_app() -> Any:
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    flaky = {"calls": 0}
+
+    async def echo(request: Request) -> JSONResponse:
+        return JSONResponse({"echo": await request.json()})
+
+    async def slow(request: Request) -> JSONResponse:
+        body = await request.json()
+        await asyncio.sleep(float(request.query_params.get("ms", "500")) / 1000)
+        return JSONResponse({"echo": body})
+
+    async def fail(request: Request) -> JSONResponse:
+        return JSONResponse({"detail": "stub failure"}, status_code=500)
+
+    async def flaky_handler(request: Request) -> JSONResponse:
+        flaky["calls"] += 1
+        if flaky["calls"] % 2:
+            return JSONResponse({"detail": "stub failure"}, status_code=503)
+        return JSONResponse({"echo": await request.json()})
+
+    return Starlette(
+        routes=[
+            Route("/echo", echo, methods=["POST"]),
+            Route("/slow", slow, methods=["POST"]),
+            Route("/fail", fail, methods=["POST"]),
+            Route("/flaky", flaky_handler, methods=["POST"]),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="星技调用网关工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    stub = sub.add_parser("stub", help="启动本地星技桩服务")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(_stub_app(), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,268 @@
+"""星等时间线：按时间范围读取一颗智星的星等变化，并在服务端降采样到请求的点数。
+
+数据来源按跨度自动选择，单次读取的行数与智星存在多久无关：
+- ``raw``：``magnitude_history`` 走 ``(star_id, evaluated_at)`` 复合索引做范围扫描；
+- ``hour`` / ``day``：``magnitude_rollups`` 中的按小时 / 按天汇总（主键范围扫描），
+  由评估写路径在同一事务内增量 upsert（见 ``upsert_rollups``）。
+
+取出的序列再用 LTTB（Largest-Triangle-Three-Buckets）降采样，保留峰谷形状。
+``python timeline.py rebuild`` 从 ``magnitude_history`` 重建全部汇总。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import case, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import SessionFactory
+from models import MagnitudeHistory, MagnitudeRollup
+
+
+GRANULARITIES: dict[str, timedelta] = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+REBUILD_BATCH_SIZE = 1000  # 每条评估记录对应两行汇总，控制单条多行 upsert 的参数个数
+
+
+@dataclass
+class TimelinePoint:
+    t: datetime
+    overall: float  # 原始记录为当次得分，汇总桶为桶内平均
+    level: str
+    min: float
+    max: float
+    samples: int
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+
+# ---- 增量维护 ----
+
+
+def _rollup_rows(records: Sequence[MagnitudeHistory]) -> list[dict[str, Any]]:
+    """把一批评估记录先在内存中按 (智星, 粒度, 桶) 合并，每个桶只 upsert 一行。"""
+
+    buckets: dict[tuple[UUID, str, datetime], dict[str, Any]] = {}
+    for record in records:
+        for granularity in GRANULARITIES:
+            key = (record.star_id, granularity, bucket_start(record.evaluated_at, granularity))
+            row = buckets.get(key)
+            if row is None:
+                buckets[key] = {
+                    "star_id": record.star_id,
+                    "granularity": granularity,
+                    "bucket_start": key[2],
+                    "samples": 1,
+                    "sum_overall": record.overall,
+                    "min_overall": record.overall,
+                    "max_overall": record.overall,
+                    "last_overall": record.overall,
+                    "last_level": record.level,
+                    "last_evaluated_at": record.evaluated_at,
+                }
+                continue
+            row["samples"] += 1
+            row["sum_overall"] += record.overall
+            row["min_overall"] = min(row["min_overall"], record.overall)
+            row["max_overall"] = max(row["max_overall"], record.overall)
+            if record.evaluated_at >= row["last_evaluated_at"]:
+                row["last_overall"] = record.overall
+                row["last_level"] = record.level
+                row["last_evaluated_at"] = record.evaluated_at
+    return list(buckets.values())
+
+
+def _upsert(dialect: str, rows: list[dict[str, Any]]) -> Any:
+    module = postgresql if dialect == "postgresql" else sqlite
+    statement = module.insert(MagnitudeRollup).values(rows)
+    excluded = statement.excluded
+    newer = excluded.last_evaluated_at >= MagnitudeRollup.last_evaluated_at
+    return statement.on_conflict_do_update(
+        index_elements=[MagnitudeRollup.star_id, MagnitudeRollup.granularity, MagnitudeRollup.bucket_start],
+        set_={
+            "samples": MagnitudeRollup.samples + excluded.samples,
+            "sum_overall": MagnitudeRollup.sum_overall + excluded.sum_overall,
+            "min_overall": case(
+                (excluded.min_overall < MagnitudeRollup.min_overall, excluded.min_overall),
+                else_=MagnitudeRollup.min_overall,
+            ),
+            "max_overall": case(
+                (excluded.max_overall > MagnitudeRollup.max_overall, excluded.max_overall),
+                else_=MagnitudeRollup.max_overall,
+            ),
+            "last_overall": case((newer, excluded.last_overall), else_=MagnitudeRollup.last_overall),
+            "last_level": case((newer, excluded.last_level), else_=MagnitudeRollup.last_level),
+            "last_evaluated_at": case((newer, excluded.last_evaluated_at), else_=MagnitudeRollup.last_evaluated_at),
+        },
+    )
+
+
+async def upsert_rollups(session: AsyncSession, records: Sequence[MagnitudeHistory]) -> None:
+    """把新写入的评估记录累加进汇总（不提交，随调用方的事务一起落库）。"""
+
+    rows = _rollup_rows(records)
+    if rows:
+        await session.exec(_upsert(session.bind.dialect.name, rows))  # type: ignore[call-overload, union-attr]
+
+
+# ---- 查询 ----
+
+
+def choose_resolution(start: datetime, end: datetime, points: int) -> str:
+    """按每个输出点覆盖的时长选择数据源：一个点至少覆盖一个桶时才用汇总。"""
+
+    per_point = (end - start) / max(points, 1)
+    if per_point >= GRANULARITIES["day"]:
+        return "day"
+    if per_point >= GRANULARITIES["hour"]:
+        return "hour"
+    return "raw"
+
+
+async def _raw(session: AsyncSession, star_id: UUID, start: datetime, end: datetime, limit: int) -> list[TimelinePoint]:
+    rows = (
+        await session.exec(
+            select(MagnitudeHistory.evaluated_at, MagnitudeHistory.overall, MagnitudeHistory.level)
+            .where(
+                MagnitudeHistory.star_id == star_id,
+                MagnitudeHistory.evaluated_at >= start,
+                MagnitudeHistory.evaluated_at < end,
+            )
+            .order_by(MagnitudeHistory.evaluated_at)  # type: ignore[arg-type]
+            .limit(limit),
+        )
+    ).all()
+    return [TimelinePoint(t=t, overall=o, level=lv, min=o, max=o, samples=1) for t, o, lv in rows]
+
+
+async def _rollups(
+    session: AsyncSession,
+    star_id: UUID,
+    granularity: str,
+    start: datetime,
+    end: datetime,
+) -> list[TimelinePoint]:
+    rows = (
+        await session.exec(
+            select(MagnitudeRollup)
+            .where(
+                MagnitudeRollup.star_id == star_id,
+                MagnitudeRollup.granularity == granularity,
+                MagnitudeRollup.bucket_start >= bucket_start(start, granularity),
+                MagnitudeRollup.bucket_start < end,
+            )
+            .order_by(MagnitudeRollup.bucket_start),  # type: ignore[arg-type]
+        )
+    ).all()
+    return [
+        TimelinePoint(
+            t=row.bucket_start,
+            overall=round(row.sum_overall / row.samples, 4),
+            level=row.last_level,
+            min=row.min_overall,
+            max=row.max_overall,
+            samples=row.samples,
+        )
+        for row in rows
+    ]
+
+
+async def timeline(
+    session: AsyncSession,
+    star_id: UUID,
+    start: datetime,
+    end: datetime,
+    points: int,
+    resolution: str = "auto",
+    max_raw_rows: int = 20000,
+) -> tuple[str, list[TimelinePoint]]:
+    """返回 (实际使用的分辨率, 降采样后的点)。原始记录超过 ``max_raw_rows`` 时改用按小时汇总。"""
+
+    if resolution == "auto":
+        resolution = choose_resolution(start, end, points)
+    if resolution == "raw":
+        series = await _raw(session, star_id, start, end, max_raw_rows + 1)
+        if len(series) <= max_raw_rows:
+            return resolution, lttb(series, points)
+        resolution = "hour"
+    return resolution, lttb(await _rollups(session, star_id, resolution, start, end), points)
+
+
+def lttb(series: list[TimelinePoint], threshold: int) -> list[TimelinePoint]:
+    """Largest-Triangle-Three-Buckets 降采样：保留首尾点，其余每个桶选出与相邻桶构成三角形面积最大的点。"""
+
+    if threshold >= len(series) or threshold < 3:
+        return series
+
+    xs = [(point.t - series[0].t).total_seconds() for point in series]
+    ys = [point.overall for point in series]
+    every = (len(series) - 2) / (threshold - 2)
+    sampled = [series[0]]
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点作为三角形的第三个顶点
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(series))
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best, best_area = -1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(series[best])
+        a = best
+    sampled.append(series[-1])
+    return sampled
+
+
+# ---- 重建 ----
+
+
+async def rebuild() -> int:
+    """清空并从 ``magnitude_history`` 重建全部汇总，返回处理的评估记录数。"""
+
+    total = 0
+    last_id: UUID | None = None
+    async with SessionFactory() as session:
+        await session.exec(delete(MagnitudeRollup))  # type: ignore[call-overload]
+        while True:
+            # 汇总的合并与顺序无关，按主键分页即可
+            page = select(MagnitudeHistory).order_by(MagnitudeHistory.id).limit(REBUILD_BATCH_SIZE)  # type: ignore[arg-type]
+            if last_id is not None:
+                page = page.where(MagnitudeHistory.id > last_id)
+            records = (await session.exec(page)).all()
+            if not records:
+                break
+            await upsert_rollups(session, records)
+            total += len(records)
+            last_id = records[-1].id
+        await session.commit()
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar magnitude timeline maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="从 magnitude_history 重建 magnitude_rollups")
+    args = parser.parse_args()
+
+    if args.cmd == "rebuild":
+        count = asyncio.run(rebuild())
+        print(f"rebuilt rollups from {count} evaluations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""训练数据导出：把一颗智星在数据窗口内的对话消息与反馈流式写成 Arrow IPC 分片，供训练 worker 内存映射加载。
+
+- 窗口左闭右开 ``[data_start, data_end)``，``data_start`` 取该智星最新模型版本的 ``data_end``，
+  每次只导出上次训练之后新增的数据；训练完成后用 ``register`` 登记模型版本，推进下一次的起点；
+- ``data_end`` 至多为当前时间减 ``training_export_lag_s``：``created_at`` 早于提交时刻，
+  仍未提交的事务写入的行不会落在已导出（此后不再读取）的窗口里；
+- 查询走服务端游标（``yield_per``），每次只取 ``training_export_batch_rows`` 行并立即写成一个 RecordBatch，
+  内存占用与窗口内的数据量无关；
+- 分片为未压缩的 Arrow IPC 文件格式，训练侧 ``pa.memory_map`` + ``ipc.open_file`` 即零拷贝读取；
+  分片先写临时文件再改名，``manifest.json`` 最后写入，读到清单即可保证导出完整。
+
+用法::
+
+    python training_export.py export --star-id <uuid>
+    python training_export.py register --manifest .data/training/<star>/<window>/manifest.json \\
+        --version-name v3 --artifact-uri s3://model-artifacts/manifests/<star>/v3.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from uuid import UUID
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import get_settings
+from db import SessionFactory
+from models import Conversation, ConversationFeedback, ConversationMessage, Star, StarModelVersion
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def message_schema() -> pa.Schema:
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("conversation_id", pa.string()),
+            ("channel", pa.string()),
+            ("seq", pa.int32()),
+            ("role", pa.string()),
+            ("content", pa.string()),
+            ("tokens", pa.int32()),
+            ("created_at", pa.timestamp("us")),
+        ],
+    )
+
+
+def feedback_schema() -> pa.Schema:
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("conversation_id", pa.string()),
+            ("rating", pa.int8()),
+            ("comment", pa.string()),
+            ("labels", pa.list_(pa.string())),
+            ("created_at", pa.timestamp("us")),
+        ],
+    )
+
+
+@dataclass
+class ShardInfo:
+    file: str
+    rows: int
+    bytes: int
+
+
+@dataclass
+class ExportManifest:
+    star_id: str
+    data_start: str | None  # ISO 时间；为空表示从最早的数据开始
+    data_end: str
+    messages: list[ShardInfo] = field(default_factory=list)
+    feedback: list[ShardInfo] = field(default_factory=list)
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+    @property
+    def message_rows(self) -> int:
+        return sum(shard.rows for shard in self.messages)
+
+    @property
+    def feedback_rows(self) -> int:
+        return sum(shard.rows for shard in self.feedback)
+
+
+class _ShardWriter:
+    """按行数切分的 Arrow IPC 文件写入器：写满 ``shard_rows`` 行后换下一个分片。"""
+
+    def __init__(self, out_dir: Path, prefix: str, schema: pa.Schema, shard_rows: int) -> None:
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.schema = schema
+        self.shard_rows = shard_rows
+        self.shards: list[ShardInfo] = []
+        self._writer: Any = None
+        self._path: Path | None = None
+        self._rows = 0
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        import pyarrow as pa
+
+        offset = 0
+        while offset < batch.num_rows:
+            if self._writer is None:
+                self._path = self.out_dir / f"{self.prefix}-{len(self.shards):05d}.arrow.tmp"
+                self._writer = pa.ipc.new_file(str(self._path), self.schema)
+                self._rows = 0
+            take = min(batch.num_rows - offset, self.shard_rows - self._rows)
+            self._writer.write_batch(batch.slice(offset, take))
+            self._rows += take
+            offset += take
+            if self._rows >= self.shard_rows:
+                self._finish()
+
+    def _finish(self) -> None:
+        assert self._writer is not None and self._path is not None
+        self._writer.close()
+        final = self._path.with_suffix("")  # 去掉 .tmp
+        os.replace(self._path, final)
+        self.shards.append(ShardInfo(file=final.name, rows=self._rows, bytes=final.stat().st_size))
+        self._writer, self._path = None, None
+
+    def close(self) -> list[ShardInfo]:
+        import pyarrow as pa
+
+        if self._writer is None and not self.shards:
+            # 窗口内没有数据时也写一个空分片，训练侧总能从分片拿到 schema
+            self._path = self.out_dir / f"{self.prefix}-00000.arrow.tmp"
+            self._writer = pa.ipc.new_file(str(self._path), self.schema)
+        if self._writer is not None:
+            self._finish()
+        return self.shards
+
+
+async def last_data_end(session: AsyncSession, star_id: UUID) -> datetime | None:
+    """该智星最新模型版本的数据窗口终点，即下一次导出的起点。"""
+
+    return (
+        await session.exec(
+            select(StarModelVersion.data_end)
+            .where(StarModelVersion.star_id == star_id)
+            .order_by(StarModelVersion.created_at.desc())  # type: ignore[attr-defined]
+            .limit(1),
+        )
+    ).first()
+
+
+def _in_window(column: Any, start: datetime | None, end: datetime) -> list[Any]:
+    return [column < end] if start is None else [column >= start, column < end]
+
+
+def _messages_statement(star_id: UUID, start: datetime | None, end: datetime) -> Any:
+    return (
+        select(
+            ConversationMessage.conversation_id,
+            Conversation.channel,
+            ConversationMessage.seq,
+            ConversationMessage.role,
+            ConversationMessage.content,
+            ConversationMessage.tokens,
+            ConversationMessage.created_at,
+        )
+        .join(Conversation, Conversation.id == ConversationMessage.conversation_id)
+        .where(Conversation.star_id == star_id, *_in_window(ConversationMessage.created_at, start, end))
+        # 同一会话的消息连续且按轮次排列，训练侧可直接切分多轮样本
+        .order_by(ConversationMessage.conversation_id, ConversationMessage.seq)
+    )
+
+
+def _feedback_statement(star_id: UUID, start: datetime | None, end: datetime) -> Any:
+    return (
+        select(
+            ConversationFeedback.conversation_id,
+            ConversationFeedback.rating,
+            ConversationFeedback.comment,
+            ConversationFeedback.labels,
+            ConversationFeedback.created_at,
+        )
+        .join(Conversation, Conversation.id == ConversationFeedback.conversation_id)
+        .where(Conversation.star_id == star_id, *_in_window(ConversationFeedback.created_at, start, end))
+        .order_by(ConversationFeedback.conversation_id, ConversationFeedback.created_at)
+    )
+
+
+async def _stream_to_shards(
+    session: AsyncSession,
+    statement: Any,
+    writer: _ShardWriter,
+    to_batch: Callable[[Sequence[Any]], pa.RecordBatch],
+    batch_rows: int,
+) -> list[ShardInfo]:
+    # yield_per 让驱动使用服务端游标（PostgreSQL 为命名游标），每次只把一个分区的行取到内存
+    result = await session.stream(statement.execution_options(yield_per=batch_rows))
+    async for rows in result.partitions(batch_rows):
+        writer.write(to_batch(rows))
+    return writer.close()
+
+
+def _message_batch(rows: Sequence[Any]) -> pa.RecordBatch:
+    import pyarrow as pa
+
+    conversation_ids, channels, seqs, roles, contents, tokens, created = zip(*rows)
+    return pa.record_batch(
+        [
+            pa.array([str(value) for value in conversation_ids], pa.string()),
+            pa.array(channels, pa.string()),
+            pa.array(seqs, pa.int32()),
+            pa.array(roles, pa.string()),
+            pa.array(contents, pa.string()),
+            pa.array(tokens, pa.int32()),
+            pa.array(created, pa.timestamp("us")),
+        ],
+        schema=message_schema(),
+    )
+
+
+def _feedback_batch(rows: Sequence[Any]) -> pa.RecordBatch:
+    import pyarrow as pa
+
+    conversation_ids, ratings, comments, labels, created = zip(*rows)
+    return pa.record_batch(
+        [
+            pa.array([str(value) for value in conversation_ids], pa.string()),
+            pa.array(ratings, pa.int8()),
+            pa.array(comments, pa.string()),
+            pa.array([value or [] for value in labels], pa.list_(pa.string())),
+            pa.array(created, pa.timestamp("us")),
+        ],
+        schema=feedback_schema(),
+    )
+
+
+async def export(
+    star_id: UUID,
+    *,
+    until: datetime | None = None,
+    out_root: str | Path | None = None,
+    batch_rows: int | None = None,
+    shard_rows: int | None = None,
+) -> tuple[Path, ExportManifest]:
+    """导出 ``[上次训练的 data_end, until)`` 窗口内的消息与反馈，返回 (清单路径, 清单)。
+
+    ``until`` 晚于 ``当前时间 - training_export_lag_s`` 时以后者为准；带时区的 ``until`` 先换算为 naive UTC。
+
+    消息与反馈各用一个会话读取：服务端游标在读完前一直占用连接，两个会话互不影响。
+    """
+
+    settings = get_settings()
+    batch_rows = batch_rows or settings.training_export_batch_rows
+    shard_rows = shard_rows or settings.training_export_shard_rows
+    horizon = datetime.utcnow() - timedelta(seconds=settings.training_export_lag_s)
+    if until is not None and until.tzinfo is not None:  # 库中时间统一为 naive UTC
+        until = (until - until.utcoffset()).replace(tzinfo=None)  # type: ignore[operator]
+    end = min(until, horizon) if until else horizon
+
+    async with SessionFactory() as session:
+        if await session.get(Star, star_id) is None:
+            raise LookupError(f"star {star_id} not found")
+        start = await last_data_end(session, star_id)
+    if start is not None and start >= end:
+        raise ValueError(f"nothing to export: last training window already ends at {start.isoformat()}")
+
+    out_dir = Path(out_root or settings.training_export_dir) / str(star_id) / end.strftime("%Y%m%dT%H%M%S%f")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = ExportManifest(
+        star_id=str(star_id),
+        data_start=start.isoformat() if start else None,
+        data_end=end.isoformat(),
+    )
+    async with SessionFactory() as session:
+        manifest.messages = await _stream_to_shards(
+            session,
+            _messages_statement(star_id, start, end),
+            _ShardWriter(out_dir, "messages", message_schema(), shard_rows),
+            _message_batch,
+            batch_rows,
+        )
+    async with SessionFactory() as session:
+        manifest.feedback = await _stream_to_shards(
+            session,
+            _feedback_statement(star_id, start, end),
+            _ShardWriter(out_dir, "feedback", feedback_schema(), shard_rows),
+            _feedback_batch,
+            batch_rows,
+        )
+
+    path = out_dir / MANIFEST_NAME
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(asdict(manifest), ensure_ascii=False, indent=2), "utf-8")
+    os.replace(tmp, path)
+    return path, manifest
+
+
+def read_manifest(path: str | Path) -> ExportManifest:
+    raw = json.loads(Path(path).read_text("utf-8"))
+    raw["messages"] = [ShardInfo(**shard) for shard in raw["messages"]]
+    raw["feedback"] = [ShardInfo(**shard) for shard in raw["feedback"]]
+    return ExportManifest(**raw)
+
+
+async def register(
+    manifest: ExportManifest,
+    *,
+    version_name: str,
+    artifact_uri: str,
+    training_method: str = "qlora",
+    metrics: dict[str, Any] | None = None,
+) -> StarModelVersion:
+    """登记用这次导出训练出的模型版本并设为智星当前版本；其 data_end 即下一次导出的起点。"""
+
+    star_id = UUID(manifest.star_id)
+    async with SessionFactory() as session:
+        star = await session.get(Star, star_id)
+        if star is None:
+            raise LookupError(f"star {star_id} not found")
+        version = StarModelVersion(
+            star_id=star_id,
+            version_name=version_name,
+            artifact_uri=artifact_uri,
+            training_method=training_method,
+            data_start=datetime.fromisoformat(manifest.data_start) if manifest.data_start else None,
+            data_end=datetime.fromisoformat(manifest.data_end),
+            metrics={
+                "message_rows": manifest.message_rows,
+                "feedback_rows": manifest.feedback_rows,
+                **(metrics or {}),
+            },
+        )
+        session.add(version)
+        star.current_model_version = version.id
+        star.updated_at = datetime.utcnow()
+        session.add(star)
+        await session.commit()
+        await session.refresh(version)
+    return version
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar training data export")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    export_cmd = sub.add_parser("export", help="增量导出一颗智星的对话与反馈为 Arrow 分片")
+    export_cmd.add_argument("--star-id", type=UUID, required=True)
+    export_cmd.add_argument("--until", type=datetime.fromisoformat, help="窗口终点（UTC），默认且至多为当前时间减 training_export_lag_s")
+    export_cmd.add_argument("--out", help="输出根目录，默认 TRAINING_EXPORT_DIR")
+
+    register_cmd = sub.add_parser("register", help="登记训练完成的模型版本，推进下一次导出的起点")
+    register_cmd.add_argument("--manifest", required=True)
+    register_cmd.add_argument("--version-name", required=True)
+    register_cmd.add_argument("--artifact-uri", required=True)
+    register_cmd.add_argument("--method", default="qlora")
+
+    args = parser.parse_args()
+    if args.cmd == "export":
+        path, manifest = asyncio.run(export(args.star_id, until=args.until, out_root=args.out))
+        print(
+            f"exported {manifest.message_rows} messages / {manifest.feedback_rows} feedback "
+            f"[{manifest.data_start or '-'}, {manifest.data_end}) -> {path}",
+        )
+    else:
+        version = asyncio.run(
+            register(
+                read_manifest(args.manifest),
+                version_name=args.version_name,
+                artifact_uri=args.artifact_uri,
+                training_method=args.method,
+            ),
+        )
+        print(f"registered {version.version_name} ({version.id}), next export starts at {version.data_end.isoformat()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""星试自动作答：把同一道题并发分发给所有报名的智星，批量回写 ``trial_entries``。
+
+- 生产者按 id 分页（keyset）读取待作答条目，经有界队列交给固定数量的 worker，内存占用与报名规模无关；
+- worker 调用 ``llm.complete_reply``，请求在推理调度器里与其它请求合并成微批次；调度器过载时退避重试；
+- 答案先在内存中攒批，满 ``trial_flush_size`` 条或每隔 ``trial_flush_interval_s`` 用一次 executemany 回写；
+- 状态全部落在数据库：进程崩溃后重新 ``start`` 只会处理仍为 pending 的条目（未落库的答案会重答，至少一次）；
+- 作答进行中新报名的条目 id 可能排在生产者游标之前：``start`` 记下需要补扫，本轮答案全部落库后再扫一轮 pending；
+- 每次回写后广播进度，``watch`` 供 SSE 接口推送。
+
+同一星试的作答在单个进程内执行（``start`` 对进行中的星试幂等）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import get_settings
+from db import SessionFactory
+from inference import SchedulerOverloaded
+from llm import ChatMessage, complete_reply
+from models import Star, StarTrial, TrialEntry
+
+
+logger = logging.getLogger(__name__)
+
+_MAX_ATTEMPTS = 5
+
+
+@dataclass
+class TrialRun:
+    trial_id: UUID
+    total: int = 0
+    answered: int = 0
+    failed: int = 0
+    done: bool = False
+    started_at: float = field(default_factory=time.monotonic)
+    version: int = 0
+    rescan: bool = False  # 进行中又有新报名：本轮结束后再扫一轮 pending
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition)
+    task: asyncio.Task[None] | None = None
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "trial_id": str(self.trial_id),
+            "total": self.total,
+            "answered": self.answered,
+            "failed": self.failed,
+            "pending": self.total - self.answered - self.failed,
+            "elapsed_s": round(time.monotonic() - self.started_at, 3),
+            "done": self.done,
+        }
+
+    async def publish(self) -> None:
+        async with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+
+async def enroll(session: AsyncSession, trial_id: UUID, star_ids: list[UUID]) -> int:
+    """批量报名：忽略不存在的智星与重复报名，返回本次新增的条目数。星试不存在时抛出 LookupError。"""
+
+    if await session.get(StarTrial, trial_id) is None:
+        raise LookupError(f"trial {trial_id} not found")
+    existing = (await session.exec(select(Star.id).where(Star.id.in_(set(star_ids))))).all()  # type: ignore[attr-defined]
+    if not existing:
+        return 0
+    module = postgresql if session.bind.dialect.name == "postgresql" else sqlite  # type: ignore[union-attr]
+    statement = (
+        module.insert(TrialEntry)
+        .values([TrialEntry(trial_id=trial_id, star_id=star_id).model_dump() for star_id in existing])
+        .on_conflict_do_nothing(index_elements=[TrialEntry.trial_id, TrialEntry.star_id])
+        .returning(TrialEntry.id)
+    )
+    inserted = (await session.exec(statement)).all()  # type: ignore[call-overload]
+    await session.commit()
+    return len(inserted)
+
+
+async def progress_from_db(trial_id: UUID) -> dict[str, Any]:
+    """没有进行中的作答时，从数据库汇总当前进度。"""
+
+    async with SessionFactory() as session:
+        rows = (
+            await session.exec(
+                select(TrialEntry.status, func.count())
+                .where(TrialEntry.trial_id == trial_id)
+                .group_by(TrialEntry.status),
+            )
+        ).all()
+    counts = dict(rows)
+    total = sum(counts.values())
+    return {
+        "trial_id": str(trial_id),
+        "total": total,
+        "answered": counts.get("answered", 0),
+        "failed": counts.get("failed", 0),
+        "pending": counts.get("pending", 0),
+        "elapsed_s": None,
+        "done": counts.get("pending", 0) == 0,
+    }
+
+
+class TrialRunner:
+    def __init__(self, *, concurrency: int, flush_size: int, flush_interval: float, page_size: int) -> None:
+        self.concurrency = concurrency
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.page_size = page_size
+        self._runs: dict[UUID, TrialRun] = {}
+
+    def start(self, trial_id: UUID, retry_failed: bool = False, enrolled: int = 0) -> TrialRun:
+        """开始（或续跑）一场星试的作答；已在进行中时直接返回当前进度。
+
+        ``enrolled`` 为调用方刚刚新增的报名数：作答进行中时计入总数，并在本轮结束后补扫这些条目。
+        """
+
+        run = self._runs.get(trial_id)
+        if run is not None and not run.done:
+            if enrolled:
+                run.total += enrolled
+                run.rescan = True
+            return run
+        run = TrialRun(trial_id=trial_id)
+        run.task = asyncio.create_task(self._run(run, retry_failed))
+        self._runs[trial_id] = run
+        return run
+
+    def get(self, trial_id: UUID) -> TrialRun | None:
+        return self._runs.get(trial_id)
+
+    async def watch(self, trial_id: UUID) -> AsyncIterator[dict[str, Any]]:
+        """逐次产出进度快照，直到作答结束。"""
+
+        run = self._runs.get(trial_id)
+        if run is None:
+            yield await progress_from_db(trial_id)
+            return
+        seen = -1
+        while True:
+            async with run.changed:
+                await run.changed.wait_for(lambda seen=seen: run.version != seen)
+                seen = run.version
+            snapshot = run.snapshot()
+            yield snapshot
+            if snapshot["done"]:
+                return
+
+    async def close(self) -> None:
+        tasks = [run.task for run in self._runs.values() if run.task is not None and not run.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---- 执行 ----
+
+    async def _run(self, run: TrialRun, retry_failed: bool) -> None:
+        try:
+            async with SessionFactory() as session:
+                trial = await session.get(StarTrial, run.trial_id)
+                if trial is None:
+                    raise LookupError(f"trial {run.trial_id} not found")
+                prompt = trial.prompt
+                if retry_failed:
+                    await session.exec(  # type: ignore[call-overload]
+                        update(TrialEntry)
+                        .where(TrialEntry.trial_id == run.trial_id, TrialEntry.status == "failed")
+                        .values(status="pending", error=None),
+                    )
+                    await session.commit()
+            while True:
+                # 每轮开始前的答案都已落库，从数据库重新汇总即为准确进度
+                progress = await progress_from_db(run.trial_id)
+                run.total = progress["total"]
+                run.answered, run.failed = progress["answered"], progress["failed"]
+                await run.publish()
+                await self._pass(run, prompt)
+                # 检查与置 done 之间没有 await：start 要么在这之前登记补扫，要么看到 done 另起一轮
+                if not run.rescan:
+                    break
+                run.rescan = False
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # 已落库的答案保留，可重新 start 续跑
+            logger.exception("trial %s run failed", run.trial_id)
+        finally:
+            run.done = True
+            await run.publish()
+
+    async def _pass(self, run: TrialRun, prompt: str) -> None:
+        """把当前全部 pending 条目作答一遍，返回前答案全部落库。"""
+
+        queue: asyncio.Queue[tuple[UUID, Star] | None] = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: list[dict[str, Any]] = []
+        workers = [asyncio.create_task(self._worker(run, queue, prompt, results)) for _ in range(self.concurrency)]
+        flusher = asyncio.create_task(self._flush_periodically(run, results))
+        try:
+            await self._produce(run.trial_id, queue)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+            for worker in workers:
+                worker.cancel()
+            await self._flush(run, results)
+
+    async def _produce(self, trial_id: UUID, queue: asyncio.Queue[tuple[UUID, Star] | None]) -> None:
+        # 只读 pending；worker 作答期间条目保持 pending，因此用 id 做 keyset 游标而不是依赖状态变化
+        last_id: UUID | None = None
+        while True:
+            statement = (
+                select(TrialEntry.id, Star)
+                .join(Star, Star.id == TrialEntry.star_id)  # type: ignore[arg-type]
+                .where(TrialEntry.trial_id == trial_id, TrialEntry.status == "pending")
+                .order_by(TrialEntry.id)  # type: ignore[arg-type]
+                .limit(self.page_size)
+            )
+            if last_id is not None:
+                statement = statement.where(TrialEntry.id > last_id)
+            async with SessionFactory() as session:
+                page = (await session.exec(statement)).all()
+            for entry_id, star in page:
+                await queue.put((entry_id, star))
+            if len(page) < self.page_size:
+                return
+            last_id = page[-1][0]
+
+    async def _worker(
+        self,
+        run: TrialRun,
+        queue: asyncio.Queue[tuple[UUID, Star] | None],
+        prompt: str,
+        results: list[dict[str, Any]],
+    ) -> None:
+        while (item := await queue.get()) is not None:
+            entry_id, star = item
+            results.append(await self._answer(entry_id, star, prompt))
+            if len(results) >= self.flush_size:
+                await self._flush(run, results)
+
+    async def _answer(self, entry_id: UUID, star: Star, prompt: str) -> dict[str, Any]:
+        delay = 0.05
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                reply = await complete_reply(star, [ChatMessage(role="user", content=prompt)])
+            except SchedulerOverloaded:
+                if attempt == _MAX_ATTEMPTS - 1:
+                    return self._result(entry_id, "failed", error="inference scheduler overloaded")
+                await asyncio.sleep(delay)
+                delay *= 2
+            except Exception as exc:  # 单颗智星失败不影响整场星试
+                return self._result(entry_id, "failed", error=f"{type(exc).__name__}: {exc}"[:2000])
+            else:
+                return self._result(entry_id, "answered", response=reply)
+        raise AssertionError("unreachable")
+
+    @staticmethod
+    def _result(entry_id: UUID, status: str, response: str | None = None, error: str | None = None) -> dict[str, Any]:
+        return {
+            "entry_id": entry_id,
+            "status": status,
+            "response": response,
+            "error": error,
+            "submitted_at": datetime.utcnow(),
+        }
+
+    async def _flush_periodically(self, run: TrialRun, results: list[dict[str, Any]]) -> None:
+        # 作答慢时按时间兜底回写，保证进度与已完成的答案及时落库
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush(run, results)
+
+    async def _flush(self, run: TrialRun, results: list[dict[str, Any]]) -> None:
+        if not results:
+            return
+        # 先同步取走缓冲区，并发触发的回写不会重复提交同一批
+        batch = results[:]
+        del results[: len(batch)]
+        statement = (
+            update(TrialEntry.__table__)  # type: ignore[attr-defined]
+            .where(TrialEntry.__table__.c.id == bindparam("entry_id"))  # type: ignore[attr-defined]
+            .values(
+                status=bindparam("status"),
+                response=bindparam("response"),
+                error=bindparam("error"),
+                submitted_at=bindparam("submitted_at"),
+            )
+        )
+        async with SessionFactory() as session:
+            connection = await session.connection()
+            await connection.execute(statement, batch)  # executemany：一次往返回写整批答案
+            await session.commit()
+        run.answered += sum(1 for r in batch if r["status"] == "answered")
+        run.failed += sum(1 for r in batch if r["status"] == "failed")
+        await run.publish()
+
+
+@lru_cache(maxsize=1)
+def get_trial_runner() -> TrialRunner:
+    settings = get_settings()
+    return TrialRunner(
+        concurrency=settings.trial_concurrency,
+        flush_size=settings.trial_flush_size,
+        flush_interval=settings.trial_flush_interval_s,
+        page_size=settings.trial_page_size,
+    )
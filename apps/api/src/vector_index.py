@@ -0,0 +1,243 @@
+"""本地向量索引：每颗智星一个集合（``star_<starId>``），无需启动 Milvus 即可使用。
+
+存储格式（目录 ``<vector_index_dir>/star_<starId>/``）：
+- ``vectors.f32``：float32 行主序矩阵，每行一个已归一化的向量，追加写入，读取时内存映射；
+- ``chunks.jsonl``：与向量逐行对应的 chunk 元数据（task_id、序号、原文）。
+
+检索为 NumPy 暴力内积（向量已归一化，即余弦相似度），单星规模下足够快；
+接口与 Milvus 集合保持一致，后续可平滑切换到 HNSW / IVF 后端。
+
+进程内按 LRU 保留最近活跃智星的“热”索引（内存映射 + chunk 元数据），冷星的索引会被淘汰释放。
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+import numpy as np
+
+from config import get_settings
+
+
+@dataclass
+class SearchHit:
+    score: float
+    task_id: str
+    chunk_index: int
+    text: str
+
+
+def index_name(star_id: UUID) -> str:
+    return f"star_{star_id.hex}"
+
+
+class LocalVectorIndex:
+    VECTORS_FILE = "vectors.f32"
+    CHUNKS_FILE = "chunks.jsonl"
+
+    def __init__(self, directory: Path, dim: int) -> None:
+        self.directory = directory
+        self.dim = dim
+        # 读写锁按目录共享：进程内实例被 LRU 淘汰后重新打开仍与尚未结束的写入互斥，
+        # 并通过目录下的锁文件（flock）与其它 API worker 进程互斥。
+        self._lock = _file_lock(directory)
+        self._repaired = False
+        self._vectors: np.ndarray | None = None
+        self._chunks: list[dict[str, Any]] | None = None
+        self._chunks_offset = 0  # 已读入 _chunks 的元数据字节数，增量补读时从这里继续
+
+    @property
+    def name(self) -> str:
+        return self.directory.name
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.directory / self.VECTORS_FILE
+
+    @property
+    def _chunks_path(self) -> Path:
+        return self.directory / self.CHUNKS_FILE
+
+    def __len__(self) -> int:
+        if not self._vectors_path.exists():
+            return 0
+        # 以向量文件为准：写入顺序是先元数据后向量，中途崩溃时多出的元数据行由 _repair 截掉。
+        return self._vectors_path.stat().st_size // (self.dim * 4)
+
+    def add(self, vectors: np.ndarray, chunks: list[dict[str, Any]]) -> None:
+        """追加一批向量及对应元数据。"""
+
+        if vectors.shape != (len(chunks), self.dim):
+            raise ValueError(f"expected vectors of shape ({len(chunks)}, {self.dim}), got {vectors.shape}")
+        with self._lock:
+            self._repair()
+            with self._chunks_path.open("a", encoding="utf-8") as fh:
+                for chunk in chunks:
+                    fh.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            with self._vectors_path.open("ab") as fh:
+                fh.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            # 不直接把本批元数据追加到 _chunks：其它进程可能已在这之前追加过，
+            # 下一次检索时从 _chunks_offset 增量补读，保证与向量逐行对应；向量文件届时重新映射。
+            self._vectors = None
+
+    def _repair(self) -> None:
+        """打开后首次读写前对齐两份文件（调用方持有写锁）。
+
+        崩溃可能留下没有对应向量的元数据行或半行，不截掉的话后续追加的元数据会与向量错位；
+        反之元数据行不足时截掉多出的向量。
+        """
+
+        if self._repaired:
+            return
+        self._repaired = True
+        count = len(self)
+        lines = offset = 0
+        if self._chunks_path.exists():
+            with self._chunks_path.open("r+b") as fh:
+                for line in fh:
+                    if lines == count or not line.endswith(b"\n"):
+                        break
+                    lines += 1
+                    offset += len(line)
+                fh.truncate(offset)
+        if lines < count:
+            with self._vectors_path.open("r+b") as fh:
+                fh.truncate(lines * self.dim * 4)
+
+    def _read_chunks(self, count: int) -> list[dict[str, Any]]:
+        """把元数据补读到 ``count`` 行：从上次读到的位置继续，只解析新增的行。"""
+
+        if self._chunks is None or len(self._chunks) > count:
+            self._chunks, self._chunks_offset = [], 0
+        if len(self._chunks) < count:
+            with self._chunks_path.open("rb") as fh:
+                fh.seek(self._chunks_offset)
+                while len(self._chunks) < count:
+                    line = fh.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    self._chunks.append(json.loads(line))
+                    self._chunks_offset += len(line)
+        return self._chunks
+
+    def _load(self) -> tuple[np.ndarray, list[dict[str, Any]]]:
+        with self._lock:
+            self._repair()
+            count = len(self)
+            # 其它进程追加后磁盘上的行数变化：常驻（warm）的索引也要重新映射才能检索到新行
+            if self._vectors is None or self._vectors.shape[0] != count:
+                if count == 0:
+                    self._vectors = np.empty((0, self.dim), dtype=np.float32)
+                else:
+                    self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+            # 元数据与已映射的向量行数对齐；其它进程追加的行在这里补读，不会与向量错位
+            return self._vectors, self._read_chunks(self._vectors.shape[0])
+
+    def warm(self) -> None:
+        """预先建立内存映射并加载元数据，使首次检索不承担冷启动开销。"""
+
+        self._load()
+
+    def release(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._chunks = None
+            self._chunks_offset = 0
+
+    def search(self, query: np.ndarray, k: int = 5) -> list[SearchHit]:
+        vectors, chunks = self._load()
+        if not len(chunks) or k <= 0:
+            return []
+        scores = vectors @ np.asarray(query, dtype=np.float32)
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(
+                score=float(scores[i]),
+                task_id=chunks[i]["task_id"],
+                chunk_index=chunks[i]["chunk_index"],
+                text=chunks[i]["text"],
+            )
+            for i in top
+        ]
+
+
+class _FileLock:
+    """目录锁：进程内用 ``threading.Lock``，跨进程对目录下的 ``.lock`` 文件加 ``flock``。
+
+    每个 API worker 进程都会在后台执行入库，只靠线程锁无法与其它进程的写入互斥。
+    """
+
+    LOCK_FILE = ".lock"
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._fh: Any = None
+
+    def __enter__(self) -> None:
+        self._lock.acquire()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._fh = (self.directory / self.LOCK_FILE).open("a+b")
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            self._lock.release()
+            raise
+
+    def __exit__(self, *exc_info: object) -> None:
+        try:
+            self._fh.close()  # 关闭文件即释放 flock
+            self._fh = None
+        finally:
+            self._lock.release()
+
+
+# 锁随最后一个引用它的索引实例一起回收，不会随智星数量无限增长。
+_file_locks: weakref.WeakValueDictionary[str, _FileLock] = weakref.WeakValueDictionary()
+_indexes: OrderedDict[str, LocalVectorIndex] = OrderedDict()
+_indexes_lock = threading.RLock()
+
+
+def _file_lock(directory: Path) -> _FileLock:
+    with _indexes_lock:
+        lock = _file_locks.get(directory.name)
+        if lock is None:
+            lock = _file_locks[directory.name] = _FileLock(directory)
+        return lock
+
+
+def open_index(star_id: UUID) -> LocalVectorIndex:
+    """获取（必要时创建）某颗智星的本地索引，并把它标记为最近使用。
+
+    超过 ``vector_index_warm_stars`` 时淘汰最久未用的索引，释放其内存映射与元数据。
+    """
+
+    settings = get_settings()
+    name = index_name(star_id)
+    evicted: list[LocalVectorIndex] = []
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            index = LocalVectorIndex(Path(settings.vector_index_dir) / name, dim=settings.embedding_dim)
+            _indexes[name] = index
+        else:
+            _indexes.move_to_end(name)
+        while len(_indexes) > settings.vector_index_warm_stars:
+            _, cold = _indexes.popitem(last=False)
+            evicted.append(cold)
+    for cold in evicted:
+        cold.release()
+    return index
@@ -0,0 +1,45 @@
+"""测试公共夹具：在导入应用模块之前把数据库、向量索引与对象存储指向临时目录。"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from collections.abc import Iterator
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="mystar-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite+aiosqlite:///{_TMP}/test.db",
+    DB_SCHEMA_MODE="create",
+    STARTUP_WARMUP="off",
+    EVENTS_RELAY_ENABLED="false",
+    VECTOR_INDEX_DIR=f"{_TMP}/vectors",
+    OBJECT_STORE_BACKEND="local",
+    OBJECT_STORE_LOCAL_DIR=f"{_TMP}/objects",
+    REDIS_URL="",
+    RATE_LIMIT_ENABLED="false",  # 测试客户端共用一个地址；限流行为在 test_rate_limit.py 中单独覆盖
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def client() -> Iterator:
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def create_star(client, name: str = "测试智星", domain: str = "测试星域") -> str:
+    response = client.post(
+        "/graphql",
+        json={"query": "mutation($n: String!, $d: String!) { createStar(name: $n, domain: $d) { id } }", "variables": {"n": name, "d": domain}},
+    )
+    return response.json()["data"]["createStar"]["id"]
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+
+from conftest import create_star
+
+import routes_agent
+
+
+def test_websocket_reports_generation_errors(client, monkeypatch) -> None:
+    async def failing_reply(star, messages) -> AsyncIterator[str]:
+        yield "部分"
+        raise RuntimeError("backend crashed")
+
+    monkeypatch.setattr(routes_agent, "generate_reply", failing_reply)
+    star_id = create_star(client)
+    request = {"star_id": star_id, "messages": [{"role": "user", "content": "你好"}]}
+
+    with client.websocket_connect("/agent/v1/chat/ws") as ws:
+        ws.send_json(request)
+        assert ws.receive_json() == {"type": "token", "content": "部分"}
+        error = ws.receive_json()
+        assert error["type"] == "error"
+        assert "RuntimeError" in error["detail"]
+
+        # 出错后连接仍可继续发起下一轮
+        ws.send_json(request)
+        assert ws.receive_json()["type"] == "token"
+        assert ws.receive_json()["type"] == "error"
+
+
+def test_stream_releases_generation_slot_on_early_disconnect(client) -> None:
+    import asyncio
+    import json
+
+    from main import app
+    from rate_limit import get_generation_slots
+
+    star_id = create_star(client)
+    body = json.dumps({"star_id": star_id, "messages": [{"role": "user", "content": "你好"}]}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/agent/v1/chat",
+        "raw_path": b"/agent/v1/chat",
+        "query_string": b"stream=true",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("203.0.113.9", 5000),
+        "server": ("testserver", 80),
+    }
+    messages = iter([{"type": "http.request", "body": body, "more_body": False}])
+
+    async def receive() -> dict:
+        # 请求体之后客户端立即断开，响应还没来得及发出第一个事件
+        return next(messages, {"type": "http.disconnect"})
+
+    async def send(message: dict) -> None:
+        await asyncio.sleep(0.01)  # 写出响应头时让出事件循环，断开先被察觉
+
+    before = get_generation_slots().in_flight
+    client.portal.call(app, scope, receive, send)
+
+    assert get_generation_slots().in_flight == before
+
+
+def test_session_message_is_rate_limited_before_loading_the_conversation(client, monkeypatch) -> None:
+    from uuid import uuid4
+
+    from rate_limit import Limit, RateLimiter
+
+    limiter = RateLimiter({"chat:user": Limit(rate=0.001, burst=1)}, max_keys=10)
+    monkeypatch.setattr(routes_agent, "get_rate_limiter", lambda: limiter)
+    url = f"/agent/v1/session/{uuid4()}/message"
+
+    assert client.post(url, json={"content": "你好"}).status_code == 404
+    assert client.post(url, json={"content": "你好"}).status_code == 429
@@ -0,0 +1,71 @@
+"""single-flight：并发未命中只回源一次；领头请求被取消时等待者接手，而不是一起收到 CancelledError。"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from cache import TwoTierCache
+
+
+class CountingLoader:
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return "value"
+
+    async def many(self, keys: list[str]) -> dict[str, str]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {key: f"value:{key}" for key in keys}
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_load_once() -> None:
+    cache = TwoTierCache(None, max_entries=16, local_ttl=1)
+    load = CountingLoader()
+
+    values = await asyncio.gather(*(cache.get_or_load("ns", "k", load, ttl=60) for _ in range(5)))
+
+    assert values == ["value"] * 5
+    assert load.calls == 1
+
+
+@pytest.mark.anyio
+async def test_waiters_survive_leader_cancellation() -> None:
+    cache = TwoTierCache(None, max_entries=16, local_ttl=1)
+    load = CountingLoader()
+
+    leader = asyncio.create_task(cache.get_or_load("ns", "k", load, ttl=60))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_load("ns", "k", load, ttl=60)) for _ in range(3)]
+    batch = asyncio.create_task(cache.get_many_or_load("ns", ["k"], load.many, ttl=60))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    assert await asyncio.gather(*waiters) == ["value"] * 3
+    assert await batch == ["value"]
+    assert leader.cancelled()
+    assert load.calls == 2  # 被取消的一次 + 接手的一次
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_does_not_take_over() -> None:
+    cache = TwoTierCache(None, max_entries=16, local_ttl=1)
+    load = CountingLoader()
+
+    leader = asyncio.create_task(cache.get_or_load("ns", "k", load, ttl=60))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("ns", "k", load, ttl=60))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+
+    assert await leader == "value"
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert load.calls == 1
@@ -0,0 +1,63 @@
+"""GraphQL 列表查询的 SQL 条数不随返回的智星数增长（逐行字段经 DataLoader 合并为批量查询）。"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import pytest
+from conftest import create_star
+from sqlalchemy import event
+
+import db
+from cache import MAGNITUDE, STARS, get_cache
+
+STARS_QUERY = """
+query($domain: String!) {
+  stars(filter: {domain: $domain}, first: 50) {
+    edges { node { id name latestMagnitude owner { email } } }
+  }
+}
+"""
+
+
+@contextmanager
+def count_statements() -> Iterator[list[str]]:
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore[no-untyped-def]
+        statements.append(statement)
+
+    event.listen(db.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine.sync_engine, "before_cursor_execute", record)
+
+
+def _query_stars(client, domain: str) -> tuple[int, list[str]]:
+    client.portal.call(get_cache().invalidate, STARS)
+    client.portal.call(get_cache().invalidate, MAGNITUDE)
+    with count_statements() as statements:
+        response = client.post("/graphql", json={"query": STARS_QUERY, "variables": {"domain": domain}})
+    body = response.json()
+    assert "errors" not in body, body
+    edges = body["data"]["stars"]["edges"]
+    assert all(edge["node"]["owner"] is not None for edge in edges)
+    return len(edges), statements
+
+
+@pytest.mark.parametrize("evaluated", [False, True])
+def test_star_list_query_count_is_constant(client, evaluated: bool) -> None:
+    counts = {}
+    for n in (1, 50):
+        domain = f"查询计数-{n}-{evaluated}"
+        for i in range(n):
+            create_star(client, name=f"智星{i}", domain=domain)
+        if evaluated:
+            assert client.post("/evaluator/v1/run", json={"domain": domain}).status_code == 200
+        returned, statements = _query_stars(client, domain)
+        assert returned == n
+        counts[n] = len(statements)
+
+    assert counts[1] == counts[50], counts
@@ -0,0 +1,47 @@
+"""推理调度：流式请求的 token 缓冲有界，读得慢的消费者只暂停自己的序列，不拖慢同批次的其它请求。"""
+
+from __future__ import annotations
+
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from inference import FakeBackend, GenerationRequest, InferenceScheduler
+
+
+@pytest.mark.anyio
+async def test_slow_stream_consumer_is_paused_not_buffered() -> None:
+    scheduler = InferenceScheduler(FakeBackend(), max_batch_size=4, max_wait_ms=1, stream_buffer=4)
+    request = GenerationRequest(prompt="一段足够长的提示词" * 20, max_new_tokens=64)
+    slow = scheduler.stream(uuid4(), request)
+    try:
+        first = await slow.__anext__()
+        # 慢消费者不再读取期间，另一个请求照常完成
+        other = await scheduler.complete(uuid4(), request)
+        sequence = next(s for s in scheduler._running if s.tokens is not None)
+        assert sequence.paused
+        assert sequence.tokens.qsize() <= scheduler.stream_buffer
+        assert len(sequence.output) <= scheduler.stream_buffer + 1
+
+        rest = [token async for token in slow]
+        assert first + "".join(rest) == other
+    finally:
+        await slow.aclose()
+        await scheduler.close()
+
+
+@pytest.mark.anyio
+async def test_abandoned_paused_stream_is_released() -> None:
+    scheduler = InferenceScheduler(FakeBackend(), max_batch_size=4, max_wait_ms=1, stream_buffer=2)
+    request = GenerationRequest(prompt="提示词" * 50, max_new_tokens=64)
+    stream = scheduler.stream(uuid4(), request)
+    try:
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["running"] == 0
+        assert scheduler.stats()["cancelled"] == 1
+    finally:
+        await scheduler.close()
@@ -0,0 +1,222 @@
+"""星尘入库：payload_uri 只接受上传签发的对象；向量索引在崩溃后保持与元数据对齐。"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from conftest import create_star
+
+
+@pytest.mark.parametrize(
+    "payload_uri",
+    [
+        "/etc/passwd",
+        "file:///etc/passwd",
+        "s3://other-bucket/sha256/ab/" + "ab" + "0" * 62,
+        "s3://knowledge-raw/../../etc/passwd",
+        "s3://knowledge-raw/notes/readme.txt",
+    ],
+)
+def test_ingest_rejects_unissued_payload_uri(client, payload_uri: str) -> None:
+    star_id = create_star(client)
+
+    single = client.post("/knowledge/v1/uploads", json={"star_id": star_id, "payload_uri": payload_uri})
+    batch = client.post("/knowledge/v1/uploads:batch", json=[{"star_id": star_id, "payload_uri": payload_uri}])
+
+    assert single.status_code == 400
+    assert batch.status_code == 400
+
+
+def test_ingest_accepts_uploaded_payload_uri(client) -> None:
+    star_id = create_star(client)
+    uploaded = client.post(
+        "/knowledge/v1/uploads",
+        data={"star_id": star_id},
+        files={"file": ("notes.txt", "星尘内容".encode() * 100, "text/plain")},
+    )
+    assert uploaded.status_code == 200
+
+    other_star = create_star(client)
+    reused = client.post(
+        "/knowledge/v1/uploads",
+        json={"star_id": other_star, "payload_uri": uploaded.json()["payload_uri"]},
+    )
+    assert reused.status_code == 200
+    task = client.get(f"/knowledge/v1/tasks/{reused.json()['task_id']}").json()
+    assert task["status"] == "completed"
+    assert task["chunk_count"] > 0
+
+
+def test_vector_index_drops_orphan_metadata(tmp_path) -> None:
+    from vector_index import LocalVectorIndex
+
+    directory = tmp_path / f"star_{uuid4().hex}"
+    index = LocalVectorIndex(directory, dim=4)
+    index.add(np.eye(4, dtype=np.float32)[:2], [{"task_id": "t", "chunk_index": i, "text": f"c{i}"} for i in range(2)])
+    # 模拟写完元数据、尚未写向量时崩溃：多出一整行和半行元数据
+    with (directory / LocalVectorIndex.CHUNKS_FILE).open("a", encoding="utf-8") as fh:
+        fh.write(json.dumps({"task_id": "t", "chunk_index": 2, "text": "orphan"}) + "\n" + '{"task_id": "t"')
+
+    reopened = LocalVectorIndex(directory, dim=4)
+    reopened.add(np.eye(4, dtype=np.float32)[3:], [{"task_id": "t", "chunk_index": 2, "text": "c3"}])
+
+    hit = reopened.search(np.eye(4, dtype=np.float32)[3], k=1)[0]
+    assert hit.text == "c3"
+    assert len((directory / LocalVectorIndex.CHUNKS_FILE).read_text(encoding="utf-8").splitlines()) == len(reopened) == 3
+
+
+def _append_rows(directory: Path, worker: int, rows: int) -> None:
+    from vector_index import LocalVectorIndex
+
+    index = LocalVectorIndex(directory, dim=2)
+    for i in range(rows):
+        index.add(np.array([[worker, i]], dtype=np.float32), [{"task_id": str(worker), "chunk_index": i, "text": f"{worker}:{i}"}])
+
+
+def test_vector_index_stays_aligned_across_processes(tmp_path) -> None:
+    import multiprocessing
+
+    from vector_index import LocalVectorIndex
+
+    directory = tmp_path / f"star_{uuid4().hex}"
+    warm = LocalVectorIndex(directory, dim=2)
+    _append_rows(directory, 9, 1)
+    warm.warm()
+    # 每个 API worker 进程都会入库：多个进程交替向同一索引追加
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_append_rows, args=(directory, w, 20)) for w in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+    warm.add(np.array([[7, 0]], dtype=np.float32), [{"task_id": "7", "chunk_index": 0, "text": "7:0"}])
+
+    vectors, chunks = warm._load()
+    assert len(vectors) == len(chunks) == len(warm) == 62
+    assert [chunk["text"] for chunk in chunks] == [f"{int(w)}:{int(i)}" for w, i in vectors]
+
+
+def test_warm_vector_index_sees_rows_from_other_processes(tmp_path) -> None:
+    import multiprocessing
+
+    from vector_index import LocalVectorIndex
+
+    directory = tmp_path / f"star_{uuid4().hex}"
+    _append_rows(directory, 1, 1)
+    warm = LocalVectorIndex(directory, dim=2)
+    warm.warm()
+    worker = multiprocessing.get_context("fork").Process(target=_append_rows, args=(directory, 5, 3))
+    worker.start()
+    worker.join(30)
+
+    hit = warm.search(np.array([5, 2], dtype=np.float32), k=1)[0]
+    assert hit.text == "5:2"
+
+
+def test_upload_limits_are_checked_before_storing(client, monkeypatch) -> None:
+    from config import get_settings
+
+    star_id = create_star(client)
+    objects = Path(get_settings().object_store_local_dir)
+    before = sorted(objects.rglob("*"))
+    monkeypatch.setattr(get_settings(), "upload_max_bytes", 1024)
+
+    too_large = client.post(
+        "/knowledge/v1/uploads",
+        data={"star_id": star_id},
+        files={"file": ("big.txt", b"x" * 4096, "text/plain")},
+    )
+    # 文件部分在 star_id 之前：无法先按智星限流，直接拒绝
+    file_first = client.post(
+        "/knowledge/v1/uploads",
+        files=[("file", ("a.txt", b"abc", "text/plain")), ("star_id", (None, star_id))],
+    )
+
+    assert too_large.status_code == 413
+    assert file_first.status_code == 422
+    assert sorted(p for p in objects.rglob("*") if p.is_file()) == [p for p in before if p.is_file()]
+
+
+class FakeMinio:
+    def __init__(self) -> None:
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.parts: list[int] = []
+        self.copies = 0
+
+    def bucket_exists(self, bucket: str) -> bool:
+        return True
+
+    def stat_object(self, bucket: str, key: str) -> object:
+        from minio.error import S3Error
+
+        if (bucket, key) not in self.objects:
+            raise S3Error(response=None, code="NoSuchKey", message="missing", resource=key, request_id="", host_id="")
+        return object()
+
+    def put_object(self, bucket: str, key: str, data, length: int, part_size: int) -> None:
+        assert length == -1  # 未知长度：按分片边读边传
+        body = b""
+        while part := data.read(part_size):
+            self.parts.append(len(part))
+            body += part
+        self.objects[bucket, key] = body
+
+    def copy_object(self, bucket: str, key: str, source) -> None:
+        self.copies += 1
+        self.objects[bucket, key] = self.objects[source.bucket_name, source.object_name]
+
+    def remove_object(self, bucket: str, key: str) -> None:
+        del self.objects[bucket, key]
+
+
+@pytest.mark.anyio
+async def test_minio_store_streams_through_staging_key() -> None:
+    pytest.importorskip("minio")
+    from object_store import MinioObjectStore
+
+    store = MinioObjectStore("localhost:9000", "key", "secret", secure=False, part_size=16)
+    store.client = FakeMinio()
+
+    async def chunks():
+        for _ in range(10):
+            yield b"0123456789"
+
+    first = await store.put_stream("knowledge-raw", chunks())
+    second = await store.put_stream("knowledge-raw", chunks())
+
+    assert max(store.client.parts) == 16
+    assert store.client.copies == 1  # 重复内容只删除暂存对象，不再复制
+    assert store.client.objects == {("knowledge-raw", first.key): b"0123456789" * 10}
+    assert (first.deduplicated, second.deduplicated) == (False, True)
+    assert first.key == second.key == f"sha256/{first.sha256[:2]}/{first.sha256}"
+
+
+def test_backfill_is_charged_per_item_and_star(client, monkeypatch) -> None:
+    import routes_knowledge
+    from rate_limit import Limit, RateLimiter
+
+    limiter = RateLimiter(
+        {"backfill:user": Limit(rate=0.001, burst=100), "backfill:star": Limit(rate=0.001, burst=3)}, max_keys=100,
+    )
+    monkeypatch.setattr(routes_knowledge, "get_rate_limiter", lambda: limiter)
+    crowded, other = create_star(client), create_star(client)
+
+    def items(star_id: str, n: int) -> list[dict]:
+        return [{"star_id": star_id, "content": f"星尘 {i}"} for i in range(n)]
+
+    rejected = client.post("/knowledge/v1/uploads:batch", json=items(crowded, 2) + items(other, 2) + items(crowded, 2))
+    accepted = client.post("/knowledge/v1/uploads:batch", json=items(other, 1) + items(crowded, 3))
+    mutation = "mutation($items: [KnowledgeInput!]!) { ingestKnowledgeBatch(items: $items) }"
+    variables = {"items": [{"starId": crowded, "content": "星尘"}]}
+    graphql = client.post("/graphql", json={"query": mutation, "variables": variables}).json()
+
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"]
+    assert accepted.status_code == 200
+    assert "rate limit exceeded for this star" in graphql["errors"][0]["message"]
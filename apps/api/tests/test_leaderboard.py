@@ -0,0 +1,38 @@
+"""星等排行榜：Redis 镜像尚未由 rebuild 完整建立时读数据库，不返回空榜或残缺榜。"""
+
+from __future__ import annotations
+
+from uuid import uuid4
+
+import pytest
+from conftest import create_star
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def test_leaderboard_reads_database_until_mirror_is_built(client, monkeypatch) -> None:
+    import leaderboard
+    from db import SessionFactory
+
+    domain = f"榜单-{uuid4().hex[:8]}"
+    stars = [create_star(client, name=f"智星{i}", domain=domain) for i in range(3)]
+    assert client.post("/evaluator/v1/run", json={"domain": domain}).status_code == 200
+
+    # Redis 被清空后只有一颗星重新评估：榜单 key 存在但不完整
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(leaderboard, "get_redis", lambda: redis)
+    client.portal.call(lambda: redis.zadd(f"leaderboard:domain:{domain}:all", {stars[0]: 99.0}))
+
+    async def read() -> tuple[list[str], leaderboard.StarRank]:
+        async with SessionFactory() as session:
+            entries = await leaderboard.top(session, domain=domain)
+            rank = await leaderboard.rank_of(session, entries[-1].star_id, domain=domain)
+        return [str(entry.star_id) for entry in entries], rank
+
+    from_db, rank = client.portal.call(read)
+    assert sorted(from_db) == sorted(stars)
+    assert (rank.rank, rank.total) == (3, 3)
+
+    client.portal.call(leaderboard.rebuild)
+    assert client.portal.call(redis.exists, leaderboard.BUILT_KEY)
+    assert client.portal.call(read) == (from_db, rank)
@@ -0,0 +1,105 @@
+"""准入控制：令牌桶的突发与补充、多个桶同时扣减、Redis 上的全局额度，以及限流用的用户标识。"""
+
+from __future__ import annotations
+
+from uuid import uuid4
+
+import pytest
+from starlette.requests import Request
+
+import rate_limit
+from config import get_settings
+from rate_limit import GenerationSlots, Limit, RateLimited, RateLimiter, TokenBuckets, client_key
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_allows_burst_then_refills(clock: FakeClock) -> None:
+    buckets = TokenBuckets(max_keys=10)
+    rules = [("chat:user:a", Limit(rate=2.0, burst=3))]
+
+    assert [buckets.take(rules)[0] for _ in range(4)] == [-1, -1, -1, 0]
+    assert buckets.take(rules)[1] == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert buckets.take(rules) == (-1, 0.0)
+    assert buckets.take(rules)[0] == 0
+
+
+def test_rejected_request_takes_from_no_bucket(clock: FakeClock) -> None:
+    buckets = TokenBuckets(max_keys=10)
+    user, star = ("chat:user:a", Limit(rate=1.0, burst=5)), ("chat:star:s", Limit(rate=1.0, burst=1))
+
+    assert buckets.take([user, star])[0] == -1
+    assert buckets.take([user, star])[0] == 1  # 智星桶不足：用户桶也不扣减
+    assert [buckets.take([user])[0] for _ in range(5)] == [-1, -1, -1, -1, 0]
+
+
+@pytest.mark.anyio
+async def test_global_buckets_are_shared_between_workers(monkeypatch) -> None:
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(rate_limit, "get_redis", lambda: redis)
+    limits = {"chat:user": Limit(rate=0.001, burst=4), "chat:star": Limit(rate=0.001, burst=100)}
+    workers = [RateLimiter(limits, max_keys=10) for _ in range(2)]
+    star_id = uuid4()
+
+    admitted = 0
+    for i in range(8):
+        try:
+            await workers[i % 2].check("chat", user="user:a", star_id=star_id)
+            admitted += 1
+        except RateLimited as exc:
+            assert exc.limit == "user"
+            assert int(exc.headers["Retry-After"]) >= 1
+    assert admitted == 4  # 每个 worker 的进程内桶都还有余量，由全局桶拒绝
+
+    # 全局拒绝的请求退还进程内额度，也不扣减智星桶
+    await workers[0].check("chat", user="user:b", star_id=star_id)
+    tokens = float(await redis.hget(f"ratelimit:chat:star:{star_id}", "tokens"))
+    assert tokens == pytest.approx(100 - 5, abs=0.01)
+
+
+def _request(headers: dict[str, str]) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": ("203.0.113.7", 5000),
+        },
+    )
+
+
+def test_user_header_is_ignored_unless_trusted(monkeypatch) -> None:
+    request = _request({"X-User-Id": "u-1"})
+
+    assert client_key(request) == "ip:203.0.113.7"
+    monkeypatch.setattr(get_settings(), "rate_limit_trust_user_header", True)
+    assert client_key(request) == "user:u-1"
+    assert client_key(_request({})) == "ip:203.0.113.7"
+
+
+@pytest.mark.anyio
+async def test_generation_slots_reject_when_full() -> None:
+    slots = GenerationSlots(limit=1, retry_after_s=2)
+
+    async with slots.slot():
+        with pytest.raises(RateLimited) as excinfo:
+            slots.acquire()
+        assert excinfo.value.limit == "capacity"
+    slots.acquire()
+    assert slots.in_flight == 1
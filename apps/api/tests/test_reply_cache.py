@@ -0,0 +1,27 @@
+"""对话回复缓存：只有上文（摘要 + 历史）与问题都相同的对话才复用回复。"""
+
+from __future__ import annotations
+
+from uuid import uuid4
+
+from llm import ChatMessage
+from models import Star
+from reply_cache import ReplyCache
+
+
+def test_reply_is_not_shared_between_conversations_with_different_history() -> None:
+    cache = ReplyCache(max_entries=10, max_bytes=1 << 20, ttl=60)
+    star = Star(owner_id=uuid4(), name="织女", domain="天文")
+    question = ChatMessage(role="user", content="那它离我们多远？")
+    alice = [ChatMessage(role="user", content="介绍一下织女星"), ChatMessage(role="assistant", content="织女星是……"), question]
+    bob = [
+        ChatMessage(role="system", content="此前对话摘要：\n用户在问仙女座星系"),
+        ChatMessage(role="user", content="介绍一下仙女座"),
+        question,
+    ]
+
+    cache.store(star, alice, "约 25 光年。", latency=1.0)
+
+    assert cache.lookup(star, bob) is None
+    assert cache.lookup(star, list(alice)) == "约 25 光年。"
+    assert cache.lookup(star, [question]) is None
@@ -0,0 +1,125 @@
+"""星技调用网关：熔断只统计真正发出的请求；等不到并发名额记为 saturated；api_endpoint 不能指向内网地址，连接只建立到检查过的地址。"""
+
+from __future__ import annotations
+
+import asyncio
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from config import get_settings
+from skill_gateway import SkillError, SkillGateway, SkillSpec, SkillTimeout, SkillUnavailable, _stub_app
+
+
+def _gateway(monkeypatch) -> SkillGateway:
+    monkeypatch.setattr(get_settings(), "skill_allowed_hosts", ["skills.test"])
+    gateway = SkillGateway(
+        pool_connections=10,
+        pool_keepalive=10,
+        keepalive_expiry_s=5,
+        breaker_failures=3,
+        breaker_reset_s=60,
+    )
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_stub_app()))
+    monkeypatch.setattr(gateway, "_client", lambda endpoint: client)
+    return gateway
+
+
+def _spec(path: str, *, timeout_s: float = 1.0, max_concurrency: int = 4) -> SkillSpec:
+    return SkillSpec(
+        id=uuid4(),
+        name=path.strip("/"),
+        api_endpoint=f"http://skills.test{path}",
+        timeout_s=timeout_s,
+        max_concurrency=max_concurrency,
+        cache_ttl_s=None,
+    )
+
+
+@pytest.mark.anyio
+async def test_breaker_opens_after_consecutive_failures(monkeypatch) -> None:
+    gateway = _gateway(monkeypatch)
+    spec = _spec("/fail")
+
+    for _ in range(3):
+        with pytest.raises(SkillError):
+            await gateway._call(spec, {})
+
+    assert gateway.breaker_state(spec.id) == "open"
+    with pytest.raises(SkillUnavailable, match="circuit open"):
+        await gateway._call(spec, {})
+
+
+@pytest.mark.anyio
+async def test_saturation_is_not_counted_against_the_breaker(monkeypatch) -> None:
+    gateway = _gateway(monkeypatch)
+    spec = _spec("/slow?ms=600", timeout_s=0.1, max_concurrency=1)
+    busy = _spec("/slow?ms=600", timeout_s=2.0, max_concurrency=1)
+    busy.id = spec.id  # 共用同一个星技的并发名额
+
+    holder = asyncio.create_task(gateway._call(busy, {}))
+    await asyncio.sleep(0.02)
+    for _ in range(4):
+        with pytest.raises(SkillTimeout, match="saturated"):
+            await gateway._call(spec, {})
+    assert await holder == ({"echo": {}}, 200)
+
+    assert gateway.breaker_state(spec.id) == "closed"
+    assert gateway._states[spec.id].breaker.failures == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "endpoint",
+    [
+        "http://127.0.0.1:8765/echo",
+        "http://localhost/echo",
+        "http://169.254.169.254/latest/meta-data/",
+        "http://10.0.0.5/echo",
+        "http://[::1]/echo",
+        "file:///etc/passwd",
+    ],
+)
+async def test_private_endpoints_are_blocked(monkeypatch, endpoint: str) -> None:
+    gateway = _gateway(monkeypatch)
+    spec = _spec("/echo")
+    spec.api_endpoint = endpoint
+
+    with pytest.raises(SkillUnavailable) as excinfo:
+        await gateway._call(spec, {})
+
+    assert excinfo.value.status_code == 403
+    assert gateway.breaker_state(spec.id) == "closed"
+
+
+class RecordingBackend:
+    def __init__(self) -> None:
+        self.connected: list[tuple[str, int]] = []
+
+    async def connect_tcp(self, host: str, port: int, **kwargs) -> None:
+        import httpcore
+
+        self.connected.append((host, port))
+        raise httpcore.ConnectError("recorded")
+
+
+@pytest.mark.anyio
+async def test_connections_are_pinned_to_the_checked_address(monkeypatch) -> None:
+    gateway = SkillGateway(pool_connections=1, pool_keepalive=1, keepalive_expiry_s=5, breaker_failures=3, breaker_reset_s=60)
+    spec = _spec("/echo")
+    spec.api_endpoint = "http://rebind.test:8080/echo"
+    answers = iter(["93.184.216.34", "127.0.0.1"])  # 检查时是公网地址，之后重新解析到回环地址
+
+    async def getaddrinfo(host, port, **kwargs):
+        return [(None, None, None, "", (next(answers), 0))]
+
+    monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", getaddrinfo)
+    backend = RecordingBackend()
+    gateway._client(spec.api_endpoint)._transport._pool._network_backend._inner = backend
+
+    with pytest.raises(SkillError, match="unreachable"):
+        await gateway._call(spec, {})
+    await gateway.close()
+
+    assert backend.connected == [("93.184.216.34", 8080)]
@@ -0,0 +1,74 @@
+"""训练 worker：执行中的任务靠心跳续期不会被重复认领，崩溃 worker 的任务会被其他 worker 接手。"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "scripts" / "train"))
+
+from star_trainer import LocalDispatcher, StreamWorker, TrainJob, enqueue_job
+
+CLAIM_IDLE_MS = 200
+
+
+class RecordingJob:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.release = threading.Event()
+
+    def __call__(self, payload: dict) -> str:
+        self.calls.append(payload["job_id"])
+        self.release.wait(5)
+        return f"s3://artifacts/{payload['job_id']}"
+
+
+def _worker(client, job: RecordingJob, consumer: str) -> StreamWorker:
+    worker = StreamWorker(client, LocalDispatcher(job, max_workers=2), consumer=consumer, claim_idle_ms=CLAIM_IDLE_MS)
+    worker.ensure_group()
+    return worker
+
+
+def _pending(client, worker: StreamWorker) -> int:
+    return client.xpending(worker.stream, worker.group)["pending"]
+
+
+def test_long_running_job_is_not_reclaimed() -> None:
+    client = fakeredis.FakeRedis()
+    job = RecordingJob()
+    first, second = _worker(client, job, "trainer-1"), _worker(client, job, "trainer-2")
+    enqueue_job(TrainJob(job_id="j1", star_id="s1"), client)
+
+    assert first.run_once(block_ms=10, poll_timeout=0.01) == 1
+    deadline = time.monotonic() + CLAIM_IDLE_MS * 3 / 1000
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        first.run_once(block_ms=10, poll_timeout=0.01)
+        second.run_once(block_ms=10, poll_timeout=0.01)
+
+    job.release.set()
+    while first._in_flight:
+        first.run_once(block_ms=10, poll_timeout=0.1)
+    assert job.calls == ["j1"]
+    assert _pending(client, first) == 0
+
+
+def test_crashed_worker_job_is_claimed_by_another_worker() -> None:
+    client = fakeredis.FakeRedis()
+    job = RecordingJob()
+    job.release.set()
+    crashed, survivor = _worker(client, job, "trainer-1"), _worker(client, job, "trainer-2")
+    enqueue_job(TrainJob(job_id="j1", star_id="s1"), client)
+
+    assert len(crashed._read_new(1, None)) == 1  # 读到任务后未执行也未确认就退出
+    assert survivor.run_once(block_ms=10, poll_timeout=0.01) == 0
+
+    time.sleep(CLAIM_IDLE_MS * 1.5 / 1000)
+    assert survivor.run_once(block_ms=10, poll_timeout=1.0) == 1
+    assert job.calls == ["j1"]
+    assert _pending(client, survivor) == 0
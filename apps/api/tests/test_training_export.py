@@ -0,0 +1,51 @@
+"""训练数据导出：窗口终点落后当前时间 training_export_lag_s，刚写入（可能尚未提交完）的消息留给下一次导出。"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+import pytest
+from conftest import create_star
+
+pytest.importorskip("pyarrow")
+
+
+def test_export_window_lags_behind_now(client, tmp_path) -> None:
+    from db import SessionFactory
+    from models import Conversation, ConversationMessage
+    from training_export import export, read_manifest
+
+    star_id = UUID(create_star(client))
+    now = datetime.utcnow()
+
+    async def seed() -> None:
+        async with SessionFactory() as session:
+            conversation = Conversation(star_id=star_id)
+            session.add(conversation)
+            await session.flush()
+            for seq, created_at in enumerate([now - timedelta(hours=1), now], start=1):
+                session.add(
+                    ConversationMessage(
+                        conversation_id=conversation.id, seq=seq, role="user", content="星尘", created_at=created_at,
+                    ),
+                )
+            await session.commit()
+
+    client.portal.call(seed)
+    path, manifest = client.portal.call(lambda: export(star_id, until=now + timedelta(hours=1), out_root=tmp_path))
+
+    assert datetime.fromisoformat(manifest.data_end) <= now - timedelta(seconds=299)
+    assert read_manifest(path).message_rows == 1
+
+
+def test_export_accepts_timezone_aware_until(client, tmp_path) -> None:
+    from training_export import export
+
+    star_id = UUID(create_star(client))
+    until = datetime.now(timezone(timedelta(hours=8))) - timedelta(hours=1)
+
+    _, manifest = client.portal.call(lambda: export(star_id, until=until, out_root=tmp_path))
+
+    expected = until.astimezone(timezone.utc).replace(tzinfo=None)
+    assert datetime.fromisoformat(manifest.data_end) == expected
@@ -0,0 +1,57 @@
+"""星试作答：作答进行中新报名、id 排在生产者游标之前的条目也会在本轮结束后补答。"""
+
+from __future__ import annotations
+
+import asyncio
+from uuid import UUID, uuid4
+
+from conftest import create_star
+
+
+def test_entries_enrolled_during_a_run_are_answered(client) -> None:
+    from sqlmodel import select
+
+    from db import SessionFactory
+    from models import StarTrial, TrialEntry
+    from trial_runner import TrialRunner
+
+    stars = [UUID(create_star(client, name=f"应试{i}")) for i in range(3)]
+    base = uuid4().int >> 8 << 8  # 固定条目 id 的先后顺序
+    runner = TrialRunner(concurrency=1, flush_size=1, flush_interval=0.05, page_size=1)
+    release = asyncio.Event()
+    answered: list[UUID] = []
+
+    async def answer(entry_id: UUID, star, prompt: str) -> dict:
+        await release.wait()
+        answered.append(entry_id)
+        return runner._result(entry_id, "answered", response="已作答")
+
+    runner._answer = answer  # type: ignore[method-assign]
+
+    async def scenario() -> tuple[int, list[str]]:
+        async with SessionFactory() as session:
+            trial = StarTrial(title="补扫", prompt="自我介绍")
+            session.add(trial)
+            session.add_all([TrialEntry(id=UUID(int=base + n), trial_id=trial.id, star_id=stars[i]) for i, n in enumerate((10, 20))])
+            await session.commit()
+            trial_id = trial.id
+
+        run = runner.start(trial_id)
+        await asyncio.sleep(0.1)  # 生产者已读完两页，游标停在 base+20，worker 卡在第一条
+        assert run.total == 2 and not run.done
+        async with SessionFactory() as session:
+            session.add(TrialEntry(id=UUID(int=base + 5), trial_id=trial_id, star_id=stars[2]))
+            await session.commit()
+        assert runner.start(trial_id, enrolled=1) is run
+        assert run.total == 3
+        release.set()
+        await asyncio.wait_for(run.task, 5)  # type: ignore[arg-type]
+
+        async with SessionFactory() as session:
+            statuses = (await session.exec(select(TrialEntry.status).where(TrialEntry.trial_id == trial_id))).all()
+        return run.total, sorted(statuses)
+
+    total, statuses = client.portal.call(scenario)
+    assert total == 3
+    assert statuses == ["answered"] * 3
+    assert sorted(answered) == sorted(UUID(int=base + n) for n in (5, 10, 20))
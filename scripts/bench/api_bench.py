@@ -0,0 +1,546 @@
+"""API 离线压测：进程内启动 FastAPI ``app``，灌入测试数据后按目标并发驱动各路由，输出 JSON 报告。
+
+- 数据库默认用临时目录下的 SQLite（需要 aiosqlite），也可用 ``--database-url`` 指向本地 PostgreSQL；
+- 请求经 httpx 的 ASGITransport 直接进入应用，不经过网络栈，测得的是应用自身（路由、ORM、SQL）的耗时；
+- 每个场景统计 p50/p95/p99 延迟、吞吐与每请求 SQL 条数；上传场景的 SQL 含同请求内执行的入库后台任务；
+- 表结构通过 Alembic 迁移建立，应用以默认的 ``DB_SCHEMA_MODE=check`` 启动；
+- 冷启动在独立子进程中测量（导入 ``main`` + 启动事件 + 首个 GraphQL 请求），取多次中位数写入报告；
+  ``cold-start`` 子命令额外输出按模块的导入耗时排行，便于定位拖慢启动的依赖；
+- ``compare`` 子命令对比两份报告，任一场景 p95（或冷启动）回退超过阈值时以非零码退出，便于在提交之间比较。
+
+用法::
+
+    python api_bench.py run --concurrency 32 --duration 20 --out head.json
+    python api_bench.py run --stars 2000 --scenarios chat,graphql_stars --database-url postgresql+psycopg://...
+    python api_bench.py cold-start --runs 5 --target-ms 1500
+    python api_bench.py compare base.json head.json --threshold 0.10
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+API_DIR = REPO_ROOT / "apps" / "api"
+API_SRC = API_DIR / "src"
+
+# 子进程中执行：分段计时导入、启动事件与首个 GraphQL 请求（触发 schema 的按需构建）
+_COLD_START_PROBE = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+t1 = time.perf_counter()
+
+async def probe():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/graphql", json={"query": "{ health }"})
+            response.raise_for_status()
+        t3 = time.perf_counter()
+    return t2, t3
+
+t2, t3 = asyncio.run(probe())
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "startup_ms": (t2 - t1) * 1000, "first_graphql_ms": (t3 - t2) * 1000}))
+"""
+
+_query_counter: ContextVar[list[int] | None] = ContextVar("bench_query_counter", default=None)
+
+
+@dataclass
+class SeedConfig:
+    users: int = 50
+    stars: int = 500
+    tasks_per_star: int = 3
+    history_per_star: int = 5
+    trials: int = 100
+    skills: int = 100
+
+
+@dataclass
+class Sample:
+    latencies: list[float] = field(default_factory=list)
+    queries: list[int] = field(default_factory=list)
+    errors: int = 0
+    rate_limited: int = 0  # 429：准入控制拒绝，与真正的错误分开统计
+
+
+@dataclass
+class Context:
+    client: Any
+    star_ids: list[str]
+    domains: list[str]
+    rng: random.Random
+
+
+Scenario = Callable[[Context], Awaitable[Any]]
+
+
+# ---- 环境与数据准备 ----
+
+
+def _prepare_env(database_url: str | None, workdir: Path) -> str:
+    """在导入应用之前设置环境变量：应用模块在导入时读取配置并创建引擎。"""
+
+    url = database_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("VECTOR_INDEX_DIR", str(workdir / "vectors"))
+    os.environ.setdefault("OBJECT_STORE_BACKEND", "local")
+    os.environ.setdefault("OBJECT_STORE_LOCAL_DIR", str(workdir / "objects"))
+    os.environ.pop("REDIS_URL", None)  # 只测单进程应用本身，不依赖外部 Redis
+    # 所有压测 worker 共用同一个客户端地址，按用户限流会把压测变成测 429；需要时可显式设为 true
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    sys.path.insert(0, str(API_SRC))
+    return url
+
+
+async def _migrate() -> None:
+    """清空目标库后执行 ``alembic upgrade head``，与正式环境的建表方式一致。"""
+
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import text
+    from sqlmodel import SQLModel
+
+    import models  # noqa: F401
+    from db import engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    config = Config(str(API_DIR / "alembic.ini"))
+    config.attributes["configure_logger"] = False
+    # 迁移环境内部会 asyncio.run，放到线程里执行以免与当前事件循环冲突
+    await asyncio.to_thread(command.upgrade, config, "head")
+
+
+def measure_cold_start(runs: int) -> dict[str, Any]:
+    """在全新解释器中测量冷启动，返回各阶段中位数（毫秒）。"""
+
+    env = {**os.environ, "STARTUP_WARMUP": "off"}  # 只测就绪耗时；首个 GraphQL 请求单独计时
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _COLD_START_PROBE, str(API_SRC)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    result = {key: round(float(np.median([s[key] for s in samples])), 1) for key in samples[0]}
+    result["ready_ms"] = round(result["import_ms"] + result["startup_ms"], 1)
+    result["runs"] = runs
+    return result
+
+
+def import_profile(top: int) -> list[dict[str, Any]]:
+    """用 ``-X importtime`` 导入 ``main``，返回累计耗时最高的顶层依赖。"""
+
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {str(API_SRC)!r}); import main"],
+        env=os.environ,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    modules: list[dict[str, Any]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:  # main 本身及其直接依赖
+            modules.append(
+                {"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000},
+            )
+    modules.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return modules[:top]
+
+
+async def _seed(config: SeedConfig, domains: list[str]) -> list[str]:
+    from sqlalchemy import insert
+
+    import leaderboard
+    from db import engine
+    from models import KnowledgeTask, MagnitudeHistory, Skill, Star, StarTrial, User
+
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    users = [User(email=f"bench-{i}@example.com", display_name=f"bench {i}") for i in range(config.users)]
+    stars = [
+        Star(
+            owner_id=users[i % len(users)].id,
+            name=f"star-{i}",
+            domain=domains[i % len(domains)],
+            created_at=now - timedelta(minutes=i),
+        )
+        for i in range(config.stars)
+    ]
+    tasks = [
+        KnowledgeTask(star_id=star.id, status="completed", payload_uri=None, chunk_count=4, completed_at=now)
+        for star in stars
+        for _ in range(config.tasks_per_star)
+    ]
+    history = [
+        MagnitudeHistory(
+            star_id=star.id,
+            overall=round(rng.uniform(1.0, 5.0), 2),
+            level=f"L{rng.randint(1, 5)}",
+            evaluated_at=now - timedelta(days=rng.uniform(0, 45)),
+        )
+        for star in stars
+        for _ in range(config.history_per_star)
+    ]
+    trials = [StarTrial(title=f"trial-{i}", prompt="bench", created_at=now - timedelta(minutes=i)) for i in range(config.trials)]
+    skills = [Skill(name=f"skill-{i}", created_at=now - timedelta(minutes=i)) for i in range(config.skills)]
+
+    async with engine.begin() as conn:
+        for model, rows in (
+            (User, users),
+            (Star, stars),
+            (KnowledgeTask, tasks),
+            (MagnitudeHistory, history),
+            (StarTrial, trials),
+            (Skill, skills),
+        ):
+            if rows:
+                await conn.execute(insert(model), [row.model_dump() for row in rows])
+    await leaderboard.rebuild()
+    return [str(star.id) for star in stars]
+
+
+def _count_queries() -> None:
+    from sqlalchemy import event
+
+    from db import engine
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore[no-untyped-def]
+        counter = _query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+# ---- 场景 ----
+
+
+class Throttled(RuntimeError):
+    """请求被限流（429）。"""
+
+
+async def _expect(response: Any) -> Any:
+    if response.status_code == 429:
+        raise Throttled(f"{response.request.method} {response.request.url.path} -> 429")
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} -> {response.status_code}")
+    return response
+
+
+async def chat(ctx: Context) -> Any:
+    body = {"star_id": ctx.rng.choice(ctx.star_ids), "messages": [{"role": "user", "content": f"问题 {ctx.rng.randint(0, 10**6)}"}]}
+    return await _expect(await ctx.client.post("/agent/v1/chat", json=body))
+
+
+async def upload(ctx: Context) -> Any:
+    body = {"star_id": ctx.rng.choice(ctx.star_ids), "content": f"压测笔记 {ctx.rng.random()} " * 20}
+    return await _expect(await ctx.client.post("/knowledge/v1/uploads", json=body))
+
+
+async def evaluate(ctx: Context) -> Any:
+    return await _expect(await ctx.client.post("/evaluator/v1/run", json={"star_id": ctx.rng.choice(ctx.star_ids)}))
+
+
+async def list_trials(ctx: Context) -> Any:
+    return await _expect(await ctx.client.get("/community/v1/trials", params={"first": 20}))
+
+
+async def list_skills(ctx: Context) -> Any:
+    return await _expect(await ctx.client.get("/skills/v1", params={"first": 20}))
+
+
+async def leaderboard_top(ctx: Context) -> Any:
+    params = {"domain": ctx.rng.choice([None, *ctx.domains]), "window": ctx.rng.choice(["all", "7d"]), "limit": 50}
+    return await _expect(await ctx.client.get("/evaluator/v1/leaderboard", params={k: v for k, v in params.items() if v}))
+
+
+async def graphql_stars(ctx: Context) -> Any:
+    query = "query($domain: String) { stars(filter: {domain: $domain}, first: 20) { edges { node { id name domain latestMagnitude } } } }"
+    body = {"query": query, "variables": {"domain": ctx.rng.choice(ctx.domains)}}
+    response = await _expect(await ctx.client.post("/graphql", json=body))
+    if response.json().get("errors"):
+        raise RuntimeError(str(response.json()["errors"])[:200])
+    return response
+
+
+async def graphql_star(ctx: Context) -> Any:
+    body = {"query": "query($id: String!) { star(id: $id) { id name latestMagnitude } }", "variables": {"id": ctx.rng.choice(ctx.star_ids)}}
+    response = await _expect(await ctx.client.post("/graphql", json=body))
+    if response.json().get("errors"):
+        raise RuntimeError(str(response.json()["errors"])[:200])
+    return response
+
+
+SCENARIOS: dict[str, tuple[Scenario, int]] = {
+    # 名称 -> (场景, 混合权重)
+    "chat": (chat, 3),
+    "upload": (upload, 1),
+    "evaluate": (evaluate, 1),
+    "list_trials": (list_trials, 2),
+    "list_skills": (list_skills, 2),
+    "leaderboard": (leaderboard_top, 2),
+    "graphql_stars": (graphql_stars, 3),
+    "graphql_star": (graphql_star, 3),
+}
+
+
+# ---- 执行与报告 ----
+
+
+async def _worker(ctx: Context, names: list[str], weights: list[int], samples: dict[str, Sample], deadline: float, budget: list[int]) -> None:
+    while time.perf_counter() < deadline and budget[0] != 0:
+        budget[0] -= 1
+        name = ctx.rng.choices(names, weights)[0]
+        counter = [0]
+        token = _query_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            await SCENARIOS[name][0](ctx)
+        except Throttled:
+            samples[name].rate_limited += 1
+            continue
+        except Exception:  # 计入错误数，继续压测
+            samples[name].errors += 1
+            continue
+        finally:
+            _query_counter.reset(token)
+        samples[name].latencies.append(time.perf_counter() - start)
+        samples[name].queries.append(counter[0])
+
+
+def _summarize(sample: Sample, elapsed: float) -> dict[str, Any]:
+    if not sample.latencies:
+        return {"count": 0, "errors": sample.errors, "rate_limited": sample.rate_limited}
+    latencies = np.asarray(sample.latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "count": len(latencies),
+        "errors": sample.errors,
+        "rate_limited": sample.rate_limited,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(latencies.max()), 3),
+        "queries_per_request": round(float(np.mean(sample.queries)), 2),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    import httpx
+
+    seed = SeedConfig(
+        users=args.users,
+        stars=args.stars,
+        tasks_per_star=args.tasks_per_star,
+        history_per_star=args.history_per_star,
+        trials=args.trials,
+        skills=args.skills,
+    )
+    domains = [f"domain-{i}" for i in range(args.domains)]
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(unknown)}")
+
+    await _migrate()
+    cold_start = None
+    if args.cold_start_runs > 0:
+        cold_start = measure_cold_start(args.cold_start_runs)
+        cold_start["target_ms"] = args.cold_start_target_ms
+        cold_start["within_target"] = cold_start["ready_ms"] <= args.cold_start_target_ms
+
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        star_ids = await _seed(seed, domains)
+        seed_seconds = time.perf_counter() - started
+        _count_queries()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            samples = {name: Sample() for name in names}
+            weights = [SCENARIOS[name][1] for name in names]
+
+            async def run_phase(seconds: float, requests: int) -> float:
+                budget = [requests or -1]
+                deadline = time.perf_counter() + seconds
+                start = time.perf_counter()
+                await asyncio.gather(
+                    *(
+                        _worker(Context(client, star_ids, domains, random.Random(args.seed + i)), names, weights, samples, deadline, budget)
+                        for i in range(args.concurrency)
+                    ),
+                )
+                return time.perf_counter() - start
+
+            if args.warmup > 0:
+                await run_phase(args.warmup, 0)
+                samples = {name: Sample() for name in names}
+            elapsed = await run_phase(args.duration, args.requests)
+
+    total = Sample()
+    for sample in samples.values():
+        total.latencies += sample.latencies
+        total.queries += sample.queries
+        total.errors += sample.errors
+        total.rate_limited += sample.rate_limited
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "database": os.environ["DATABASE_URL"].split("://", 1)[0],
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 3),
+            "seed": {**seed.__dict__, "domains": args.domains},
+            "seed_seconds": round(seed_seconds, 3),
+        },
+        "cold_start": cold_start,
+        "scenarios": {name: _summarize(sample, elapsed) for name, sample in samples.items()},
+        "total": _summarize(total, elapsed),
+    }
+
+
+def compare(base: dict[str, Any], head: dict[str, Any], threshold: float) -> tuple[list[str], bool]:
+    """逐场景比较 p95（以及 p50/p99 与吞吐），返回报告行与是否存在超过阈值的回退。"""
+
+    lines = [f"{'scenario':<16}{'p50 Δ':>10}{'p95 Δ':>10}{'p99 Δ':>10}{'rps Δ':>10}{'queries':>12}"]
+    regressed = False
+    for name in sorted(set(base["scenarios"]) & set(head["scenarios"])):
+        old, new = base["scenarios"][name], head["scenarios"][name]
+        if not old.get("count") or not new.get("count"):
+            continue
+
+        def delta(key: str, old: dict[str, Any] = old, new: dict[str, Any] = new) -> float:
+            return (new[key] - old[key]) / old[key] if old[key] else 0.0
+
+        marker = ""
+        if delta("p95_ms") > threshold:
+            regressed = True
+            marker = "  REGRESSION"
+        lines.append(
+            f"{name:<16}{delta('p50_ms'):>+10.1%}{delta('p95_ms'):>+10.1%}{delta('p99_ms'):>+10.1%}"
+            f"{delta('throughput_rps'):>+10.1%}{old['queries_per_request']:>6.1f}->{new['queries_per_request']:<5.1f}{marker}",
+        )
+
+    old_start, new_start = base.get("cold_start"), head.get("cold_start")
+    if old_start and new_start:
+        change = (new_start["ready_ms"] - old_start["ready_ms"]) / old_start["ready_ms"]
+        marker = ""
+        if change > threshold:
+            regressed = True
+            marker = "  REGRESSION"
+        lines.append(f"{'cold_start':<16}ready {old_start['ready_ms']:.0f}ms -> {new_start['ready_ms']:.0f}ms ({change:+.1%}){marker}")
+    return lines, regressed
+
+
+async def _cold_start_report(args: argparse.Namespace) -> dict[str, Any]:
+    await _migrate()
+    report = measure_cold_start(args.runs)
+    report["target_ms"] = args.target_ms
+    report["within_target"] = report["ready_ms"] <= args.target_ms
+    report["imports"] = import_profile(args.top)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar API 离线压测")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="灌数据并压测，输出 JSON 报告")
+    run.add_argument("--database-url", help="默认使用临时目录下的 SQLite")
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--duration", type=float, default=10.0, help="压测时长（秒）")
+    run.add_argument("--requests", type=int, default=0, help="总请求数上限，0 表示只按时长")
+    run.add_argument("--warmup", type=float, default=2.0, help="预热时长（秒），预热期间的样本不计入报告")
+    run.add_argument("--scenarios", help=f"逗号分隔，可选：{','.join(SCENARIOS)}")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--users", type=int, default=SeedConfig.users)
+    run.add_argument("--stars", type=int, default=SeedConfig.stars)
+    run.add_argument("--domains", type=int, default=8)
+    run.add_argument("--tasks-per-star", type=int, default=SeedConfig.tasks_per_star)
+    run.add_argument("--history-per-star", type=int, default=SeedConfig.history_per_star)
+    run.add_argument("--trials", type=int, default=SeedConfig.trials)
+    run.add_argument("--skills", type=int, default=SeedConfig.skills)
+    run.add_argument("--cold-start-runs", type=int, default=3, help="冷启动测量次数，0 表示跳过")
+    run.add_argument("--cold-start-target-ms", type=float, default=1500.0, help="冷启动（导入 + 启动事件）目标")
+    run.add_argument("--out", help="报告输出路径，默认打印到标准输出")
+
+    cold = sub.add_parser("cold-start", help="测量冷启动并输出导入耗时排行")
+    cold.add_argument("--database-url", help="默认使用临时目录下的 SQLite")
+    cold.add_argument("--runs", type=int, default=5)
+    cold.add_argument("--target-ms", type=float, default=1500.0)
+    cold.add_argument("--top", type=int, default=20, help="导入耗时排行的条目数")
+
+    cmp = sub.add_parser("compare", help="比较两份报告")
+    cmp.add_argument("base")
+    cmp.add_argument("head")
+    cmp.add_argument("--threshold", type=float, default=0.10, help="p95 回退超过该比例时以非零码退出")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        lines, regressed = compare(
+            json.loads(Path(args.base).read_text()), json.loads(Path(args.head).read_text()), args.threshold
+        )
+        print("\n".join(lines))
+        raise SystemExit(1 if regressed else 0)
+
+    with tempfile.TemporaryDirectory(prefix="mystar-bench-") as workdir:
+        _prepare_env(args.database_url, Path(workdir))
+        if args.command == "cold-start":
+            report = asyncio.run(_cold_start_report(args))
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+            raise SystemExit(0 if report["within_target"] else 1)
+        report = asyncio.run(run_benchmark(args))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""训练产物发布：把产物目录按固定大小切成分片，以内容哈希寻址并行上传，最后写入清单。
+
+- 分片直接从磁盘按区间流式读取（先算 SHA-256，再上传同一区间），内存中只有读缓冲，与产物大小无关；
+- 分片落在 ``blobs/sha256/<前两位>/<哈希>``，不同版本之间相同的分片（如未改动的基座权重）只保存一份；
+- 清单 ``manifests/<star_id>/<version>.json`` 在全部分片就绪后才写入，读到清单即可保证产物完整；
+- 中断后重新发布同一目录即续传：已存在的分片直接跳过，未改动文件的分片哈希从本地日志
+  ``.artifact-journal.json`` 读取，不必重新计算；
+- ``LocalArtifactStore`` 以本地目录模拟桶，便于在没有 MinIO 的环境下调试。
+
+用法::
+
+    python artifacts.py publish ./out --star-id s1 --version v3
+    python artifacts.py fetch s3://model-artifacts/manifests/s1/v3.json ./restored
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Protocol
+from urllib.parse import urlparse
+from uuid import uuid4
+
+
+MINIO_ENDPOINT = os.getenv("MYSTAR_MINIO_ENDPOINT", "localhost:9000")
+MINIO_ACCESS_KEY = os.getenv("MYSTAR_MINIO_ACCESS_KEY", "mystar")
+MINIO_SECRET_KEY = os.getenv("MYSTAR_MINIO_SECRET_KEY", "mystarpass")
+MINIO_BUCKET = os.getenv("MYSTAR_MINIO_BUCKET", "model-artifacts")
+
+ARTIFACT_STORE = os.getenv("MYSTAR_ARTIFACT_STORE", "minio")  # minio / local
+ARTIFACT_LOCAL_ROOT = os.getenv("MYSTAR_ARTIFACT_LOCAL_ROOT", ".data/artifacts")
+SHARD_SIZE = int(os.getenv("MYSTAR_ARTIFACT_SHARD_BYTES", str(64 * 1024 * 1024)))
+PART_SIZE = int(os.getenv("MYSTAR_ARTIFACT_PART_BYTES", str(16 * 1024 * 1024)))  # 单个分片在 S3 上的 multipart 大小
+UPLOAD_CONCURRENCY = int(os.getenv("MYSTAR_ARTIFACT_UPLOAD_CONCURRENCY", "8"))
+
+READ_BLOCK_SIZE = 1024 * 1024
+JOURNAL_NAME = ".artifact-journal.json"
+
+
+def blob_key(sha256: str) -> str:
+    return f"blobs/sha256/{sha256[:2]}/{sha256}"
+
+
+def manifest_key(star_id: str, version: str) -> str:
+    return f"manifests/{star_id}/{version}.json"
+
+
+def parse_uri(uri: str) -> tuple[str, str]:
+    """``s3://bucket/key`` -> (bucket, key)。"""
+
+    parsed = urlparse(uri)
+    if parsed.scheme != "s3" or not parsed.netloc:
+        raise ValueError(f"not an object store uri: {uri}")
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+class FileSlice:
+    """文件中 ``[offset, offset + length)`` 区间的只读流，供上传时按需读取。"""
+
+    def __init__(self, path: Path, offset: int, length: int) -> None:
+        self._fh = path.open("rb")
+        self._fh.seek(offset)
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fh.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def __enter__(self) -> FileSlice:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def _iter_slice(path: Path, offset: int, length: int) -> Iterator[bytes]:
+    with FileSlice(path, offset, length) as source:
+        while block := source.read(READ_BLOCK_SIZE):
+            yield block
+
+
+def hash_slice(path: Path, offset: int, length: int) -> str:
+    hasher = hashlib.sha256()
+    for block in _iter_slice(path, offset, length):
+        hasher.update(block)
+    return hasher.hexdigest()
+
+
+class ArtifactStore(Protocol):
+    bucket: str
+
+    def has_blob(self, sha256: str) -> bool: ...
+
+    def put_blob(self, sha256: str, path: Path, offset: int, length: int) -> None:
+        """上传文件的一个区间作为分片；对象在上传完成前不可见。"""
+        ...
+
+    def get_blob(self, sha256: str) -> Iterator[bytes]: ...
+
+    def put_json(self, key: str, document: dict[str, Any]) -> None: ...
+
+    def get_json(self, key: str) -> dict[str, Any]: ...
+
+
+class LocalArtifactStore:
+    """本地文件系统版产物存储：``<root>/<bucket>/<key>``。"""
+
+    def __init__(self, root: str | Path, bucket: str = MINIO_BUCKET) -> None:
+        self.root = Path(root)
+        self.bucket = bucket
+
+    def _path(self, key: str) -> Path:
+        return self.root / self.bucket / key
+
+    def _write_atomic(self, key: str, blocks: Iterator[bytes]) -> None:
+        target = self._path(key)
+        staging = self.root / self.bucket / ".staging" / uuid4().hex
+        staging.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with staging.open("wb") as fh:
+                for block in blocks:
+                    fh.write(block)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging, target)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+
+    def has_blob(self, sha256: str) -> bool:
+        return self._path(blob_key(sha256)).exists()
+
+    def put_blob(self, sha256: str, path: Path, offset: int, length: int) -> None:
+        self._write_atomic(blob_key(sha256), _iter_slice(path, offset, length))
+
+    def get_blob(self, sha256: str) -> Iterator[bytes]:
+        with self._path(blob_key(sha256)).open("rb") as fh:
+            while block := fh.read(READ_BLOCK_SIZE):
+                yield block
+
+    def put_json(self, key: str, document: dict[str, Any]) -> None:
+        self._write_atomic(key, iter([json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8")]))
+
+    def get_json(self, key: str) -> dict[str, Any]:
+        return json.loads(self._path(key).read_text("utf-8"))
+
+
+class MinioArtifactStore:
+    """MinIO/S3 版产物存储：分片超过 ``part_size`` 时由 SDK 走 multipart 上传。"""
+
+    def __init__(self, bucket: str = MINIO_BUCKET, *, part_size: int = PART_SIZE) -> None:
+        from minio import Minio
+
+        self.client = Minio(MINIO_ENDPOINT, access_key=MINIO_ACCESS_KEY, secret_key=MINIO_SECRET_KEY, secure=False)
+        self.bucket = bucket
+        self.part_size = part_size
+        self._bucket_ready = False
+        self._bucket_lock = threading.Lock()
+
+    def _ensure_bucket(self) -> None:
+        # 每个 worker 进程只检查一次桶
+        with self._bucket_lock:
+            if self._bucket_ready:
+                return
+            if not self.client.bucket_exists(self.bucket):
+                self.client.make_bucket(self.bucket)
+            self._bucket_ready = True
+
+    def has_blob(self, sha256: str) -> bool:
+        from minio.error import S3Error
+
+        self._ensure_bucket()
+        try:
+            self.client.stat_object(self.bucket, blob_key(sha256))
+        except S3Error as exc:
+            if exc.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise
+        return True
+
+    def put_blob(self, sha256: str, path: Path, offset: int, length: int) -> None:
+        self._ensure_bucket()
+        with FileSlice(path, offset, length) as source:
+            self.client.put_object(self.bucket, blob_key(sha256), source, length, part_size=self.part_size)
+
+    def get_blob(self, sha256: str) -> Iterator[bytes]:
+        response = self.client.get_object(self.bucket, blob_key(sha256))
+        try:
+            yield from response.stream(READ_BLOCK_SIZE)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def put_json(self, key: str, document: dict[str, Any]) -> None:
+        self._ensure_bucket()
+        data = json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8")
+        self.client.put_object(self.bucket, key, io.BytesIO(data), len(data), content_type="application/json")
+
+    def get_json(self, key: str) -> dict[str, Any]:
+        response = self.client.get_object(self.bucket, key)
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+
+
+@lru_cache(maxsize=1)
+def get_artifact_store() -> ArtifactStore:
+    """每个 worker 进程复用同一个存储客户端（连接池与桶检查结果随之复用）。"""
+
+    if ARTIFACT_STORE == "local":
+        return LocalArtifactStore(ARTIFACT_LOCAL_ROOT)
+    return MinioArtifactStore()
+
+
+# ---- 发布 ----
+
+
+@dataclass
+class FileEntry:
+    path: str  # 相对产物目录，使用 / 分隔
+    size: int
+    shards: list[str] = field(default_factory=list)
+
+
+@dataclass
+class PublishResult:
+    uri: str
+    files: int
+    shards: int
+    uploaded: int  # 本次实际上传的分片数（其余已存在：跨版本去重或续传）
+    uploaded_bytes: int
+
+
+def _load_journal(root: Path) -> dict[str, Any]:
+    try:
+        return json.loads((root / JOURNAL_NAME).read_text("utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_journal(root: Path, journal: dict[str, Any], lock: threading.Lock) -> None:
+    with lock:
+        staging = root / f"{JOURNAL_NAME}.{uuid4().hex}"
+        staging.write_text(json.dumps(journal), "utf-8")
+        os.replace(staging, root / JOURNAL_NAME)
+
+
+def publish(
+    store: ArtifactStore,
+    artifact_dir: str | Path,
+    *,
+    star_id: str,
+    version: str,
+    shard_size: int = SHARD_SIZE,
+    concurrency: int = UPLOAD_CONCURRENCY,
+    metadata: dict[str, Any] | None = None,
+) -> PublishResult:
+    """并行上传产物目录中的全部分片并写入清单，返回清单 URI。可重复调用（续传）。"""
+
+    root = Path(artifact_dir)
+    files = sorted(p for p in root.rglob("*") if p.is_file() and not p.name.startswith(JOURNAL_NAME))
+    journal = _load_journal(root)
+    journal_lock = threading.Lock()
+
+    entries: list[FileEntry] = []
+    tasks: list[tuple[FileEntry, int, Path, int, int]] = []
+    for path in files:
+        stat = path.stat()
+        rel = path.relative_to(root).as_posix()
+        entry = FileEntry(path=rel, size=stat.st_size)
+        count = max(1, -(-stat.st_size // shard_size))
+        entry.shards = [""] * count
+        cached = journal.get(rel)
+        fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "shard_size": shard_size}
+        if cached and all(cached.get(name) == value for name, value in fingerprint.items()):
+            entry.shards = cached["shards"]  # 文件未改动，沿用上次算好的分片哈希
+        else:
+            journal[rel] = {**fingerprint, "shards": entry.shards}
+        entries.append(entry)
+        for index in range(count):
+            offset = index * shard_size
+            tasks.append((entry, index, path, offset, min(shard_size, stat.st_size - offset)))
+
+    counters = {"uploaded": 0, "bytes": 0}
+    counter_lock = threading.Lock()
+
+    def run(task: tuple[FileEntry, int, Path, int, int]) -> None:
+        entry, index, path, offset, length = task
+        digest = entry.shards[index]
+        if not digest:
+            digest = hash_slice(path, offset, length)
+            entry.shards[index] = digest  # 与日志中的列表是同一个对象
+            _save_journal(root, journal, journal_lock)
+        if store.has_blob(digest):
+            return
+        store.put_blob(digest, path, offset, length)
+        with counter_lock:
+            counters["uploaded"] += 1
+            counters["bytes"] += length
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="artifact-upload") as pool:
+        # list() 让任一分片的异常在这里抛出；已上传的分片保留，下次发布时跳过
+        list(pool.map(run, tasks))
+
+    key = manifest_key(star_id, version)
+    store.put_json(
+        key,
+        {
+            "star_id": star_id,
+            "version": version,
+            "shard_size": shard_size,
+            "created_at": datetime.utcnow().isoformat(),
+            "metadata": metadata or {},
+            "files": [asdict(entry) for entry in entries],
+        },
+    )
+    return PublishResult(
+        uri=f"s3://{store.bucket}/{key}",
+        files=len(entries),
+        shards=len(tasks),
+        uploaded=counters["uploaded"],
+        uploaded_bytes=counters["bytes"],
+    )
+
+
+def fetch(store: ArtifactStore, manifest_uri: str, dest: str | Path, *, concurrency: int = UPLOAD_CONCURRENCY) -> int:
+    """按清单并行下载分片并还原产物目录（逐片校验哈希），返回文件数。"""
+
+    _, key = parse_uri(manifest_uri)
+    manifest = store.get_json(key)
+    shard_size = manifest["shard_size"]
+    root = Path(dest)
+
+    def restore(entry: dict[str, Any]) -> None:
+        target = root / entry["path"]
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("wb") as fh:
+            fh.truncate(entry["size"])
+
+    def download(task: tuple[Path, int, str]) -> None:
+        target, offset, digest = task
+        hasher = hashlib.sha256()
+        with target.open("r+b") as fh:
+            fh.seek(offset)
+            for block in store.get_blob(digest):
+                hasher.update(block)
+                fh.write(block)
+        if hasher.hexdigest() != digest:
+            raise ValueError(f"shard {digest} of {target} is corrupted")
+
+    tasks = []
+    for entry in manifest["files"]:
+        restore(entry)
+        tasks += [(root / entry["path"], i * shard_size, digest) for i, digest in enumerate(entry["shards"])]
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="artifact-download") as pool:
+        list(pool.map(download, tasks))
+    return len(manifest["files"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar training artifacts")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pub = sub.add_parser("publish", help="上传产物目录并写入清单（可重复执行以续传）")
+    pub.add_argument("artifact_dir")
+    pub.add_argument("--star-id", required=True)
+    pub.add_argument("--version", required=True)
+
+    get = sub.add_parser("fetch", help="按清单下载并还原产物目录")
+    get.add_argument("manifest_uri")
+    get.add_argument("dest")
+
+    args = parser.parse_args()
+    store = get_artifact_store()
+    if args.command == "publish":
+        result = publish(store, args.artifact_dir, star_id=args.star_id, version=args.version)
+        print(f"[artifacts] {result.uri}: {result.files} file(s), {result.shards} shard(s), "
+              f"uploaded {result.uploaded} ({result.uploaded_bytes} bytes)")
+    else:
+        print(f"[artifacts] restored {fetch(store, args.manifest_uri, args.dest)} file(s) to {args.dest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,55 @@
 """简化版训练闭环骨架：Redis Stream -> Ray Serve -> MinIO.
 
 本脚本不直接做大规模训练，而是演示：
-1. 向 Redis Stream 推送训练任务；
-2. 在 Ray 端消费并“伪训练”；
-3. 将结果元数据写入 MinIO（可与 star_model_versions 中的 artifact_uri 对应）。
+1. 向 Redis Stream 推送训练任务（``--data-dir`` 指向 ``apps/api/src/training_export.py`` 导出的训练数据）；
+2. 常驻 worker 以消费者组（XREADGROUP）读取任务，按批分发到 Ray，内存映射训练数据分片后“伪训练”；
+3. 将产物以内容寻址分片并行上传到 MinIO（见 ``artifacts.py``），清单 URI 对应 star_model_versions 中的
+   artifact_uri，上传完成后再 XACK。
+
+多个 worker 进程/节点使用同一个消费者组即可分担同一条 Stream；
+某个 worker 崩溃后，它未确认的任务在空闲超过 ``MYSTAR_TRAIN_CLAIM_IDLE_MS`` 后会被其他 worker 认领重试；
+存活的 worker 每隔 ``MYSTAR_TRAIN_HEARTBEAT_MS`` 对执行中的任务发送 ``XCLAIM ... JUSTID`` 重置空闲时间，
+长任务不会被误认领、重复执行。
+
+用法::
+
+    python star_trainer.py enqueue --job-id j1 --star-id s1 --data-dir .data/training/s1/<window>
+    python star_trainer.py worker --consumer trainer-1
+    python star_trainer.py dev            # 本地一次性跑通：入队 + 消费到队列清空
 """
 
 from __future__ import annotations
 
+import argparse
 import json
 import os
-from dataclasses import asdict, dataclass
+import socket
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
-from typing import Any
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Protocol
 
-import ray
 import redis
-from minio import Minio
 
+from artifacts import get_artifact_store, publish
 
-REDIS_URL = os.getenv("MYSTAR_REDIS_URL", "redis://localhost:6379/0")
-MINIO_ENDPOINT = os.getenv("MYSTAR_MINIO_ENDPOINT", "localhost:9000")
-MINIO_ACCESS_KEY = os.getenv("MYSTAR_MINIO_ACCESS_KEY", "mystar")
-MINIO_SECRET_KEY = os.getenv("MYSTAR_MINIO_SECRET_KEY", "mystarpass")
-MINIO_BUCKET = os.getenv("MYSTAR_MINIO_BUCKET", "model-artifacts")
+if TYPE_CHECKING:
+    import pyarrow as pa
 
+
+REDIS_URL = os.getenv("MYSTAR_REDIS_URL", "redis://localhost:6379/0")
 STREAM_KEY = os.getenv("MYSTAR_TRAIN_STREAM", "mystar:trainer:jobs")
+DEAD_LETTER_KEY = os.getenv("MYSTAR_TRAIN_DEAD_LETTER", "mystar:trainer:jobs:dead")
+GROUP_NAME = os.getenv("MYSTAR_TRAIN_GROUP", "trainers")
+MAX_IN_FLIGHT = int(os.getenv("MYSTAR_TRAIN_MAX_IN_FLIGHT", "4"))
+DISPATCH_BATCH = int(os.getenv("MYSTAR_TRAIN_DISPATCH_BATCH", "8"))
+CLAIM_IDLE_MS = int(os.getenv("MYSTAR_TRAIN_CLAIM_IDLE_MS", "600000"))
+HEARTBEAT_MS = int(os.getenv("MYSTAR_TRAIN_HEARTBEAT_MS", str(CLAIM_IDLE_MS // 4)))
+MAX_DELIVERIES = int(os.getenv("MYSTAR_TRAIN_MAX_DELIVERIES", "5"))
 
 
 @dataclass
@@ -33,59 +57,333 @@ class TrainJob:
     job_id: str
     star_id: str
     method: str = "qlora"
-    created_at: str = datetime.utcnow().isoformat()
+    data_dir: str | None = None  # 训练数据导出目录（含 manifest.json），需在 worker 上可见
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
 
 
-def enqueue_job(job: TrainJob) -> None:
-    client = redis.Redis.from_url(REDIS_URL)
+def enqueue_job(job: TrainJob, client: redis.Redis | None = None) -> None:
+    client = client or redis.Redis.from_url(REDIS_URL)
     client.xadd(STREAM_KEY, {"payload": json.dumps(asdict(job))})
     print(f"[trainer] enqueued job={job.job_id} star={job.star_id}")
 
 
-def get_minio_client() -> Minio:
-    return Minio(
-        MINIO_ENDPOINT,
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=False,
+@dataclass
+class TrainingData:
+    manifest: dict[str, Any]
+    messages: pa.Table
+    feedback: pa.Table
+
+
+def _map_shards(data_dir: Path, shards: list[dict[str, Any]]) -> pa.Table:
+    import pyarrow as pa
+
+    # 分片为未压缩的 Arrow IPC 文件：表的各列直接引用映射的页，不拷贝、不反序列化，按需由内核换入
+    return pa.concat_tables(
+        pa.ipc.open_file(pa.memory_map(str(data_dir / shard["file"]), "r")).read_all() for shard in shards
     )
 
 
-@ray.remote
-def train_worker(job_payload: dict[str, Any]) -> str:
-    """Ray 任务：这里仅模拟训练与上传模型文件。"""
+def load_training_data(data_dir: str | Path) -> TrainingData:
+    """按清单内存映射训练数据分片；清单不存在说明导出未完成。"""
 
-    job = TrainJob(**job_payload)
-    artifact_name = f"{job.star_id}_{job.job_id}.txt"
-    content = f"fake-weights for star={job.star_id} job={job.job_id} method={job.method}"
-
-    client = get_minio_client()
-    if not client.bucket_exists(MINIO_BUCKET):
-        client.make_bucket(MINIO_BUCKET)
-    client.put_object(
-        MINIO_BUCKET,
-        artifact_name,
-        data=content.encode("utf-8"),
-        length=len(content.encode("utf-8")),
+    data_dir = Path(data_dir)
+    manifest = json.loads((data_dir / "manifest.json").read_text("utf-8"))
+    return TrainingData(
+        manifest=manifest,
+        messages=_map_shards(data_dir, manifest["messages"]),
+        feedback=_map_shards(data_dir, manifest["feedback"]),
+    )
+
+
+def write_fake_artifact(job: TrainJob, out_dir: Path, data: TrainingData | None = None) -> None:
+    """伪训练：写出与真实 LoRA 产物结构相同的文件（基座配置不随任务变化，可跨版本去重）。"""
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "adapter_config.json").write_text(json.dumps({"method": job.method, "r": 16, "alpha": 32}), "utf-8")
+    seen = f" messages={data.messages.num_rows} feedback={data.feedback.num_rows}" if data else ""
+    (out_dir / "adapter_model.bin").write_text(
+        f"fake-weights for star={job.star_id} job={job.job_id} method={job.method}{seen}",
+        "utf-8",
     )
-    uri = f"s3://{MINIO_BUCKET}/{artifact_name}"
-    print(f"[trainer] uploaded artifact -> {uri}")
-    return uri
+
+
+def train_job(job_payload: dict[str, Any]) -> str:
+    """训练任务本体：这里仅模拟训练，产物以分片并行上传，返回清单 URI。"""
+
+    job = TrainJob(**job_payload)
+    data = load_training_data(job.data_dir) if job.data_dir else None
+    metadata: dict[str, Any] = asdict(job)
+    if data is not None:
+        # 训练数据窗口随产物清单保存，登记模型版本时写入 star_model_versions.training_data_span
+        metadata.update(
+            data_start=data.manifest["data_start"],
+            data_end=data.manifest["data_end"],
+            message_rows=data.messages.num_rows,
+            feedback_rows=data.feedback.num_rows,
+        )
+    with tempfile.TemporaryDirectory(prefix=f"mystar-{job.job_id}-") as out_dir:
+        write_fake_artifact(job, Path(out_dir), data)
+        result = publish(get_artifact_store(), out_dir, star_id=job.star_id, version=job.job_id, metadata=metadata)
+    print(f"[trainer] published artifact -> {result.uri} ({result.uploaded}/{result.shards} shard(s) uploaded)")
+    return result.uri
+
+
+class Dispatcher(Protocol):
+    """训练任务执行后端：批量提交，轮询完成情况。"""
+
+    def submit(self, payloads: list[dict[str, Any]]) -> list[Any]: ...
+
+    def poll(self, handles: list[Any], timeout: float) -> list[tuple[Any, str | BaseException]]:
+        """返回在 ``timeout`` 秒内完成的 (handle, 结果或异常) 列表。"""
+        ...
+
+
+class RayDispatcher:
+    """Ray 后端：一批任务一次性提交为 remote 调用，用 ``ray.wait`` 收集已完成的结果。"""
+
+    def __init__(self) -> None:
+        import ray
+
+        ray.init(ignore_reinit_error=True)
+        self._ray = ray
+        self._remote = ray.remote(train_job)
+
+    def submit(self, payloads: list[dict[str, Any]]) -> list[Any]:
+        return [self._remote.remote(payload) for payload in payloads]
+
+    def poll(self, handles: list[Any], timeout: float) -> list[tuple[Any, str | BaseException]]:
+        ready, _ = self._ray.wait(handles, num_returns=len(handles), timeout=timeout)
+        results: list[tuple[Any, str | BaseException]] = []
+        for ref in ready:
+            try:
+                results.append((ref, self._ray.get(ref)))
+            except Exception as exc:  # 失败任务交给 worker 决定是否重试
+                results.append((ref, exc))
+        return results
+
+
+class LocalDispatcher:
+    """本地线程池后端：不依赖 Ray，便于单机调试或配合 fakeredis 测试。"""
+
+    def __init__(self, fn: Callable[[dict[str, Any]], str] = train_job, max_workers: int = MAX_IN_FLIGHT) -> None:
+        self._fn = fn
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trainer")
+
+    def submit(self, payloads: list[dict[str, Any]]) -> list[Future[str]]:
+        return [self._pool.submit(self._fn, payload) for payload in payloads]
+
+    def poll(self, handles: list[Future[str]], timeout: float) -> list[tuple[Any, str | BaseException]]:
+        done, _ = wait(handles, timeout=timeout, return_when=FIRST_COMPLETED)
+        return [(f, f.exception() or f.result()) for f in done]
+
+
+def _decode(value: Any) -> Any:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _field(fields: dict[Any, Any], name: str) -> Any:
+    return _decode(fields.get(name, fields.get(name.encode())))
+
+
+class StreamWorker:
+    """消费者组 worker：认领超时未确认的任务 + 读取新任务 -> 按批分发 -> 完成后 XACK。
+
+    - 同时在执行的任务数不超过 ``max_in_flight``；
+    - 任务失败不确认，空闲超过 ``claim_idle_ms`` 后由任意 worker 重新认领；
+    - 执行中的任务每隔 ``heartbeat_ms``（须明显小于 ``claim_idle_ms``）续期一次，不会被认领；
+    - 投递次数超过 ``max_deliveries`` 或载荷无法解析的任务转入死信 Stream 并确认。
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        dispatcher: Dispatcher,
+        *,
+        consumer: str,
+        group: str = GROUP_NAME,
+        stream: str = STREAM_KEY,
+        dead_letter: str = DEAD_LETTER_KEY,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        batch_size: int = DISPATCH_BATCH,
+        claim_idle_ms: int = CLAIM_IDLE_MS,
+        heartbeat_ms: int | None = None,
+        max_deliveries: int = MAX_DELIVERIES,
+    ) -> None:
+        self.client = client
+        self.dispatcher = dispatcher
+        self.consumer = consumer
+        self.group = group
+        self.stream = stream
+        self.dead_letter = dead_letter
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.claim_idle_ms = claim_idle_ms
+        self.heartbeat_ms = heartbeat_ms if heartbeat_ms is not None else min(HEARTBEAT_MS, claim_idle_ms // 4)
+        self.max_deliveries = max_deliveries
+        self._claim_cursor = "0-0"
+        self._in_flight: dict[Any, Any] = {}  # handle -> stream entry id
+        self._last_heartbeat = 0.0
+
+    def ensure_group(self) -> None:
+        try:
+            self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    def _dead_letter(self, entry_id: Any, fields: dict[Any, Any], reason: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.xadd(self.dead_letter, {"payload": _field(fields, "payload") or "", "reason": reason})
+        pipe.xack(self.stream, self.group, entry_id)
+        pipe.execute()
+        print(f"[trainer] dead-lettered entry={entry_id}: {reason}")
+
+    def _claim_stale(self, limit: int) -> list[tuple[Any, dict[Any, Any]]]:
+        cursor, entries, *_ = self.client.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=self.claim_idle_ms,
+            start_id=self._claim_cursor,
+            count=limit,
+        )
+        self._claim_cursor = cursor
+        running = {_decode(entry_id) for entry_id in self._in_flight.values()}
+        claimed = []
+        for entry_id, fields in entries:
+            if _decode(entry_id) in running:  # 本 worker 仍在执行（续期晚于空闲阈值），不重复分发
+                continue
+            if fields is None:  # 条目已被 XTRIM/XDEL 删除
+                self.client.xack(self.stream, self.group, entry_id)
+                continue
+            pending = self.client.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+            if pending and pending[0]["times_delivered"] > self.max_deliveries:
+                self._dead_letter(entry_id, fields, f"exceeded {self.max_deliveries} deliveries")
+                continue
+            claimed.append((entry_id, fields))
+        return claimed
+
+    def _heartbeat(self) -> None:
+        """对执行中的任务发送 ``XCLAIM ... JUSTID``：只重置空闲时间，不增加投递次数。"""
+
+        now = time.monotonic()
+        if not self._in_flight or (now - self._last_heartbeat) * 1000 < self.heartbeat_ms:
+            return
+        self._last_heartbeat = now
+        self.client.xclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=0,
+            message_ids=list(self._in_flight.values()),
+            justid=True,
+        )
+
+    def _read_new(self, limit: int, block_ms: int | None) -> list[tuple[Any, dict[Any, Any]]]:
+        response = self.client.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=limit, block=block_ms)
+        return [entry for _, entries in response or [] for entry in entries]
+
+    def _dispatch(self, entries: list[tuple[Any, dict[Any, Any]]]) -> None:
+        payloads, entry_ids = [], []
+        for entry_id, fields in entries:
+            try:
+                payload = json.loads(_field(fields, "payload"))
+                TrainJob(**payload)
+            except (TypeError, ValueError) as exc:
+                self._dead_letter(entry_id, fields, f"invalid payload: {exc}")
+                continue
+            payloads.append(payload)
+            entry_ids.append(entry_id)
+        if payloads:
+            for handle, entry_id in zip(self.dispatcher.submit(payloads), entry_ids):
+                self._in_flight[handle] = entry_id
+            print(f"[trainer] dispatched {len(payloads)} job(s), in-flight={len(self._in_flight)}")
+
+    def _collect(self, timeout: float) -> int:
+        if not self._in_flight:
+            return 0
+        finished = self.dispatcher.poll(list(self._in_flight), timeout)
+        acked = []
+        for handle, result in finished:
+            entry_id = self._in_flight.pop(handle)
+            if isinstance(result, BaseException):
+                print(f"[trainer] entry={entry_id} failed, will be retried: {result!r}")
+                continue
+            acked.append(entry_id)
+            print(f"[trainer] entry={entry_id} completed, artifact_uri={result}")
+        if acked:
+            self.client.xack(self.stream, self.group, *acked)
+        return len(finished)
+
+    def run_once(self, block_ms: int = 5000, poll_timeout: float = 1.0) -> int:
+        """执行一轮：补充任务到 in-flight 上限，再收集已完成的任务。返回本轮新分发的任务数。"""
+
+        self._heartbeat()
+        free = self.max_in_flight - len(self._in_flight)
+        dispatched = 0
+        if free > 0:
+            limit = min(free, self.batch_size)
+            entries = self._claim_stale(limit)
+            if len(entries) < limit:
+                # 仍有任务在执行时不阻塞读取，以便及时确认已完成的任务。
+                entries += self._read_new(limit - len(entries), None if self._in_flight else block_ms)
+            self._dispatch(entries)
+            dispatched = len(entries)
+        self._collect(poll_timeout)
+        return dispatched
+
+    def run_forever(self, block_ms: int = 5000) -> None:
+        self.ensure_group()
+        print(f"[trainer] worker {self.consumer} consuming {self.stream} as group={self.group}")
+        while True:
+            self.run_once(block_ms=block_ms)
+
+    def drain(self, poll_timeout: float = 1.0) -> None:
+        """处理到 Stream 中没有新任务、且所有 in-flight 任务结束为止（本地调试用）。"""
+
+        self.ensure_group()
+        while self.run_once(block_ms=100, poll_timeout=poll_timeout) or self._in_flight:
+            time.sleep(0)
 
 
 def run(job_id: str, star_id: str) -> None:
     """本地快速测试训练闭环."""
 
-    ray.init(ignore_reinit_error=True)
-
+    client = redis.Redis.from_url(REDIS_URL)
     job = TrainJob(job_id=job_id, star_id=star_id)
-    enqueue_job(job)
+    worker = StreamWorker(client, RayDispatcher(), consumer=f"dev-{os.getpid()}")
+    worker.ensure_group()
+    enqueue_job(job, client)
+    worker.drain()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MyriadStar trainer")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="推送一个训练任务到 Stream")
+    enqueue.add_argument("--job-id", required=True)
+    enqueue.add_argument("--star-id", required=True)
+    enqueue.add_argument("--method", default="qlora")
+    enqueue.add_argument("--data-dir", help="training_export.py 导出的训练数据目录")
+
+    worker = sub.add_parser("worker", help="以消费者组方式常驻消费训练任务")
+    worker.add_argument("--consumer", default=f"{socket.gethostname()}-{os.getpid()}")
+    worker.add_argument("--local", action="store_true", help="使用本地线程池代替 Ray")
+
+    dev = sub.add_parser("dev", help="本地一次性跑通：入队 + 消费到队列清空")
+    dev.add_argument("--job-id", default="dev-job")
+    dev.add_argument("--star-id", default="dev-star")
 
-    # 直接在本进程内分发到 Ray，真实环境中可由独立 worker 订阅 Redis Stream。
-    future = train_worker.remote(asdict(job))
-    uri = ray.get(future)
-    print(f"[trainer] job={job_id} completed, artifact_uri={uri}")
+    args = parser.parse_args()
+    if args.command == "enqueue":
+        enqueue_job(TrainJob(job_id=args.job_id, star_id=args.star_id, method=args.method, data_dir=args.data_dir))
+    elif args.command == "worker":
+        dispatcher: Dispatcher = LocalDispatcher() if args.local else RayDispatcher()
+        StreamWorker(redis.Redis.from_url(REDIS_URL), dispatcher, consumer=args.consumer).run_forever()
+    else:
+        run(args.job_id, args.star_id)
 
 
 if __name__ == "__main__":
-    run("dev-job", "dev-star")
+    main()